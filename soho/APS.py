@@ -1,6 +1,7 @@
 import sys, os
-
+import logging
 import time
+import functools
 import soho
 import sohog
 import hou
@@ -11,6 +12,9 @@ from datetime import datetime
 # IFDhooks.call("pre_ifdGen")
 clockstart = time.time()
 
+# Libraries only log, exporter reports messages on stderr (stdout holds the project).
+logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
+
 
 controlParameters = {
     # The time at which the scene is being rendered
@@ -174,11 +178,32 @@ import APSmisc
 import APSobj
 import APSsettings
 
-reload(APSframe)
-reload(APSmisc)
-reload(haps)
-reload(APSobj)
-reload(APSsettings)
+# Modules are reloaded on every render only while developing them
+if os.getenv('APS_DEVELOP'):
+    reload(APSframe)
+    reload(APSmisc)
+    reload(haps)
+    reload(APSobj)
+    reload(APSsettings)
+
+# Settings of a previous render in this session are dropped first
+haps.reset()
+# Significant digits of floats in the project (17 = full double precision)
+haps.set_precision(soho.getDefaultedInt('aps_precision', [12])[0])
+# Processes writing assemblies in parallel (0 = cpu count)
+export_processes = soho.getDefaultedInt('aps_exportprocesses', [1])[0] or None
+# Parameters equal to appleseed defaults are left out of the project
+sparse = soho.getDefaultedInt('aps_sparse', [0])[0]
+haps.set_sparse(sparse)
+
+# Project written to .appleseedz file is packed together with meshes and
+# textures into a single archive streamed to stdout (see haps.PackedProject)
+packed = None
+if mode == 'default' and soho.getDefaultedString('soho_diskfile', [''])[0].endswith('.appleseedz'):
+    packed     = haps.PackedProject(sys.stdout, soho.getDefaultedInt('aps_packlevel', [6])[0])
+    mesh_level = soho.getDefaultedInt('aps_packmeshlevel', [packed.level])[0]
+    # Archive owns stdout, anything else printed would corrupt it.
+    sys.stdout = sys.stderr
 
 motion_blur_params = APSmisc.initializeMotionBlur(cam, now)
 FPS = soho.getDefaultedFloat('state:fps', [24])[0]
@@ -245,10 +270,10 @@ aps.Config().insert('FinalConfiguration', 'final')
 aps.Config().insert('InteractiveConfiguration', 'interactive')
 
 final_config = aps.config.get_by_name('final')
-APSobj.update_parameters(final_config, **Rendering)
-APSobj.update_parameters(final_config, **Sampling)
-APSobj.update_parameters(final_config, **PathTracing)
-APSobj.update_parameters(final_config, **SPPM)
+APSobj.FINAL_CONFIGURATION.update(final_config, **Rendering)
+APSobj.FINAL_CONFIGURATION.update(final_config, **Sampling)
+APSobj.FINAL_CONFIGURATION.update(final_config, **PathTracing)
+APSobj.FINAL_CONFIGURATION.update(final_config, **SPPM)
 # print final_config
 
 
@@ -288,6 +313,8 @@ allowed_dof   = soho.getDefaultedInt( 'aps_dof', [''] )[0]
 if allowed_dof:
     camera = APSobj.ThinLensCamera(cam.getName(), **camera_parms)
 else:
+    # Pinhole camera has no depth of field
+    del camera_parms['focal_distance'], camera_parms['f_stop']
     camera = APSobj.PinholeCamera(cam.getName(), **camera_parms)
 
 port   = str(soho.getDefaultedInt('vm_image_mplay_socketport', [0])[0])
@@ -307,6 +334,8 @@ quit()
 unique_gdp_collection = [] # here we store unique instanceas (not fast instances)
 materials_map = {}
 instance_referenced_gdps = []
+# Instances of exported assemblies, inserted into the scene at once
+assembly_instances = []
 
 
 
@@ -342,6 +371,10 @@ for obj in soho.objectList('objlist:instance'):
     if (None, None) == (filename, shop_materials):
         continue
 
+    # Meshes go into the archive as they are saved
+    if packed and filename and unique_gdp:
+        packed.add_file(filename, level=mesh_level)
+
     # MB for objects
     xforms, times  = APSmisc.get_motionblur_xforms(obj, now, motion_blur_params)
     # This assembly holds single object which won't be saved again. 
@@ -350,9 +383,23 @@ for obj in soho.objectList('objlist:instance'):
         kwargs = [{'materials': shop_materials, 
                     'slots':    shop_materials, }]
 
+        # Default material (again we should not need so many og them) and
+        # materials of the object. Assemblies are created when written
+        # (see APSobj.DeferredAssemblyObject()), possibly in worker processes,
+        # so materials read from soho are made now, only the default one later.
+        materials = [functools.partial(APSobj.DefaultLambertMaterial, 
+            APSmisc.DEFAULT_MATERIAL_NAME)]
+        for shop in shop_materials:
+            if shop and shop not in assembly_materials:
+                material = APSframe.outputMaterial(shop, now)
+                if material is None:
+                    continue
+                materials.append(material)
+                assembly_materials += [shop]
+
         # This object container.  
-        aps.Scene().insert('AssemblyObject', obj.getName(), filenames=[filename,], 
-            list_of_kwargs=kwargs, xforms=xforms, times=times)
+        aps.Scene().insert('DeferredAssemblyObject', obj.getName(), filenames=[filename,], 
+            list_of_kwargs=kwargs, materials=materials, xforms=xforms, times=times)
 
         # If we are unique but def_instant_path is not empty
         # we have to export  source (instanced) geometry. Otherwise instances 
@@ -361,24 +408,10 @@ for obj in soho.objectList('objlist:instance'):
             ghost_object_name = def_inst_path[0]
             visibility_flags = {'visibility/camera':'false', 'visibility/shadow': 'false', 
                                 'visibility/probe': 'false'}
-            aps.Scene().insert('AssemblyObject', ghost_object_name, filenames=[filename,],
-                list_of_kwargs=kwargs, **visibility_flags)
-            #Not sure if we need it 
-            aps.Assembly(ghost_object_name).emplace(
-                APSobj.DefaultLambertMaterial(APSmisc.DEFAULT_MATERIAL_NAME))
-            for shop in shop_materials:
-                aps.Assembly(ghost_object_name).emplace(APSframe.outputMaterial(shop, now))
-
-        #Add default material (again we should not need so many og them)
-        aps.Assembly(obj.getName()).emplace(
-            APSobj.DefaultLambertMaterial(APSmisc.DEFAULT_MATERIAL_NAME))
-        #Add materials
-        for shop in shop_materials:
-            if shop and shop not in assembly_materials:
-                mat = APSframe.outputMaterial(shop, now)
-                if mat:
-                    aps.Assembly(obj.getName()).emplace(mat)
-                    assembly_materials += [shop]
+            #Not sure if we need materials here
+            aps.Scene().insert('DeferredAssemblyObject', ghost_object_name, 
+                filenames=[filename,], list_of_kwargs=kwargs, materials=materials,
+                **visibility_flags)
            
     else:
         # This is an instance of the assembly object already exported.
@@ -386,14 +419,18 @@ for obj in soho.objectList('objlist:instance'):
         ass_name = def_inst_path[0]
         ass_inst = haps.Assembly_Instance(obj.getName()+"_inst", assembly=ass_name)
         ass_inst = APSobj.TransformBlur(ass_inst, xforms, times)
-        aps.Scene().emplace(ass_inst)
-       
+        assembly_instances.append(ass_inst)
+
+aps.Scene().emplace_all(assembly_instances)
+
 
 ###### Basic lights ######################################
+lights = []
 for light in soho.objectList('objlist:light'):
     apslight = APSframe.outputLight(light, now, motion_blur_params)
     if apslight:
-        aps.Assembly().emplace(apslight)
+        lights.append(apslight)
+aps.Assembly().emplace_all(lights)
     
 
 ############ - Frame - basics - ##################################
@@ -431,19 +468,28 @@ if mode == "update":
     xform = []
     cam.evalFloat("space:world", now, xform)
     xform = hou.Matrix4(xform).transposed().asTuple()
-    xform = " ".join(map(str,xform))
+    xform = haps.format_numbers(xform)
     print xform
 else:
     # first line if stdin is (socket, mode) where 0=default, 1=ipr
     # I would love to have custom tag in appleseed.
     if mode != 'default':
         # this is special case for pipeing
-        print aps.project.tostring(pretty_print=False)
+        aps.project.toxml(sys.stdout, pretty_print=False)
+        sys.stdout.write('\n')
+    # Single archive with project and files it references
+    elif packed:
+        packed.write_project(aps.project, preamble=preambule, processes=export_processes)
+        packed.close()
+        sys.stdout = packed.fileio
     # Rest is standard xml
     else:
         print preambule
-        print str(aps.project)
+        sys.stdout.flush()
+        aps.project.toxml(sys.stdout, processes=export_processes)
         print stat
+        if sparse:
+            print '<!-- Sparse: %i default parameters (%i bytes) left out -->' % haps.sparse_report()
 
 
 
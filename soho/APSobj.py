@@ -1,11 +1,14 @@
 import collections
 import types
-import inspect 
+import sys
+import logging
 import haps
 
+logger = logging.getLogger(__name__)
+
 def Factory(typename,  name, parms=(), **kwargs):
     # This is depracated.
-    object_ = getattr(inspect.getmodule(haps), typename)(name, **kwargs)
+    object_ = getattr(haps, typename)(name, **kwargs)
     assert isinstance(parms, collections.Iterable)
     for parm in parms:
         k, v = parm
@@ -13,6 +16,49 @@ def Factory(typename,  name, parms=(), **kwargs):
     return object_
 
 
+# Factories of entities by type name (see register_type()) with flags
+# telling factories returning single objects. Filled with factories of
+# this module and haps classes at the end of the module.
+TYPES = {}
+
+
+def _as_list(objects):
+    """Return object(s) made by a factory as a list."""
+    if type(objects) is list:
+        return objects
+    if isinstance(objects, tuple):
+        return list(objects)
+    return [objects]
+
+
+def register_type(typename, factory, single=False):
+    """Make entities of type 'typename' creatable with TypeFactory.insert()
+       and create(), replacing previous factory of the type.
+
+    :parm typename: Name of the type
+    :parm factory:  Callable taking name and kwargs of an entity
+    :parm single:   Factory returns a single object (like haps classes), 
+                    otherwise an object, a list or a tuple of objects
+    :returns:       factory
+    """
+    TYPES[typename] = (factory, single)
+    return factory
+
+
+def _resolve_type(typename):
+    """Register factory of a type which isn't in registry yet: attribute 
+       of this module or haps added after import.
+    """
+    current_module = sys.modules[__name__]
+    if hasattr(current_module, typename):
+        register_type(typename, getattr(current_module, typename))
+    elif hasattr(haps, typename):
+        register_type(typename, getattr(haps, typename), single=True)
+    else:
+        raise Exception("Can't create an object of unknow type: %s" % typename)
+    return TYPES[typename]
+
+
 class Appleseed(object):
     """ 
         :example: 
@@ -57,9 +103,10 @@ class Appleseed(object):
             self.emplace(objects)
 
         def emplace(self, objects, replace=True):
-            """Insert pre-created objects into parent."""
-            if not isinstance(objects, collections.Iterable):
-                objects = [objects]
+            """Insert pre-created objects into parent (see emplace_all()
+               for many of them)."""
+            if type(objects) is not list:
+                objects = _as_list(objects)
             if replace:
                 for obj in objects:
                     duplicate =self.parent.get_by_name(obj.get('name', False))
@@ -67,20 +114,59 @@ class Appleseed(object):
                         self.parent.remove(duplicate)
             self.parent.add(objects)
 
+        def emplace_all(self, objects, replace=True):
+            """Insert many pre-created objects into parent at once, as if
+               they were emplaced one by one: objects replace children of
+               parent and objects before them with the same names.
+
+            :parm objects: List of objects or of results of factories 
+                           (objects, lists or tuples of them), Nones are skipped
+            :parm replace: Replace objects with the same names (default True),
+                           False when names are known not to clash
+            :returns:      List of replaced objects
+            """
+            batch = []
+            for obj in objects:
+                if isinstance(obj, (list, tuple)):
+                    batch += obj
+                elif obj is not None:
+                    batch.append(obj)
+            replaced = []
+            if replace:
+                # Position of last object of each name in the batch
+                last = dict([(obj.get('name', False), position) 
+                    for position, obj in enumerate(batch)])
+                last.pop(None, None)
+                if len(last) < len(batch):
+                    kept = []
+                    for position, obj in enumerate(batch):
+                        if last.get(obj.get('name', False), position) == position:
+                            kept.append(obj)
+                        else:
+                            replaced.append(obj)
+                    batch = kept
+                # Names are looked up in index of parent's children.
+                for name in (last if len(self.parent) else ()):
+                    duplicate = self.parent.get_by_name(name)
+                    if duplicate:
+                        self.parent.remove(duplicate)
+                        replaced.append(duplicate)
+            self.parent.extend(batch)
+            return replaced
+
         def create(self, typename, name, **kwargs):
             """ Creates object of type 'typename' defined either
-                inside this module or 'haps' module.
+                inside this module or 'haps' module (see register_type()).
+
+            :returns: List of created objects
             """
-            current_module = inspect.getmodule(self)
-            if hasattr(current_module, typename):
-                objects = getattr(current_module, typename)(name, **kwargs)
-                if isinstance(objects, tuple):
-                    objects = list(objects)
-            elif hasattr(haps, typename):
-                objects = [getattr(haps, typename)(name, **kwargs)]
-            else:
-                raise Exception("Can't create an object of unknow type: %s" % typename)
-            return objects
+            factory, single = TYPES.get(typename) or _resolve_type(typename)
+            objects = factory(name, **kwargs)
+            if single:
+                return [objects]
+            if type(objects) is list:
+                return objects
+            return list(objects) if isinstance(objects, tuple) else [objects]
 
     def __init__(self):
         """Creates bare minimum."""
@@ -149,7 +235,7 @@ def update_parameters_no_req(obj, **kwargs):
 
     :parm obj:      HapsObj to be updated
     :parm **kwargs: Python **kwargs arguments: name_of_parm=new_value
-    :returns:       Modified object
+    :returns:       Modified object (a copy if obj was shared)
     """
     for key, value in kwargs.items():
         parm = obj.get_by_name(key)
@@ -157,8 +243,9 @@ def update_parameters_no_req(obj, **kwargs):
             continue
         if isinstance(value, collections.Iterable) and \
         not  isinstance(value, types.StringTypes):
-            value = ' '.join(map(str, value))
-        parm.set('value', value)
+            value = haps.NumberList(value)
+        obj = obj.thaw()
+        obj.unshare(parm).set('value', value)
     return obj
 
 
@@ -173,6 +260,9 @@ def update_parameters(obj, **kwargs):
     (We could actually support it, but this quickly
         would become a mess.)
 
+    Shared parameters (see HapsObj.add_parms()) are copied before
+    being changed, obj itself is copied if it's shared.
+
     :parm obj:      HapsObj to be updated
 
     :parm **kwargs: Python **kwargs arguments: name_of_parm=new_value
@@ -197,38 +287,195 @@ def update_parameters(obj, **kwargs):
                 continue
             # send request deeper
             children_kwargs = {children: value}
-            update_parameters(parm, **children_kwargs)
+            updated = update_parameters(parm, **children_kwargs)
+            if updated is not parm:
+                obj = obj.thaw()
+                obj.replace(parm, updated)
         else:
             # else do as usual
             if isinstance(value, collections.Iterable) and \
             not  isinstance(value, types.StringTypes):
-                value = ' '.join(map(str, value))
-            parm.set('value', value)
+                value = haps.NumberList(value)
+            obj = obj.thaw()
+            obj.unshare(parm).set('value', value)
 
     return obj
-    
-            
+
+
+# Parameter schemas
+#
+# Entities with fixed parameters declare them once: name, kind and
+# default, or nested groups (haps.Parameters). Defaults are frozen into
+# a single block shared by all entities built from a schema, and values
+# given to a factory are checked against the schema before they are set
+# (see update_parameters()), so typos and wrong types don't pass silently.
+
+def _is_number(value):
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, long, float)):
+        return True
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(value, types.StringTypes)
+
+
+def _is_integer(value):
+    if isinstance(value, (int, long)) and not isinstance(value, bool):
+        return True
+    if isinstance(value, float):
+        return value.is_integer()
+    try:
+        int(value)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(value, types.StringTypes)
+
+
+def _is_numbers(value):
+    if isinstance(value, types.StringTypes):
+        return all(map(_is_number, value.split()))
+    return isinstance(value, collections.Iterable) and all(map(_is_number, value))
+
+
+# Kind of parameter -> test of its values
+KINDS = {
+    'bool':    lambda value: value in (True, False) or 
+        str(value).lower() in ('true', 'false'),
+    'int':     _is_integer,
+    'float':   _is_number,
+    'floats':  _is_numbers,
+    # Value, color or texture name, or an expression
+    'input':   lambda value: _is_number(value) or _is_numbers(value)
+        or isinstance(value, types.StringTypes),
+    'string':  lambda value: isinstance(value, types.StringTypes),
+    # Name of another entity
+    'name':    lambda value: value is None or isinstance(value, types.StringTypes),
+}
+
+Parm = collections.namedtuple('Parm', 'name kind default')
+
+
+class Schema(object):
+    """Declared parameters of an entity of haps class 'cls'.
+
+    :example:
+              LIGHT = Schema(haps.Light, [Parm('intensity', 'input', 1.0)],
+                  model='point_light')
+              light = LIGHT.build('light', intensity=2.0)
+    """
+    def __init__(self, cls, parms, options=(), **attributes):
+        """
+        :parm cls:        haps class of the entity (or haps.Parameters of a group)
+        :parm parms:      List of Parm tuples and Schemas of groups (their 
+                          'name' attribute is the group name)
+        :parm options:    Names of factory arguments which aren't parameters
+                          (like 'xforms'), accepted by check()
+        :parm attributes: Attributes of entities (like 'model')
+        """
+        self.cls        = cls
+        self.options    = frozenset(options)
+        self.attributes = attributes
+        self.parms      = collections.OrderedDict()
+        for parm in parms:
+            name = parm.attributes['name'] if isinstance(parm, Schema) else parm.name
+            self.parms[name] = parm
+        self._defaults  = None
+
+    def defaults(self):
+        """Return list of shared elements with default parameters."""
+        if self._defaults is None:
+            block = []
+            for name, parm in self.parms.iteritems():
+                if isinstance(parm, Schema):
+                    block.append(haps.freeze(parm.cls(name).extend(parm.defaults())))
+                else:
+                    block.append(haps.freeze(haps.Parameter(name, parm.default)))
+            self._defaults = block
+        return self._defaults
+
+    def find(self, key):
+        """Return Parm of a parameter key ('group/name' for nested ones)."""
+        schema, path = self, key.split('/')
+        for name in path[:-1]:
+            schema = schema.parms.get(name)
+            if not isinstance(schema, Schema):
+                return None
+        parm = schema.parms.get(path[-1])
+        return parm if isinstance(parm, Parm) else None
+
+    def check(self, kwargs, strict=False):
+        """Check values of parameters, skipping factory options.
+
+        :parm kwargs: Dictionary of parameter values by key
+        :parm strict: Raise on unknown keys instead of logging them
+        :returns:     Dictionary of known parameters
+        :raises:      Exception on values of wrong kind
+        """
+        known = {}
+        for key, value in kwargs.iteritems():
+            parm = self.find(key)
+            if parm is None:
+                if key in self.options:
+                    continue
+                message = 'Unknown parameter %s of %s %s' % (key, self.cls.tag,
+                    self.attributes.get('model', ''))
+                if strict:
+                    raise Exception(message)
+                logger.warning(message)
+                continue
+            # Empty values stand for unset ones (soho's default of many parms).
+            if value not in (None, '') and not KINDS[parm.kind](value):
+                raise Exception('Parameter %s of %s expects %s value, got %r' % (
+                    key, self.cls.tag, parm.kind, value))
+            known[key] = value
+        return known
+
+    def update(self, obj, strict=False, **kwargs):
+        """Check parameter values and set them (see update_parameters()).
+
+        :returns: Modified object
+        """
+        return update_parameters(obj, **self.check(kwargs, strict))
+
+    def build(self, name, strict=False, **kwargs):
+        """Create entity with default parameters updated with kwargs.
+
+        :parm name:   Name of the entity
+        :parm strict: Raise on unknown parameters
+        :returns:     New entity
+        """
+        entity = self.cls(name, **self.attributes).extend(self.defaults())
+        return self.update(entity, strict, **kwargs)
+
+
+# Factory arguments of entities with transformations
+_TRANSFORM = ('xforms', 'times')
+
+THIN_LENS_CAMERA = Schema(haps.Camera, [
+        Parm("autofocus_enabled", 'bool', "false"),
+        Parm("autofocus_target", 'floats', "0.5 0.5"),
+        Parm("diaphragm_blades", 'int', "6"),
+        Parm("diaphragm_map", 'name', ""),
+        Parm("diaphragm_tilt_angle", 'float', '0.0'),
+        Parm("f_stop", 'float', '8.0'),
+        Parm("film_dimensions", 'floats', "0.01024 0.00576"),
+        Parm("focal_distance", 'float', '1.0'),
+        Parm("horizontal_fov", 'float', "38.505"),
+        Parm("near_z", 'float', "-0.001"),
+        Parm("shift_x", 'float', "0.0"),
+        Parm("shift_y", 'float', "0.0"),
+        Parm("shutter_open_begin_time", 'float', '0.0'),
+        Parm("shutter_open_end_time", 'float', '0.0'),
+        Parm("shutter_close_begin_time", 'float', '0.0'),
+        Parm("shutter_close_end_time", 'float', '0.0'),
+        ], options=_TRANSFORM, model='thinlens_camera')
+
+
 def ThinLensCamera(name, **kwargs):
-    camera = haps.Camera(name=name, model='thinlens_camera')
-    camera.add_parms([
-        ("autofocus_enabled", "false"),
-        ("autofocus_target", "0.5 0.5"),
-        ("diaphragm_blades", "6"),
-        ("diaphragm_map", ""),
-        ("diaphragm_tilt_angle", '0.0'),
-        ("f_stop", '8.0'),
-        ("film_dimensions", "0.01024 0.00576"),
-        ("focal_distance", '1.0'),
-        ("horizontal_fov", "38.505"),
-        ("near_z", "-0.001"),
-        ("shift_x", "0.0"),
-        ("shift_y", "0.0"),
-        ("shutter_open_begin_time", '0.0'),
-        ("shutter_open_end_time", '0.0'),
-        ("shutter_close_begin_time", '0.0'),
-        ("shutter_close_end_time", '0.0'),
-        ])
-    camera = update_parameters(camera, **kwargs)
+    camera = THIN_LENS_CAMERA.build(name, **kwargs)
 
     xforms = kwargs.get('xforms')
     times  = kwargs.get('times')
@@ -240,17 +487,19 @@ def ThinLensCamera(name, **kwargs):
     return camera
 
 
+PINHOLE_CAMERA = Schema(haps.Camera, [
+        Parm("shutter_close_begin_time", 'float', '0.0'),
+        Parm("shutter_close_end_time", 'float', '0.0'),
+        Parm("shutter_open_begin_time", 'float', '0.0'),
+        Parm("shutter_open_end_time", 'float', '0.0'),
+        Parm("film_dimensions", 'floats', '18.7 24.9'), # mm super35
+        Parm("horizontal_fov", 'float', 45),
+        Parm("near_z", 'float', -0.001),
+        ], options=_TRANSFORM, model='pinhole_camera')
+
+
 def PinholeCamera(name, **kwargs):
-    camera = haps.Camera(name=name, model='pinhole_camera')
-    camera.add_parms([
-        ("shutter_close_begin_time", '0.0'),
-        ("shutter_close_end_time", '0.0'),
-        ("shutter_open_begin_time", '0.0'),
-        ("shutter_open_end_time", '0.0'),
-        ("film_dimensions", '18.7 24.9'), # mm super35
-        ("horizontal_fov",   45),
-        ("near_z",  -0.001)])
-    camera = update_parameters(camera, **kwargs)
+    camera = PINHOLE_CAMERA.build(name, **kwargs)
 
     xforms = kwargs.get('xforms')
     times  = kwargs.get('times')
@@ -266,18 +515,18 @@ def PinholeCamera(name, **kwargs):
 # box (Box), catmull (Catmull-Rom Spline), bspline (Cubic B-spline), 
 # gaussian (Gaussian), lanczos (Lanczos), mitchell (Mitchell-Netravali), triangle (Triangle).
 
+FRAME = Schema(haps.Frame, [
+        Parm("camera", 'name', None),
+        Parm("resolution", 'floats', "1280 720"),
+        Parm("crop_window", 'floats', "0 0 1280 720"),
+        Parm("tile_size", 'floats', "64 64"),
+        Parm("filter", 'string', 'gaussian'),
+        Parm("filter_size", 'float', 1.5),
+        ])
+
+
 def Frame(name, **kwargs):
-    frame = haps.Frame(name)
-    frame.add_parms([
-        ("camera", None),
-        ("resolution", "1280 720"),  
-        ("crop_window", "0 0 1280 720"),
-        ("tile_size" ,  "64 64"), 
-        ("filter",  'gaussian'), 
-        ("filter_size", 1.5 )])
-    frame = update_parameters(frame, **kwargs)
-
-    return frame
+    return FRAME.build(name, **kwargs)
 
 # Doesn't work, because of edf?
 # def SunLight(name, **kwargs):
@@ -296,7 +545,7 @@ def Frame(name, **kwargs):
 def Environment(name, **kwargs):
     env = haps.Environment(name, model='generic_environment')
     env.add_parms([('environment_edf',   'environment_edf'),
-                  ('environment_shader', 'environment_shader')])
+                  ('environment_shader', 'environment_shader')], shared=True)
     shader = haps.Environment_Shader('environment_shader',
         model='edf_environment_shader')
     shader.add(haps.Parameter('environment_edf', 'environment_edf'))
@@ -304,39 +553,43 @@ def Environment(name, **kwargs):
     return env, shader, edf
 
 
+ENVIRONMENT_EDF = Schema(haps.Environment_Edf, [
+        Parm("horizon_shift", 'float', "0.0"),
+        Parm("luminance_gamma", 'float', "1.0"),
+        Parm("luminance_multiplier", 'float', "1.0"),
+        Parm("saturation_multiplier", 'float', "1.0"),
+        Parm("sun_phi", 'float', "-15"),
+        Parm("sun_theta", 'float', "60"),
+        Parm("turbidity", 'input', "1.0"),
+        Parm("turbidity_multiplier", 'float', "1.0"),
+        ], model="preetham_environment_edf")
+
+
 def EnvironmentEdf(name, **kwargs):
-    env = haps.Environment_Edf(name, model="preetham_environment_edf")
-    env.add_parms([
-            ("horizon_shift" ,"0.0" ),
-            ("luminance_gamma" ,"1.0" ),
-            ("luminance_multiplier" ,"1.0" ),
-            ("saturation_multiplier" ,"1.0" ),
-            ("sun_phi" ,"-15" ),
-            ("sun_theta" ,"60" ),
-            ("turbidity" ,"1.0" ),
-            ("turbidity_multiplier" ,"1.0" ),
+    return ENVIRONMENT_EDF.build(name, **kwargs)
+
+
+SPECTRAL_COLOR = Schema(haps.Color, [
+        Parm('color_space', 'string', 'spectral'),
+        Parm('wavelength_range', 'floats', '400 700'),
         ])
-    env = update_parameters(env, **kwargs)
-    return env
 
 
 def SpectralColor(name, values=[1,1,1], alpha=1.0, **kwargs):
-    color = haps.Color(name)
-    color.add_parms([
-        ('color_space', 'spectral'),
-        ('wavelength_range', '400 700'),])
+    color = SPECTRAL_COLOR.build(name, **kwargs)
     color.add(haps.Values(values).add(haps.Alpha([alpha])))
-    color = update_parameters(color, **kwargs)
     return color
 
 
+COLOR = Schema(haps.Color, [
+        Parm('color_space', 'string', 'linear_rgb'),
+        Parm('multiplier', 'float', '1.0'),
+        ])
+
+
 def Color(name, values=[1,1,1], alpha=1.0, **kwargs):
-    color = haps.Color(name)
-    color.add_parms([
-        ('color_space', 'linear_rgb'),
-        ('multiplier', '1.0'),])
+    color = COLOR.build(name, **kwargs)
     color.add(haps.Values(values)).add(haps.Alpha([alpha]))
-    color = update_parameters(color, **kwargs)
     return color
     
 
@@ -382,7 +635,7 @@ def MeshInstance(name, object, **kwargs):
             ('camera',   'true'),
             ('specular', 'true'),
             ('glossy' ,  'true'),
-            ]))
+            ], shared=True))
 
     obj_inst = update_parameters(obj_inst, **kwargs)
 
@@ -443,7 +696,7 @@ def AssemblyInstance(name, assembly, **kwargs):
         assembly_inst.add(haps.Parameters('visibility').add_parms([
             ('shadow',   'true'),
             ('camera',   'true'),
-            ]))
+            ], shared=True))
     xforms = kwargs.get('xforms') # [] is correct
     times  = kwargs.get('times')
     
@@ -471,82 +724,104 @@ def AssemblyObject(name, filenames, list_of_kwargs, **kwargs):
     return assembly, inst
 
 
+def DeferredAssemblyObject(name, filenames, list_of_kwargs, materials=(), 
+    release=True, **kwargs):
+    """Same as AssemblyObject(), but the assembly is a stub (see haps.deferred())
+       which creates its objects and materials only when the project is written.
+
+    :parm materials: Materials of the assembly (entities, lists of them or None)
+                     or callables returning them, called when the assembly is 
+                     written. Assemblies may be written by worker processes, so
+                     callables must only build haps elements (no soho or hou).
+    :parm release:   Drop the content of the assembly once written (default True)
+    :returns:        Assembly stub and its instance
+    """
+    def ready(material):
+        # Made once, shared by every assembly the factory creates.
+        if isinstance(material, (list, tuple)):
+            return [haps.freeze(entity) for entity in material if entity is not None]
+        if material is None or callable(material):
+            return material
+        return haps.freeze(material)
+
+    materials = [ready(material) for material in materials]
+
+    def factory():
+        assembly, _ = AssemblyObject(name, filenames, list_of_kwargs)
+        Appleseed.TypeFactory(assembly).emplace_all([material() if callable(material)
+            else material for material in materials])
+        return assembly
+
+    assembly = haps.deferred(haps.Assembly, factory, name, release=release)
+    inst     = AssemblyInstance(name+"_inst", name,  **kwargs)
+    return assembly, inst
+
+
+def _path_tracing(max_bounces):
+    return Schema(haps.Parameters, [
+        Parm("dl_light_samples", 'float', "1.000000"),
+        Parm("dl_low_light_threshold", 'float', "0.000000"),
+        Parm("enable_caustics", 'bool', "true"),
+        Parm("enable_dl", 'bool', "true"),
+        Parm("enable_ibl", 'bool', "true"),
+        Parm("ibl_env_samples", 'float', "1.000000"),
+        Parm("max_bounces", 'int', max_bounces),
+        Parm("max_diffuse_bounces", 'int', max_bounces),
+        Parm("max_glossy_bounces", 'int', max_bounces),
+        Parm("max_specular_bounces", 'int', max_bounces),
+        Parm("next_event_estimation", 'bool', "true"),
+        Parm("rr_min_path_length", 'int', "6"),
+        ], name='pt')
+
+
+INTERACTIVE_CONFIGURATION = Schema(haps.Configuration, [
+        Parm("lighting_engine", 'string', "pt"),
+        Parm("sampling_mode", 'string', "qmc"),
+        _path_tracing("4"),
+        ], base='base_interactive')
+
+
 def InteractiveConfiguration(name='interactive', **kwargs):
-    conf = haps.Configuration(name, base='base_interactive')
-    conf.add_parms([
-            ("lighting_engine", "pt"),
-            ("sampling_mode", "qmc")])
-    conf.add(haps.Parameters('pt').add_parms([
-                ("dl_light_samples", "1.000000"),
-                ("dl_low_light_threshold", "0.000000"),
-                ("enable_caustics", "true"),
-                ("enable_dl", "true"),
-                ("enable_ibl", "true"),
-                ("ibl_env_samples", "1.000000"),
-                ("max_bounces", "4"),
-                ("max_diffuse_bounces", "4"),
-                ("max_glossy_bounces", "4"),
-                ("max_specular_bounces", "4"),
-                ("next_event_estimation", "true"),
-                ("rr_min_path_length", "6")]))
-    return conf
+    return INTERACTIVE_CONFIGURATION.build(name, **kwargs)
+
+
+FINAL_CONFIGURATION = Schema(haps.Configuration, [
+        Parm("lighting_engine", 'string', "pt"),
+        Parm("passes", 'int', "1"),
+        Parm("pixel_renderer", 'string', "uniform"),
+        Parm("sampling_mode", 'string', "qmc"),
+        Parm("shading_result_framebuffer", 'string', "ephemeral"),
+        Parm('spectrum_mode', 'string', 'rgb'),
+        Parm('rendering_threads', 'int', '0'),
+        Schema(haps.Parameters, [
+            Parm('algorithm', 'string', 'cdf'),
+            ], name='light_sampler'),
+        Schema(haps.Parameters, [
+            Parm('samples', 'int', 9),
+            Parm('decorrelate_pixels', 'bool', 'true'),
+            Parm('force_antialiasing', 'bool', 'true'),
+            ], name='uniform_pixel_renderer'),
+        _path_tracing("-1"),
+        Schema(haps.Parameters, [
+            Parm("alpha", 'float', "0.700000"),
+            Parm("dl_mode", 'string', "rt"),
+            Parm("enable_caustics", 'bool', "true"),
+            Parm("enable_ibl", 'bool', "true"),
+            Parm("env_photons_per_pass", 'int', "1000000"),
+            Parm("initial_radius", 'float', "0.100000"),
+            Parm("light_photons_per_pass", 'int', "1000000"),
+            Parm("max_photons_per_estimate", 'int', "100"),
+            Parm("path_tracing_max_bounces", 'int', "-1"),
+            Parm("path_tracing_rr_min_path_length", 'int', "6"),
+            Parm("photon_tracing_max_bounces", 'int', "-1"),
+            Parm("photon_tracing_rr_min_path_length", 'int', "6"),
+            Parm("photon_type", 'string', "poly"),
+            ], name='sppm'),
+        ], base='base_final')
 
 
 def FinalConfiguration(name='final', **kwargs):
-    conf = haps.Configuration(name, base='base_final')
-    conf.add_parms([
-            ("lighting_engine", "pt"),
-            ("passes", "1"),
-            ("pixel_renderer", "uniform"),
-            ("sampling_mode", "qmc"),
-            ("shading_result_framebuffer", "ephemeral"),
-            ('spectrum_mode', 'rgb'),
-            ('rendering_threads', '0') 
-            ])
-
-    conf.add(haps.Parameters('light_sampler').add_parms([
-        ('algorithm', 'cdf')
-        ]))
-
-    conf.add(haps.Parameters('uniform_pixel_renderer').add_parms([
-        ('samples', 9),
-        ('decorrelate_pixels', 'true'),
-        ('force_antialiasing', 'true')
-        ]))
-
-    conf.add(haps.Parameters('pt').add_parms([
-                ("dl_light_samples", "1.000000"),
-                ("dl_low_light_threshold", "0.000000"),
-                ("enable_caustics", "true"),
-                ("enable_dl", "true"),
-                ("enable_ibl", "true"),
-                ("ibl_env_samples", "1.000000"),
-                ("max_bounces", "-1"),
-                ("max_diffuse_bounces", "-1"),
-                ("max_glossy_bounces", "-1"),
-                ("max_specular_bounces", "-1"),
-                ("next_event_estimation", "true"),
-                ("rr_min_path_length", "6")
-                ]))
-
-    conf.add(haps.Parameters('sppm').add_parms([                 
-                ("alpha", "0.700000"),
-                ("dl_mode", "rt"),
-                ("enable_caustics", "true"),
-                ("enable_ibl", "true"),
-                ("env_photons_per_pass", "1000000"),
-                ("initial_radius", "0.100000"),
-                ("light_photons_per_pass", "1000000"),
-                ("max_photons_per_estimate", "100"),
-                ("path_tracing_max_bounces", "-1"),
-                ("path_tracing_rr_min_path_length", "6"),
-                ("photon_tracing_max_bounces", "-1"),
-                ("photon_tracing_rr_min_path_length", "6"),
-                ("photon_type", "poly"),
-                ]))
-
-
-    return conf
+    return FINAL_CONFIGURATION.build(name, **kwargs)
 
 def PhysicalSurfaceShader(name, lighting_samples=1):
     shader = haps.Surface_Shader(name, model='physical_surface_shader')
@@ -554,13 +829,32 @@ def PhysicalSurfaceShader(name, lighting_samples=1):
     return shader
 
 
+# Entities of DefaultLambertMaterial() cloned for every material
+_lambert_prototype = None
+_lambert_suffixes  = ('', '_color', '_bsdf', '_shader')
+
+
 def DefaultLambertMaterial(name, color=[.5,.5,.5]):
-    ''''''
+    '''Lambertian material with its color, bsdf and shader. Entities are
+       cloned from a frozen prototype, so their default parameters are
+       shared (see haps.Element.clone()).
+    '''
+    global _lambert_prototype
+    if _lambert_prototype is None:
+        _lambert_prototype = tuple(map(haps.freeze, _lambert_material('lambert')))
+    names  = dict([('lambert' + suffix, name + suffix) for suffix in _lambert_suffixes])
+    rgb, bsdf, shader, material = [entity.clone(names=names) 
+        for entity in _lambert_prototype]
+    rgb.replace(rgb.find('values'), haps.Values(color))
+    return rgb, bsdf, shader, material
+
+
+def _lambert_material(name, color=[.5,.5,.5]):
     rgb = haps.Color(name+'_color')
     rgb.add_parms([
         ('multiplier', 1.0),
         ('wavelength_range', '400.0 700.0'),
-        ('color_space', 'linear_rgb')])
+        ('color_space', 'linear_rgb')], shared=True)
 
     rgb.add(haps.Values(color))
     rgb.add(haps.Alpha([1.0]))
@@ -577,75 +871,84 @@ def DefaultLambertMaterial(name, color=[.5,.5,.5]):
     return rgb, bsdf, shader, material
 
 
-def DisneyMaterialLayer(name, layer_number, **kwargs):
-    parms = haps.Parameters(name)
-    parms.add_parms([
-            ("anisotropic", "0"),
-            ("base_color", "[0.619608, 0.309804, 0.164706]"),
-            ("clearcoat", "0.0"),
-            ("clearcoat_gloss", "1.0"),
-            ("folded", "false"),
-            ("layer_name", name),
-            ("layer_number", layer_number),
-            ("mask", "1"),
-            ("metallic", "0.85"),
-            ("roughness", "0.15"),
-            ("sheen", "0.0"),
-            ("sheen_tint", "0.0"),
-            ("specular", "0.5"),
-            ("specular_tint", "0.0"),
-            ("subsurface", "0.0"),
+DISNEY_MATERIAL_LAYER = Schema(haps.Parameters, [
+        Parm("anisotropic", 'input', "0"),
+        Parm("base_color", 'input', "[0.619608, 0.309804, 0.164706]"),
+        Parm("clearcoat", 'input', "0.0"),
+        Parm("clearcoat_gloss", 'input', "1.0"),
+        Parm("folded", 'bool', "false"),
+        Parm("layer_name", 'string', None),
+        Parm("layer_number", 'int', None),
+        Parm("mask", 'input', "1"),
+        Parm("metallic", 'input', "0.85"),
+        Parm("roughness", 'input', "0.15"),
+        Parm("sheen", 'input', "0.0"),
+        Parm("sheen_tint", 'input', "0.0"),
+        Parm("specular", 'input', "0.5"),
+        Parm("specular_tint", 'input', "0.0"),
+        Parm("subsurface", 'input', "0.0"),
         ])
-    parms = update_parameters(parms, **kwargs)
-    return parms
+
+
+def DisneyMaterialLayer(name, layer_number, **kwargs):
+    return DISNEY_MATERIAL_LAYER.build(name, layer_name=name, 
+        layer_number=layer_number, **kwargs)
+
+
+DISNEY_MATERIAL = Schema(haps.Material, [
+        Parm("surface_shader", 'name', "surface_shader"),
+        Parm('edf', 'name', None),
+        Parm("alpha_map", 'input', "0"),
+        Parm("bump_amplitude", 'float', "1.0"),
+        Parm("displacement_method", 'string', "bump"),
+        Parm("normal_map_up", 'string', "z"),
+        ], model='disney_material')
 
 
 def DisneyMaterial(name, layers=1, **kwargs):
+    '''Disney material with its shader. Parameters of layers given 
+       in kwargs are set in all layers.
+    '''
+    layer_kwargs = dict([(key, value) for key, value in kwargs.iteritems()
+        if DISNEY_MATERIAL_LAYER.find(key)])
+    for key in layer_kwargs:
+        del kwargs[key]
     shader   = PhysicalSurfaceShader('surface_shader')
-    material = haps.Material(name, model='disney_material')
-    material.add_parms([
-                ("surface_shader", "surface_shader"),
-                ('edf', None),
-                ("alpha_map", "0"),
-                ("bump_amplitude", "1.0"),
-                ("displacement_method", "bump"),
-                ("normal_map_up", "z"),
-        ])
-    material = update_parameters(material, **kwargs)
+    material = DISNEY_MATERIAL.build(name, **kwargs)
     for layer in range(1, layers+1):
         name = 'layer%i' % layer
-        material.add(DisneyMaterialLayer(name, layer, **kwargs))
+        material.add(DisneyMaterialLayer(name, layer, **layer_kwargs))
     return shader, material
 
 
+POINT_LIGHT = Schema(haps.Light, [
+        Parm('cast_indirect_light', 'bool', True),
+        Parm('exposure', 'float', '0.0'),
+        Parm('importance_multiplier', 'float', 1.0),
+        Parm('intensity', 'input', 1.0),
+        Parm('intensity_multiplier', 'float', 1.0),
+        ], options=_TRANSFORM, model='point_light')
+
+
 def PointLight(name, **kwargs):
     '''Non-physical point light'''
-    light = haps.Light(name, model='point_light')
-    light.add_parms([
-        ('cast_indirect_light', True),
-        ('exposure', '0.0'),
-        ('importance_multiplier', 1.0),
-        ('intensity', 1.0),
-        ('intensity_multiplier', 1.0)
-        ])
+    return POINT_LIGHT.build(name, **kwargs)
 
-    light  = update_parameters(light, **kwargs)
-    return light
+
+EDF = Schema(haps.Edf, [
+        Parm("cast_indirect_light", 'bool', True),
+        Parm("importance_multiplier", 'float', 1.0),
+        Parm("light_near_start", 'float', "0.0"),
+        Parm("radiance", 'input', 1.0),
+        Parm("radiance_multiplier", 'float', 1.0),
+        Parm("exposure", 'float', 0),
+        ])
 
 
 def Edf(name, model, **kwargs):
     '''Edf mostly for geometry lights.'''
-    edf = haps.Edf(name, model=model)
-    edf.add_parms([
-        ("cast_indirect_light", True),
-        ("importance_multiplier", 1.0),
-        ("light_near_start", "0.0"),
-        ("radiance", 1.0),
-        ("radiance_multiplier", 1.0),
-        ("exposure", 0)
-    ])
-    edf = update_parameters(edf, **kwargs)
-    return edf
+    edf = haps.Edf(name, model=model).extend(EDF.defaults())
+    return EDF.update(edf, **kwargs)
 
 
 def MeshLight(name, filename, color=(1,1,1), exposure=0, **kwargs):
@@ -681,11 +984,17 @@ def DiskTexture2D(name, filename, **kwargs):
     texture = update_parameters(texture, **kwargs)
     texture_instance = haps.Texture_Instance(name+'_inst', texture=name).add_parms([
         ("addressing_mode", "clamp"),
-        ("filtering_mode", "nearest"),])
+        ("filtering_mode", "nearest"),], shared=True)
     texture_instance = update_parameters(texture_instance, **kwargs)
     return texture, texture_instance
 
 
-
-
-
+# Haps classes go first, factories of this module replace them.
+for _name, _value in vars(haps).items():
+    if isinstance(_value, type) and issubclass(_value, haps.haps.Element):
+        register_type(_name, _value, single=True)
+for _name, _value in globals().items():
+    if isinstance(_value, types.FunctionType) and _value.__module__ == __name__ \
+        and not _name.startswith('_'):
+        register_type(_name, _value)
+del _name, _value
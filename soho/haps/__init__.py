@@ -1 +1,42 @@
-from tags import *
\ No newline at end of file
+import sys, types
+
+from tags import *
+from haps import set_precision, format_number, format_numbers, write_json, deferred, NumberList
+from haps import get_backend, set_backend, register_backend, freeze, DirtyTracker
+from haps import set_sparse, sparse_report, reset
+
+# Names of modules which exports don't need, imported on first use of
+# the names (see _LazyPackage), so they don't slow down start of renders.
+_LAZY = {
+    'defaults': ('RENDERER_DEFAULTS', 'register_defaults'),
+    'loader':   ('load', 'fromstring', 'load_json', 'fromjson'),
+    'delta':    ('diff', 'patch'),
+    'query':    ('TreeIndex', 'select'),
+    'binary':   ('tobinary', 'frombinary', 'write_binary', 'load_binary'),
+    'packed':   ('PackedProject',),
+    }
+_LAZY_NAMES = dict([(name, module) for module, names in _LAZY.iteritems()
+    for name in names])
+
+
+class _LazyPackage(types.ModuleType):
+    """Package module importing submodules of names of _LAZY on first
+       access to them (Python 2 modules have no __getattr__).
+    """
+    def __getattr__(self, name):
+        module = _LAZY_NAMES.get(name)
+        if module is None:
+            raise AttributeError("'module' object has no attribute '%s'" % name)
+        value = getattr(__import__('%s.%s' % (__name__, module), fromlist=[name]), name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_LAZY_NAMES))
+
+
+# Original module is kept alive by its replacement, as globals of a
+# deallocated module are cleared.
+_package = sys.modules[__name__]
+sys.modules[__name__] = _LazyPackage(__name__, __doc__)
+sys.modules[__name__].__dict__.update(_package.__dict__)
@@ -0,0 +1,196 @@
+"""
+    Serialization backends of haps trees. Trees are always made of
+    etree_impl elements, backends differ in how they render them:
+
+        etree_impl   Reference streaming serializer (etree_impl.iterxml())
+        elementtree  Tree converted into stdlib ElementTree elements
+                     rendered by its serializer (interop only)
+
+    elementtree backend exists for interoperability (tools expecting
+    ElementTree, escaping, parity checks), not for speed: conversion walks
+    the whole tree in Python and keeps a second copy of it in memory, which
+    makes it a few times slower than etree_impl (see tests/benchmark.py).
+
+    Backends produce equivalent documents, not identical ones: unlike
+    etree_impl, ElementTree escapes markup characters of attributes and
+    text, sorts attributes by name (Python 2) and can't render assemblies
+    in parallel processes.
+
+    Backend is selected with set_backend() or HAPS_BACKEND environment
+    variable (HAPS_USE_ELEMENTTREE selects 'elementtree' as it used to).
+"""
+
+import os
+from collections import OrderedDict
+
+import etree_impl
+from etree_impl import BUFFER_SIZE, _format_text, _write_chunks
+
+
+class Backend(object):
+    """Serializer of haps trees into XML documents."""
+    name = None
+
+    def iterxml(self, element, pretty_print=True, indent=4, level=0):
+        """Render element and its children into XML document chunks
+           (see etree_impl.iterxml()). Backends override it, this one
+           renders with the reference serializer.
+        """
+        return etree_impl.iterxml(element, pretty_print, indent, level)
+
+    def tostring(self, element, pretty_print=True):
+        return ''.join(self.iterxml(element, pretty_print))
+
+    def write(self, element, fileio, pretty_print=True, indent=4, level=0,
+        buffer_size=BUFFER_SIZE, processes=1):
+        """Write XML document of element into a file (see etree_impl.write()).
+           Backends rendering in a single process ignore 'processes'.
+        """
+        return _write_chunks(self.iterxml(element, pretty_print, indent, level),
+            fileio, buffer_size)
+
+
+class EtreeImplBackend(Backend):
+    name = 'etree_impl'
+
+    def tostring(self, element, pretty_print=True):
+        return etree_impl.tostring(element, pretty_print)
+
+    def write(self, element, fileio, pretty_print=True, indent=4, level=0,
+        buffer_size=BUFFER_SIZE, processes=1):
+        return etree_impl.write(element, fileio, pretty_print, indent, level,
+            buffer_size, processes)
+
+
+class ElementTreeBackend(Backend):
+    """Renders ElementTree copy of haps tree (see build()). Meant for
+       interoperability rather than speed.
+    """
+    name  = 'elementtree'
+    _etree = None
+
+    @property
+    def etree(self):
+        # Imported on first use, most exports never need it.
+        if self._etree is None:
+            try:
+                import xml.etree.cElementTree as etree
+            except ImportError:
+                import xml.etree.ElementTree as etree
+            ElementTreeBackend._etree = etree
+        return self._etree
+
+    def build(self, element, pretty_print=True, indent=4, level=0):
+        """Return ElementTree copy of element with whitespace of
+           pretty printed document in text and tails of elements.
+           Deferred elements (see etree_impl.deferred()) are produced
+           before being copied and released once the copy is complete.
+        """
+        Element, SubElement = self.etree.Element, self.etree.SubElement
+        new_line = '\n' if pretty_print else ''
+        spaces   = []
+
+        def whitespace(level):
+            while len(spaces) <= level:
+                spaces.append(new_line + ' ' * indent * len(spaces) if pretty_print else '')
+            return spaces[level]
+
+        def attrib(node):
+            if not node._attrib:
+                return {}
+            values = etree_impl._float_attributes(node._attrib) \
+                if etree_impl._format_floats else node._attrib.itervalues()
+            return dict([(str(key), '%s' % (value,))
+                for key, value in zip(node._attrib, values)])
+
+        # Renderer defaults of parameters in sparse mode (see set_sparse())
+        sparse   = etree_impl._sparse and etree_impl._sparse_defaults
+        omit     = etree_impl._omit
+        # Deferred elements to be released after the copy
+        deferred = []
+
+        def produced(node):
+            # Factory may add attributes too, so it goes first.
+            if node._deferred:
+                node._materialize()
+                deferred.append(node)
+            return node
+
+        root  = Element(element.tag, attrib(produced(element)))
+        stack = [(element, root, level, sparse and sparse(element))]
+        while stack:
+            node, target, level, defaults = stack.pop()
+            if node._text:
+                wh1 = whitespace(level+1)
+                target.text = wh1 + _format_text(node._text, wh1 or ' ') + whitespace(level)
+                continue
+            children = [produced(child) for child in node._live()]
+            if defaults:
+                children = [child for child in children if not omit(child, defaults)]
+            if not children:
+                continue
+            target.text = whitespace(level+1)
+            for child in children:
+                sub = SubElement(target, child.tag, attrib(child))
+                sub.tail = whitespace(level+1)
+                stack.append((child, sub, level+1, sparse and sparse(child, defaults)))
+            sub.tail = whitespace(level)
+        for node in deferred:
+            node._release_children()
+        return root
+
+    def iterxml(self, element, pretty_print=True, indent=4, level=0):
+        root = self.build(element, pretty_print, indent, level)
+        if pretty_print:
+            yield ' ' * indent * level
+        yield self.etree.tostring(root)
+        if pretty_print:
+            yield '\n'
+
+
+BACKENDS = OrderedDict()
+_backend = None
+
+
+def register_backend(backend):
+    """Make backend instance selectable by its name."""
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+def get_backend(name=None):
+    """Return backend 'name' or currently selected one."""
+    if name is None:
+        return _backend
+    if name not in BACKENDS:
+        raise Exception('Unknown serialization backend %s, expected one of %s' % (
+            name, ', '.join(BACKENDS)))
+    return BACKENDS[name]
+
+
+def set_backend(name):
+    """Select backend used by HapsObj.toxml() and haps.tostring()."""
+    global _backend
+    _backend = get_backend(name)
+    return _backend
+
+
+def tostring(element, pretty_print=True):
+    """Render element to string with XML document using current backend."""
+    return _backend.tostring(element, pretty_print)
+
+
+def write(element, fileio, pretty_print=True, indent=4, level=0,
+    buffer_size=BUFFER_SIZE, processes=1):
+    """Write XML document of element into a file using current backend."""
+    return _backend.write(element, fileio, pretty_print, indent, level,
+        buffer_size, processes)
+
+
+register_backend(EtreeImplBackend())
+register_backend(ElementTreeBackend())
+
+if os.getenv('HAPS_USE_ELEMENTTREE'):
+    set_backend('elementtree')
+else:
+    set_backend(os.getenv('HAPS_BACKEND') or 'etree_impl')
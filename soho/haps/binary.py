@@ -0,0 +1,152 @@
+"""
+    Compact binary encoding of haps trees for transfer between processes
+    (render farm workers, export daemons), much faster to produce and
+    read than XML. A document is 'HAPB' magic and a version byte followed
+    by a marshal'ed list of records of elements in document order:
+
+        (tag, attributes, text, number of children)
+
+    Attributes are dictionaries of values as they are (strings, numbers,
+    bools, lists...), so they round-trip with their types, unlike XML.
+    Numeric payloads (Matrix, Values...) are written as raw doubles in
+    a 1-tuple: (bytes,), string payloads as they are.
+
+    Tags and attribute keys are interned strings, which marshal writes
+    once and then refers to by index into its string table, so they
+    cost a few bytes per element. Decoder takes attribute dictionaries
+    and payloads from marshal as they come, without per value parsing.
+    Documents are portable between platforms, but not between versions
+    of Python.
+"""
+
+import types, marshal
+from array import array
+
+from etree_impl import _write_chunks
+from haps import NumericPayload
+from loader import element_class
+
+MAGIC   = 'HAPB\x01'
+# marshal format with interned strings table and binary floats
+_FORMAT = 2
+
+
+# Attribute values written as they are. Others are rendered the way XML
+# would be, as marshal can't write them or (arrays) writes raw bytes.
+_PLAIN = frozenset([str, unicode, int, long, float, bool, types.NoneType, 
+    list, tuple])
+
+
+def _portable(attrib):
+    return dict([(key, value if type(value) in _PLAIN else '%s' % (value,))
+        for key, value in attrib.iteritems()])
+
+
+def _records(element):
+    """Return list of records of element subtree in document order."""
+    records = []
+    emit    = records.append
+    stack   = [element]
+    while stack:
+        node = stack.pop()
+        if node._deferred:
+            node._materialize()
+        text = node._text
+        if text is not None and type(text) is not str:
+            if isinstance(text, array) and text.typecode == 'd':
+                text = (text.tostring(),)
+            elif not isinstance(text, basestring):
+                text = list(text)
+        attrib = node._attrib
+        if attrib and not _PLAIN.issuperset(map(type, attrib.itervalues())):
+            attrib = _portable(attrib)
+        children = node._live()
+        emit((node.tag, attrib, text, len(children)))
+        stack.extend(children[::-1])
+        if node._deferred:
+            node._release_children()
+    return records
+
+
+def tobinary(element):
+    """Render element to string with binary document.
+
+    :parm element: Element to render
+    :returns:      String with binary document
+    """
+    return MAGIC + marshal.dumps(_records(element), _FORMAT)
+
+
+def write_binary(element, fileio):
+    """Write binary document of element into a file.
+
+    :parm element: Element to render
+    :parm fileio:  Writeable file-like object or file descriptor
+    :returns:      fileio object
+    """
+    return _write_chunks([tobinary(element)], fileio, 0)
+
+
+def frombinary(data):
+    """Load binary document written by tobinary() into haps objects.
+
+    :parm data: String with binary document
+    :returns:   Root element of the document
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise Exception('Not a binary haps document of version %i' % ord(MAGIC[-1]))
+    try:
+        records = marshal.loads(data[len(MAGIC):])
+    except (EOFError, ValueError, TypeError):
+        raise Exception('Truncated binary haps document')
+
+    classes = {}
+    root, parents = None, []
+    for tag, attrib, text, count in records:
+        cls = classes.get(tag)
+        if cls is None:
+            cls = classes[tag] = element_class(tag)
+        # Slots are set in place, as Element.__init__() would do.
+        node = cls.__new__(cls)
+        node._attrib   = attrib
+        node._children = ()
+        node._parent   = None
+        node._pos      = 0
+        node._holes    = 0
+        node._names    = None
+        node._digest   = None
+        if type(text) is tuple:
+            payload = NumericPayload(())
+            payload.fromstring(text[0])
+            text = payload
+        node._text = text
+
+        if parents:
+            entry  = parents[-1]
+            parent = entry[0]
+            if not parent._children:
+                parent._children = []
+            node._parent = parent
+            node._pos    = len(parent._children)
+            parent._children.append(node)
+            parent._index(node, attrib.get('name', False) if attrib else False)
+            entry[1] -= 1
+            if not entry[1]:
+                parents.pop()
+        else:
+            root = node
+        if count:
+            parents.append([node, count])
+    return root
+
+
+def load_binary(source):
+    """Load binary document from a file into haps objects.
+
+    :parm source: File name or file object with binary document
+    :returns:     Root element of the document
+    """
+    if isinstance(source, types.StringTypes):
+        with open(source, 'rb') as fileio:
+            return load_binary(fileio)
+    return frombinary(source.read())
@@ -0,0 +1,123 @@
+"""
+    Defaults of appleseed's entity parameters, which are left out of
+    documents in sparse mode (see etree_impl.set_sparse()). Entries are
+    keyed by tag and model of the entity owning parameters (base of
+    configurations, None for entities without models), and map names
+    of parameters to the values appleseed uses when one is missing.
+    Groups of parameters (<parameters name="pt">) map to nested 
+    dictionaries, '*' holds defaults of groups of any name (layers of
+    materials).
+
+    Only parameters whose defaults are fixed by appleseed itself are
+    listed. Parameters with defaults depending on other parameters, or
+    of configurations with interactive bases, are always written.
+"""
+
+# Path tracer and SPPM settings shared by configurations
+_PATH_TRACING = {
+    'dl_light_samples':             '1.0',
+    'dl_low_light_threshold':       '0.0',
+    'enable_dl':                    'true',
+    'enable_ibl':                   'true',
+    'ibl_env_samples':              '1.0',
+    'max_bounces':                  '-1',
+    'max_diffuse_bounces':          '-1',
+    'max_glossy_bounces':           '-1',
+    'max_specular_bounces':         '-1',
+    'next_event_estimation':        'true',
+    'rr_min_path_length':           '6',
+}
+
+_SPPM = {
+    'alpha':                                '0.7',
+    'dl_mode':                              'rt',
+    'enable_caustics':                      'true',
+    'enable_ibl':                           'true',
+    'env_photons_per_pass':                 '1000000',
+    'initial_radius':                       '0.1',
+    'light_photons_per_pass':               '1000000',
+    'max_photons_per_estimate':             '100',
+    'path_tracing_max_bounces':             '-1',
+    'path_tracing_rr_min_path_length':      '6',
+    'photon_tracing_max_bounces':           '-1',
+    'photon_tracing_rr_min_path_length':    '6',
+    'photon_type':                          'poly',
+}
+
+_LIGHT = {
+    'cast_indirect_light':      'true',
+    'exposure':                 '0.0',
+    'importance_multiplier':    '1.0',
+}
+
+_CAMERA = {
+    'near_z':                   '-0.001',
+    'shift_x':                  '0.0',
+    'shift_y':                  '0.0',
+    'shutter_open_begin_time':  '0.0',
+    'shutter_open_end_time':    '0.0',
+}
+
+_MATERIAL = {
+    'bump_amplitude':           '1.0',
+    'displacement_method':      'bump',
+    'normal_map_up':            'z',
+}
+
+RENDERER_DEFAULTS = {
+    ('configuration', 'base_final'): {
+        'passes':                       '1',
+        'shading_result_framebuffer':   'ephemeral',
+        'light_sampler':                {'algorithm': 'cdf'},
+        'uniform_pixel_renderer':       {'decorrelate_pixels': 'true'},
+        'pt':                           _PATH_TRACING,
+        'sppm':                         _SPPM,
+    },
+    ('frame', None): {
+        'tile_size':                '64 64',
+    },
+    ('camera', 'pinhole_camera'): _CAMERA,
+    ('camera', 'thinlens_camera'): dict(_CAMERA, **{
+        'autofocus_target':         '0.5 0.5',
+        'diaphragm_tilt_angle':     '0.0',
+        'f_stop':                   '8.0',
+        'focal_distance':           '1.0',
+    }),
+    ('color', None): {
+        'multiplier':               '1.0',
+    },
+    ('light', 'point_light'): dict(_LIGHT, intensity_multiplier='1.0'),
+    ('edf', 'diffuse_edf'): dict(_LIGHT, light_near_start='0.0',
+        radiance_multiplier='1.0'),
+    ('environment_edf', 'preetham_environment_edf'): {
+        'horizon_shift':            '0.0',
+        'luminance_gamma':          '1.0',
+        'luminance_multiplier':     '1.0',
+        'saturation_multiplier':    '1.0',
+    },
+    ('material', 'generic_material'): _MATERIAL,
+    ('material', 'disney_material'): dict(_MATERIAL, **{
+        '*': {
+            'anisotropic':          '0.0',
+            'clearcoat':            '0.0',
+            'clearcoat_gloss':      '1.0',
+            'mask':                 '1.0',
+            'sheen':                '0.0',
+            'specular':             '0.5',
+            'specular_tint':        '0.0',
+            'subsurface':           '0.0',
+        },
+    }),
+}
+
+
+def register_defaults(tag, model, parameters):
+    """Add or replace renderer defaults of parameters of entities.
+       Takes effect with the next set_sparse() call.
+
+    :parm tag:        Tag of entities (like 'light')
+    :parm model:      Model of entities or None
+    :parm parameters: Dictionary of parameter names and default values,
+                      nested dictionaries for groups of parameters
+    """
+    RENDERER_DEFAULTS.setdefault((tag, model), {}).update(parameters)
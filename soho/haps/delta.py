@@ -0,0 +1,150 @@
+"""
+    Structural diff and patch of haps trees. Children of an element are
+    matched by a key made of their tag, name and ordinal number among
+    siblings of the same tag and name, so transforms, values and other
+    unnamed elements are matched in order of appearance.
+
+    Edit script is a list of Edit(op, path, value) tuples, where path is
+    a tuple of keys leading from the root to an element and op is one of:
+
+        'add'     value is an element to be appended to path[:-1]
+        'remove'  element at path is removed
+        'attrib'  value is a dict of changed attributes, None for removed
+        'text'    value is new text payload of element at path
+
+    Order of children is not part of the diff: new elements are appended.
+"""
+
+import collections
+from collections import Hashable
+
+from etree_impl import format_numbers
+
+Edit = collections.namedtuple('Edit', 'op path value')
+
+
+def _keys(element):
+    """Yield (key, child) pairs of live children of element."""
+    counts = {}
+    for child in element._live():
+        name = child._attrib.get('name') if child._attrib else None
+        if not isinstance(name, Hashable):
+            name = repr(name)
+        ordinal = counts.get((child.tag, name), 0)
+        counts[(child.tag, name)] = ordinal + 1
+        yield (child.tag, name, ordinal), child
+
+
+def _differ(old, new):
+    # Values are compared as written, so 27 and '27' are the same.
+    return old != new and str(old) != str(new)
+
+
+def _differ_text(old, new):
+    # Numeric payloads are compared at current precision.
+    def written(text):
+        if text is None or isinstance(text, basestring):
+            return text
+        return format_numbers(text)
+    return old != new and written(old) != written(new)
+
+
+def diff(old, new):
+    """Compute edit script turning old tree into new one.
+
+    :parm old: Root element of current tree
+    :parm new: Root element of target tree
+    :returns:  List of Edit tuples (see patch())
+    """
+    script = []
+    stack  = [(old, new, ())]
+    while stack:
+        old, new, path = stack.pop()
+
+        old_attrib = old._attrib or {}
+        new_attrib = new._attrib or {}
+        changes    = dict((key, value) for key, value in new_attrib.iteritems()
+                          if key not in old_attrib or _differ(old_attrib[key], value))
+        changes.update((key, None) for key in old_attrib if key not in new_attrib)
+        if changes:
+            script.append(Edit('attrib', path, changes))
+        if _differ_text(old._text, new._text):
+            script.append(Edit('text', path, new._text))
+
+        if not old._children and not new._children:
+            continue
+
+        old_children = collections.OrderedDict(_keys(old))
+        matched = []
+        added   = []
+        for key, child in _keys(new):
+            previous = old_children.pop(key, None)
+            if previous is None:
+                added.append(Edit('add', path + (key,), child))
+            else:
+                matched.append((previous, child, path + (key,)))
+
+        # Removed siblings go last first, so ordinals stay valid.
+        script.extend(Edit('remove', path + (key,), None)
+                      for key in reversed(old_children))
+        script.extend(added)
+        stack.extend(reversed(matched))
+    return script
+
+
+def patch(tree, script):
+    """Apply edit script computed with diff() to a tree in place.
+    Added elements are copied (see Element.clone()), so script can be 
+    applied many times.
+
+    :parm tree:   Root element of a tree to be changed
+    :parm script: List of Edit tuples
+    :returns:     tree
+    """
+    indices = {}
+
+    def index(parent):
+        # Parent is kept along its index, so its id can't be reused.
+        if id(parent) not in indices:
+            indices[id(parent)] = (parent, dict(_keys(parent)))
+        return indices[id(parent)][1]
+
+    def resolve(path):
+        # Shared elements on the way are replaced by private copies,
+        # as the resolved element is going to change.
+        node = tree
+        for key in path:
+            try:
+                child = index(node)[key]
+            except KeyError:
+                raise KeyError('No element at %s' % (path,))
+            if child._shared:
+                child = index(node)[key] = node.unshare(child)
+            node = child
+        return node
+
+    for op, path, value in script:
+        if op == 'add':
+            parent  = resolve(path[:-1])
+            element = value.clone()
+            parent.append(element)
+            index(parent)[path[-1]] = element
+        elif op == 'remove':
+            parent  = resolve(path[:-1])
+            parent.remove(index(parent).pop(path[-1]))
+        elif op == 'attrib':
+            node = resolve(path)
+            for key, attribute in value.iteritems():
+                if attribute is None:
+                    node.attributes.pop(key, None)
+                    node._touch()
+                else:
+                    node.set(key, attribute)
+        elif op == 'text':
+            node = resolve(path)
+            if value is not None and not isinstance(value, basestring):
+                value = type(value)(value)
+            node.set('text', value)
+        else:
+            raise ValueError('Unknown edit %s' % op)
+    return tree
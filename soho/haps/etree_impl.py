@@ -1,42 +1,653 @@
-import collections, types
+import collections, types, os, sys
+from hashlib import sha1
+from array import array
 from collections import defaultdict, OrderedDict
 
 HAPS_DEBUG=True
-# https://stackoverflow.com/questions/10844064/
-# items-in-json-object-are-out-of-order-using-json-dumps
-import json
-class OrderedJsonEncoder(json.JSONEncoder):
-   def encode(self,o):
-      if isinstance(o, OrderedDict):
-         return "{" + ",".join( [ self.encode(k)+":"+self.encode(v) for (k,v) in o.iteritems() ] ) + "}"
-      else:
-         return simplejson.JSONEncoder.encode(self, o)
 
 class XMLTokens(defaultdict):
-    text_template    ='{nl}{wh}{text}{nl}{wh2}{start}{tag}{end}'
-    element_template = '{wh}{start}{tag}{attrib}{end}{text}{nl}'
     start_tag = '<'
     end_tag   = '/>'
     parent_end_tag = '>'
     parent_start_tag='</'
 
 
+BUFFER_SIZE = 64 * 1024
+
+# Active trackers of changed elements (see DirtyTracker). Mutations
+# only check the list is empty when nothing is tracked.
+_trackers = []
+
+# Count of structural changes (children added, removed or renamed) of
+# all trees, lets indexes of a tree (see query.py) notice they're stale.
+_changes = 0
+
+# Key in name index of a parent which children were also appended to
+# other parents, hence could be renamed without parent knowing it.
+_ALIASED = object()
+
+
 def tostring(element, pretty_print=True):
     """Render element to string with XML document. """
-    from StringIO import StringIO
-    return element.toxml(StringIO(), pretty_print).getvalue()
+    return ''.join(iterxml(element, pretty_print))
+
+
+def write(element, fileio, pretty_print=True, indent=4, level=0, 
+    buffer_size=BUFFER_SIZE, processes=1):
+    """Stream XML document of element into a file in chunks of about
+       buffer_size characters, so the document is never held in memory as a whole.
+
+    :parm element:      Element to render
+    :parm fileio:       Writeable file-like object or file descriptor (pipe, socket etc)
+    :parm pretty_print: print with new lines and tabs (default True)
+    :parm indent:       Indent for pretty print (default 4)
+    :parm level:        Initial indentation level (default 0)
+    :parm buffer_size:  Number of characters collected before single write.
+    :parm processes:    Number of processes rendering assemblies (see 
+                        iterxml_parallel()), None for cpu count (default 1)
+    :returns:           fileio object
+    """
+    if processes == 1:
+        document = iterxml(element, pretty_print, indent, level)
+    else:
+        document = iterxml_parallel(element, pretty_print, indent, level, processes)
+
+    return _write_chunks(document, fileio, buffer_size)
+
+
+def _write_chunks(document, fileio, buffer_size):
+    if isinstance(fileio, int):
+        emit = lambda data: _write_fd(fileio, data)
+    else:
+        emit = fileio.write
+
+    chunks, size = [], 0
+    for chunk in document:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            emit(''.join(chunks))
+            chunks, size = [], 0
+    if chunks:
+        emit(''.join(chunks))
+    return fileio
+
+
+def _write_fd(fd, data):
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    while data:
+        data = data[os.write(fd, data):]
+
+
+# Same as str() of a float, without '.0' of integral values.
+PRECISION     = 12
+NUMBER_FORMAT = '%.12g'
+_text_layouts = {}
+
+# Float attributes are rendered with str() until precision is changed,
+# so that default documents keep values like "1.0".
+_format_floats = False
+
+
+def set_precision(digits=PRECISION, trim_zeros=True):
+    """Set number of significant digits of floats written into XML 
+       documents (numeric payloads, float lists of parameters and float 
+       attributes, like values of scalar parameters). 17 digits 
+       round-trips doubles exactly.
+
+    :parm digits:     Number of significant digits (default 12, as str())
+    :parm trim_zeros: Strip trailing zeros of fractional parts (default True)
+    """
+    global NUMBER_FORMAT, _format_floats
+    assert(isinstance(digits, int) and digits > 0)
+    NUMBER_FORMAT  = ('%%.%ig' if trim_zeros else '%%#.%ig') % digits
+    _format_floats = (digits, trim_zeros) != (PRECISION, True)
+    _text_layouts.clear()
+
+
+def format_number(value):
+    """Render a float with current precision, anything else with str()."""
+    if isinstance(value, float):
+        return NUMBER_FORMAT % value
+    return str(value)
+
+
+def format_numbers(values, separator=' '):
+    """Render a sequence of values with format_number() joined with separator."""
+    if isinstance(values, array):
+        return separator.join([NUMBER_FORMAT] * len(values)) % tuple(values)
+    return separator.join([NUMBER_FORMAT % value if isinstance(value, float) 
+        else str(value) for value in values])
+
+
+class NumberList(tuple):
+    """Numbers of an attribute value (like values of color parameters) 
+       kept as they are and rendered space separated when written: with
+       str() or, once precision is changed, with format_numbers(). 
+       Compares equal to its rendering.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        if _format_floats:
+            return format_numbers(self)
+        return ' '.join(map(str, self))
+
+    def __eq__(self, other):
+        if isinstance(other, basestring):
+            return str(self) == other
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = tuple.__hash__
+
+
+def _float_attributes(attrib):
+    """Return values of attributes with floats rendered with current precision."""
+    return tuple([NUMBER_FORMAT % value if isinstance(value, float) else value
+        for value in attrib.itervalues()])
+
+
+def _format_text(text, separator, length=4):
+    """Render text payload as lines of 'length' items joined with separator.
+       Numeric arrays are formatted in bulk with a template cached per 
+       payload size, strings are rendered as they are.
+    """
+    if isinstance(text, basestring):
+        return text
+    if not isinstance(text, array):
+        return separator.join([' '.join(map(str, text[start:start+length])) 
+            for start in range(0, len(text), length)])
+
+    key    = (len(text), separator)
+    layout = _text_layouts.get(key)
+    if layout is None:
+        lines = [' '.join([NUMBER_FORMAT] * length)] * (len(text) // length)
+        if len(text) % length:
+            lines += [' '.join([NUMBER_FORMAT] * (len(text) % length))]
+        layout = _text_layouts[key] = separator.join(lines)
+    return layout % tuple(text)
+
+
+# Renderer defaults of parameters in comparable form by (tag, model) 
+# of their owners while sparse mode is on (see set_sparse()), and counts
+# of parameters and bytes left out of documents.
+_sparse        = None
+_sparse_report = [0, 0]
+
+
+def set_sparse(enabled=True, defaults=None):
+    """Leave parameters whose values equal renderer defaults out of XML
+       documents. Trees keep all parameters, so lookups and updates
+       work as before, only documents shrink (and load faster).
+
+    :parm enabled:  Turn sparse mode on or off (default True)
+    :parm defaults: Table of renderer defaults (default RENDERER_DEFAULTS
+                    of defaults.py, see there for its layout)
+    """
+    global _sparse
+    _sparse_report[:] = [0, 0]
+    if not enabled:
+        _sparse = None
+        return
+    if defaults is None:
+        from defaults import RENDERER_DEFAULTS as defaults
+
+    def comparable(parameters):
+        return dict([(name, comparable(value) if isinstance(value, dict) 
+            else _comparable(value)) for name, value in parameters.iteritems()])
+    _sparse = dict([(key, comparable(parameters)) 
+        for key, parameters in defaults.iteritems()])
+
+
+def sparse_report():
+    """Return (number of parameters, bytes) left out of documents since
+       sparse mode was set. Bytes don't count indentation, parameters 
+       rendered by other processes (see iterxml_parallel()) aren't counted.
+    """
+    return tuple(_sparse_report)
+
+
+def _comparable(value):
+    """Return value in a form equal for equal parameter values as the 
+       renderer reads them: 1, 1.0 and '1.0' or True and 'true'.
+    """
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, long, float)):
+        return (float(value),)
+    if isinstance(value, basestring):
+        words = value.split()
+        if len(words) == 1 and words[0].lower() in ('true', 'false'):
+            return words[0].lower()
+    else:
+        words = value
+    try:
+        return tuple(map(float, words)) or value
+    except (TypeError, ValueError):
+        return value
+
+
+def _sparse_defaults(node, defaults=None):
+    """Return renderer defaults of parameters of node: of its group 
+       (<parameters>) in defaults of the owner, or by its tag and model.
+    """
+    attrib = node._attrib
+    if defaults is not None and node.tag == 'parameters':
+        name  = attrib.get('name') if attrib else None
+        group = defaults.get(name, defaults.get('*'))
+        return group if isinstance(group, dict) else None
+    # Configurations are told apart by their base configurations.
+    model = attrib and attrib.get('model', attrib.get('base'))
+    return _sparse.get((node.tag, model or None))
+
+
+def _omit(node, defaults):
+    """Tell if node is a parameter with renderer default value, which
+       is counted as left out.
+    """
+    attrib = node._attrib
+    if node.tag != 'parameter' or not attrib or node._children:
+        return False
+    default = defaults.get(attrib.get('name'))
+    if default is None or isinstance(default, dict):
+        return False
+    value = attrib.get('value')
+    if value is None or _comparable(value) != default:
+        return False
+    keys = tuple(attrib)
+    head = node._xml_layouts.get(keys) or node._xml_layout(keys)
+    _sparse_report[0] += 1
+    _sparse_report[1] += len(head % tuple(attrib.itervalues())) + len(XMLTokens.end_tag)
+    return True
+
+
+def iterxml(element, pretty_print=True, indent=4, level=0, rendered=None):
+    """Render element and its children into XML document chunks.
+       Tree is traversed with an explicit stack of children iterators,
+       so the depth of a tree isn't limited by recursion limit.
+
+    :parm element:      Element to render
+    :parm pretty_print: print with new lines and tabs (default True)
+    :parm indent:       Indent for pretty print (default 4)
+    :parm level:        Initial indentation level (default 0)
+    :parm rendered:     Optional map id(subelement) -> callable returning
+                        already rendered subtree to be spliced into document.
+    :returns:           Generator of strings
+    """
+    new_line     = '\n' if pretty_print else ''
+    parent_end   = XMLTokens.parent_end_tag + new_line
+    end          = XMLTokens.end_tag + new_line
+    spaces       = []
+
+    def whitespace(level):
+        while len(spaces) <= level:
+            spaces.append(' ' * indent * len(spaces) if pretty_print else ' ')
+        return spaces[level]
+
+    def open_tag(node, wh, wh1):
+        # Text payload used to live among attributes, hence a separator
+        # is rendered for text-only elements too.
+        attrib = node._attrib
+        if attrib:
+            keys = tuple(attrib)
+            head = node._xml_layouts.get(keys) or node._xml_layout(keys)
+            if _format_floats:
+                head = head % _float_attributes(attrib)
+            else:
+                head = head % tuple(attrib.itervalues())
+        elif node._text is not None:
+            head = node._xml_layout(()) + ' '
+        else:
+            head = node._xml_layout(())
+
+        if node._text:
+            text = _format_text(node._text, new_line + wh1)
+            return ''.join((wh, head, parent_end, wh1, text, new_line, 
+                wh, node._xml_close, new_line))
+        if node._children:
+            return wh + head + parent_end
+        return wh + head + end
+
+    if element._deferred:
+        element._materialize()
+    yield open_tag(element, whitespace(level), whitespace(level+1))
+    if not element._children:
+        if element._deferred:
+            element._release_children()
+        return
+
+    # Renderer defaults of parameters of each parent in sparse mode
+    defaults = _sparse and _sparse_defaults(element)
+    stack = [(element, level, iter(element), defaults)]
+    while stack:
+        parent, level, children, defaults = stack[-1]
+        wh, wh1 = whitespace(level+1), whitespace(level+2)
+        for child in children:
+            if rendered and id(child) in rendered:
+                yield rendered[id(child)]()
+                continue
+            if defaults and _omit(child, defaults):
+                continue
+            if child._deferred:
+                child._materialize()
+            yield open_tag(child, wh, wh1)
+            if child._children:
+                stack.append((child, level+1, iter(child), 
+                    _sparse and _sparse_defaults(child, defaults)))
+                break
+            if child._deferred:
+                child._release_children()
+        else:
+            stack.pop()
+            # Elements with text payload are closed by open_tag()
+            if not parent._text:
+                yield whitespace(level) + parent._xml_close + new_line
+            if parent._deferred:
+                parent._release_children()
+
+
+PARALLEL_TAGS  = ('assembly',)
+_parallel_jobs = []
+
+
+def _render_job(index):
+    node, level, pretty_print, indent = _parallel_jobs[index]
+    return ''.join(iterxml(node, pretty_print, indent, level))
+
+
+def _find_subtrees(element, level, tags):
+    """Return list of (subelement, level) of outermost subelements 
+       with a tag from tags in document order."""
+    found = []
+    stack = [(iter(element), level+1)]
+    while stack:
+        children, level = stack[-1]
+        for child in children:
+            if child.tag in tags:
+                found.append((child, level))
+            elif child._children:
+                stack.append((iter(child), level+1))
+                break
+        else:
+            stack.pop()
+    return found
+
+
+def iterxml_parallel(element, pretty_print=True, indent=4, level=0, 
+    processes=None, tags=PARALLEL_TAGS):
+    """Same as iterxml(), but independent subtrees (assemblies by default)
+       are rendered by a pool of processes and spliced back in document 
+       order, so the output is identical to iterxml(). Workers are forked
+       and inherit the tree, thus only rendered chunks travel between
+       processes. Threads wouldn't help here as rendering holds the GIL.
+       Falls back to iterxml() on platforms without fork().
+
+    :parm processes: Size of the pool (default None, cpu count)
+    :parm tags:      Tags of subtrees rendered in parallel
+    :returns:        Generator of strings
+    """
+    global _parallel_jobs
+    jobs = _find_subtrees(element, level, tags) if element._children else []
+    if len(jobs) < 2 or not hasattr(os, 'fork'):
+        for chunk in iterxml(element, pretty_print, indent, level):
+            yield chunk
+        return
+
+    import multiprocessing
+    _parallel_jobs = [(node, node_level, pretty_print, indent) 
+        for node, node_level in jobs]
+    processes = processes or multiprocessing.cpu_count()
+    pool      = multiprocessing.Pool(processes)
+    try:
+        chunksize = max(1, len(jobs) // (processes * 4))
+        results   = pool.imap(_render_job, xrange(len(jobs)), chunksize)
+        rendered  = dict((id(node), results.next) for node, _ in jobs)
+        for chunk in iterxml(element, pretty_print, indent, level, rendered):
+            yield chunk
+    finally:
+        pool.terminate()
+        pool.join()
+        _parallel_jobs = []
+
+
+# JSON encoders, set up by first JSON document (see _json_setup()),
+# so json module isn't imported by XML export.
+_json_encode  = None
+_json_string  = None
+_json_heads   = {}
+_json_layouts = {}
+
+
+def _json_setup():
+    global _json_encode, _json_string
+    import json
+    _json_encode = json.JSONEncoder(separators=(',', ':')).encode
+    _json_string = json.encoder.encode_basestring_ascii
+
+
+def _json_value(value):
+    if type(value) is str:
+        return _json_string(value)
+    if isinstance(value, NumberList):
+        return _json_string(str(value))
+    return _json_encode(value)
+
+
+def _json_attrib(attrib):
+    # Objects are rendered from templates cached per attribute names.
+    keys   = tuple(attrib)
+    layout = _json_layouts.get(keys)
+    if layout is None:
+        layout = _json_layouts[keys] = '{%s}' % ','.join(
+            [_json_string(key).replace('%', '%%') + ':%s' for key in keys])
+    return layout % tuple(map(_json_value, attrib.itervalues()))
+
+
+def _json_text(text):
+    if text is None:
+        return 'null'
+    if isinstance(text, basestring):
+        return _json_encode(text)
+    if isinstance(text, array):
+        return _json_encode(text.tolist())
+    return _json_encode(list(text))
+
+
+def iterjson(element, indent=None, level=0):
+    """Render element and its children into JSON document chunks.
+       Every element is a list [tag, attributes, text, children],
+       numeric payloads are lists of numbers written with full
+       precision, so loader.fromjson() restores the tree exactly.
+
+    :parm element: Element to render
+    :parm indent:  Indent of nested elements, None for compact output
+    :parm level:   Initial indentation level (default 0)
+    :returns:      Generator of strings
+    """
+    if _json_encode is None:
+        _json_setup()
+    spaces = []
+
+    def whitespace(level):
+        if indent is None:
+            return ''
+        while len(spaces) <= level:
+            spaces.append('\n' + ' ' * indent * len(spaces))
+        return spaces[level]
+
+    def open_node(node, wh):
+        head = _json_heads.get(node.tag)
+        if head is None:
+            head = _json_heads[node.tag] = '[%s,' % _json_encode(node.tag)
+        attrib = _json_attrib(node._attrib) if node._attrib else '{}'
+        text   = 'null' if node._text is None else _json_text(node._text)
+        if node._children:
+            return ''.join((wh, head, attrib, ',', text, ',['))
+        return ''.join((wh, head, attrib, ',', text, ',[]]'))
+
+    if element._deferred:
+        element._materialize()
+    yield open_node(element, whitespace(level))
+    if not element._children:
+        if element._deferred:
+            element._release_children()
+        return
+
+    # Non-empty children lists always have live children, thus
+    # a sibling separator is needed on any but first visit of a level.
+    stack = [[element, level, iter(element), '']]
+    while stack:
+        entry = stack[-1]
+        parent, level, children, separator = entry
+        entry[3] = ','
+        wh = whitespace(level+1)
+        for child in children:
+            if child._deferred:
+                child._materialize()
+            yield separator + open_node(child, wh)
+            separator = ','
+            if child._children:
+                stack.append([child, level+1, iter(child), ''])
+                break
+            if child._deferred:
+                child._release_children()
+        else:
+            stack.pop()
+            yield whitespace(level) + ']]'
+            if parent._deferred:
+                parent._release_children()
+
+
+def tojson(element, indent=None):
+    """Render element to string with JSON document. """
+    return ''.join(iterjson(element, indent))
+
+
+def write_json(element, fileio, indent=None, level=0, buffer_size=BUFFER_SIZE):
+    """Stream JSON document of element into a file (see write()).
+
+    :parm element:     Element to render
+    :parm fileio:      Writeable file-like object or file descriptor
+    :parm indent:      Indent of nested elements, None for compact output
+    :parm level:       Initial indentation level (default 0)
+    :parm buffer_size: Number of characters collected before single write.
+    :returns:          fileio object
+    """
+    return _write_chunks(iterjson(element, indent, level), fileio, buffer_size)
+
 
-class Element(OrderedDict):
+def _node_digest(node, volatile):
+    if node._deferred:
+        node._materialize()
+    parts  = [node.tag]
+    attrib = node._attrib
+    if attrib:
+        parts += ['\0%s=%s' % (key, attrib[key]) for key in sorted(attrib)]
+    text = node._text
+    if text is None:
+        pass
+    elif isinstance(text, basestring):
+        parts += ('\1', text)
+    elif isinstance(text, array):
+        parts += ('\1', text.tostring())
+    else:
+        parts += ('\1', repr(list(text)))
+    if node._children:
+        parts.append('\2')
+        parts += [child._digest or volatile[id(child)] for child in node._live()]
+    return sha1(''.join(parts)).hexdigest()
+
+
+def _update_digests(element):
+    """Compute missing digests of element subtree, children first, and
+       return digest of element. Children added to another parent keep
+       only the last one (see Element._alias()), so their changes can't
+       invalidate digests of earlier parents. Digests of such parents and
+       of their ancestors are computed every time instead of cached.
+    """
+    volatile = {}
+    stack    = [(element, iter(element._live()))]
+    while stack:
+        node, children = stack[-1]
+        for child in children:
+            if child._digest is not None or id(child) in volatile:
+                continue
+            if child._children:
+                stack.append((child, iter(child._live())))
+                break
+            child._digest = _node_digest(child, volatile)
+        else:
+            stack.pop()
+            digest = _node_digest(node, volatile)
+            if _ALIASED in (node._names or ()) or volatile and \
+                any(id(child) in volatile for child in node._live()):
+                volatile[id(node)] = digest
+            else:
+                node._digest = digest
+    return digest
+
+
+class ElementType(type):
+    """Metaclass of Element. Interns lowercase class name as a tag once
+       per class and keeps subclasses slotted, so that (possibly millions of)
+       instances don't carry their own __dict__.
+    """
+    def __new__(mcs, name, bases, attrs):
+        attrs.setdefault('__slots__', ())
+        tag = attrs.setdefault('tag', intern(name.lower()))
+        # Serialization templates, see Element._xml_layout()
+        attrs['_xml_layouts'] = {}
+        attrs['_xml_close']   = XMLTokens.parent_start_tag + tag + XMLTokens.parent_end_tag
+        return super(ElementType, mcs).__new__(mcs, name, bases, attrs)
+
+
+class Element(object):
     """Minimal implementation of xml.ElementTree API
-       based on Python native dictionary.
+       based on compact, slotted nodes: attributes are kept 
+       in a plain dictionary created on demand, text payload
+       in its own slot and children in a single ordered sequence.
+
+       Every parent keeps a name->child index of its children, and
+       every child remembers its parent and position, so lookups by 
+       name and removals don't scan siblings. Removed children leave
+       a hole which is compacted on next read of the sequence. Parents
+       holding children appended to other parents since look them up by
+       name with a scan, as only the last parent follows their renames.
+
+       Content hashes of subtrees (see digest) are cached in nodes
+       and invalidated on the way up to the root by set(), append()
+       and remove(), so a change only rehashes its ancestors.
+
+       Subtrees frozen with freeze() are immutable and can be shared by
+       many parents, hence they don't point back to any of them. Parent
+       replaces a shared child with its private copy before changing 
+       it (see unshare()).
+
+       Changes of elements can be recorded by a DirtyTracker, so that
+       consumers visit only changed subtrees.
     """
+    __metaclass__   = ElementType
+    __slots__       = ('_attrib', '_text', '_children', '_parent', 
+                       '_pos', '_holes', '_names', '_digest')
+    __hash__        = None
     attribute_token = '@attrib'
+    _deferred       = False
+    _shared         = False
     
     def __init__(self, name=None, **kwargs):
         """Init object with attribs from kwargs."""
-        super(Element, self).__init__()
-
-        self[self.attribute_token] = {}
+        self._attrib   = None
+        self._text     = None
+        self._children = ()
+        self._parent   = None
+        self._pos      = 0
+        self._holes    = 0
+        self._names    = None
+        self._digest   = None
 
         if name:
             self.attributes['name'] = name
@@ -49,37 +660,89 @@ class Element(OrderedDict):
                 elif HAPS_DEBUG:
                     raise Exception('Attribute "%s" \
                         not present on object %s' % ('name', v))
-            self[self.attribute_token][k] = v
+            self.set(k, v)
 
     def __iter__(self):
-        for key, values in [(k, self[k]) for k \
-            in super(Element, self).__iter__()]:
-            if key == self.attribute_token:
-                continue
-            for v in values:
-                yield v
+        return iter(self._live())
+
+    def __len__(self):
+        return len(self._children) - self._holes
+
+    def __nonzero__(self):
+        # Childless elements are still valid objects.
+        return True
+
+    def __getitem__(self, key):
+        """Backward compatible mapping access: attributes map
+           or list of children of type 'key'.
+        """
+        if key == self.attribute_token:
+            return self.attributes
+        children = self.findall(key)
+        if not children:
+            raise KeyError(key)
+        return children
+
+    def __eq__(self, other):
+        if not isinstance(other, Element):
+            return NotImplemented
+        return self.tag == other.tag \
+            and (self._attrib or {}) == (other._attrib or {}) \
+            and self._text == other._text \
+            and list(self._live()) == list(other._live())
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
 
     def __repr__(self):
-        return super(Element, self).__repr__()
+        return '<%s %s at %#x>' % (type(self).__name__, self._attrib or {}, id(self))
 
-    @property
-    def attributes(self):
-        return self[self.attribute_token]
+    def __deepcopy__(self, memo):
+        # Parent isn't part of the copy (see clone()).
+        return self.clone()
+
+    def __reduce__(self):
+        # Pickled without parent, as an element of its tag class, since 
+        # subclasses made by freeze() and deferred() aren't module 
+        # attributes. Deferred content is produced first.
+        cls    = _base_class(type(self))
+        module = sys.modules.get(cls.__module__)
+        if getattr(module, cls.__name__, None) is not cls:
+            # Classes of unknown tags made by loader.
+            cls = cls.tag
+        return _unpickle, (cls, self._shared, self._attrib, self._text, 
+            list(self._live()))
 
     @property
-    def tag(self):
-        return type(self).__name__.lower()
+    def attributes(self):
+        if self._attrib is None:
+            self._attrib = {}
+        return self._attrib
 
     @property 
     def text(self):
-        if 'text' in self[self.attribute_token]:
-            return self[self.attribute_token]['text']
+        if self._text is not None:
+            return self._text
         return ''
 
     @property
     def data(self):
         return self.text
 
+    @property
+    def digest(self):
+        """Hex SHA1 of element tag, attributes, text and children digests.
+           Equal subtrees have equal digests regardless of attribute
+           order. Attributes are hashed as written, so 27 and '27' 
+           are the same. Digests are cached until a subtree changes.
+        """
+        if self._digest is None:
+            return _update_digests(self)
+        return self._digest
+
     def append(self, obj):
         """Add child element to current parent.
 
@@ -87,24 +750,143 @@ class Element(OrderedDict):
         :return: self 
         """
         # We allow to pass Nones here:
-        if obj == None: return self
+        if obj is None: return self
 
         assert(isinstance(obj, Element))
-        typename = type(obj).__name__.lower()
-
-        if typename in self: 
-            self[typename] += [obj]
-        else: 
-            self[typename] = [obj]
+        if self._shared:
+            raise Exception('Shared element <%s> is immutable, see unshare()' % self.tag)
+        global _changes
+        _changes += 1
+        if not self._children:
+            self._children = []
+        if not obj._shared:
+            if obj._parent is not None and obj._parent is not self:
+                obj._parent._alias()
+            obj._parent = self
+            obj._pos    = len(self._children)
+        self._children.append(obj)
+        self._index(obj, obj.get('name', False))
+        if self._digest is not None:
+            self._invalidate()
+        if _trackers:
+            _mark(self)
         return self
 
+    def clone(self, name=None, names=None):
+        """Return copy of element subtree detached from its parent. 
+           Text payloads are shared with the source (set() replaces 
+           them, never changes them in place), shared subtrees (see 
+           freeze()) are reused unless their names are remapped. Content
+           of deferred elements (see deferred()) is produced and copied
+           into plain elements of their class.
+
+        :parm name:  New name of the copy (default same name)
+        :parm names: Optional map of old -> new names. String attributes
+                     of subtree elements (names and references to them)
+                     equal to a key are replaced. Renaming of the root
+                     is added to the map.
+        :returns:    Root element of the copy
+        """
+        if names is not None and name is not None and self.get('name', False):
+            names = dict(names)
+            names.setdefault(self.get('name'), name)
+
+        def attributes(node):
+            attrib = node._attrib
+            if not attrib or not names:
+                return attrib, False
+            for value in attrib.itervalues():
+                if isinstance(value, basestring) and value in names:
+                    break
+            else:
+                return attrib, False
+            return dict([(key, names.get(value, value) 
+                if isinstance(value, basestring) else value)
+                for key, value in attrib.iteritems()]), True
+
+        def build(source, attrib, children):
+            cls  = _base_class(type(source))
+            node = cls.__new__(cls)
+            Element.__init__(node)
+            if attrib:
+                node._attrib = dict(attrib)
+            node._text = source._text
+            for index, child in enumerate(children):
+                if not child._shared:
+                    child._parent = node
+                    child._pos    = index
+                node._index(child, child.get('name', False))
+            if children:
+                node._children = children
+            return node
+
+        # Post-order walk: a shared node is reused when neither its
+        # attributes nor any of its descendants change.
+        root  = None
+        stack = [(self, iter(self._live()), [])]
+        while stack:
+            source, children, copies = stack[-1]
+            for child in children:
+                if child._shared and not names:
+                    copies.append(child)
+                elif child._children:
+                    stack.append((child, iter(child._live()), []))
+                    break
+                else:
+                    attrib, renamed = attributes(child)
+                    if child._shared and not renamed:
+                        copies.append(child)
+                    else:
+                        copies.append(build(child, attrib, []))
+            else:
+                stack.pop()
+                attrib, renamed = attributes(source)
+                if source._shared and not renamed and stack and all(
+                    [copy is original for copy, original in zip(copies, source._live())]):
+                    node = source
+                else:
+                    node = build(source, attrib, copies)
+                if stack:
+                    stack[-1][2].append(node)
+                else:
+                    root = node
+
+        if name is not None:
+            root.set('name', name)
+        return root
+
     def extend(self, objs):
-        """Extends element with collection of subelements.
+        """Extends element with collection of subelements. Same as 
+           append() of each of them, but element and its ancestors are 
+           invalidated once per call.
 
         :parm objs:   list of elements iof type HapsObj to be added as children. 
         :returns:      self
         """
-        [self.append(x) for x in objs]
+        objs = [obj for obj in objs if obj is not None]
+        if not objs:
+            return self
+        if self._shared:
+            raise Exception('Shared element <%s> is immutable, see unshare()' % self.tag)
+        global _changes
+        _changes += 1
+        if not self._children:
+            self._children = []
+        children = self._children
+        index    = self._index
+        for obj in objs:
+            assert(isinstance(obj, Element))
+            if not obj._shared:
+                if obj._parent is not None and obj._parent is not self:
+                    obj._parent._alias()
+                obj._parent = self
+                obj._pos    = len(children)
+            children.append(obj)
+            index(obj, obj.get('name', False))
+        if self._digest is not None:
+            self._invalidate()
+        if _trackers:
+            _mark(self)
         return self
 
     def get(self, attribute, raise_on_fail=True):
@@ -114,8 +896,10 @@ class Element(OrderedDict):
         :parm raise_on_fail: If True nonexsting attribute query will raise an Exception
         :returns:            Attribute value or None (with raise_on_fail=False)
         """
-        if attribute in self.attributes:
-            return self[self.attribute_token][attribute]
+        if attribute == 'text' and self._text is not None:
+            return self._text
+        if self._attrib and attribute in self._attrib:
+            return self._attrib[attribute]
         elif raise_on_fail:
             raise Exception('Attribute "%s" not present on object %s' % (attribute, self))
         return None
@@ -128,107 +912,550 @@ class Element(OrderedDict):
         :parm tag: the name of the type of element type to be returned.
         "returns : First child of type 'tag'.
         """
-        if tag in self and tag != self.attribute_token:
-            if len(self[tag]):
-                return self[tag] if _all else self[tag][0]
+        if _all:
+            return self.findall(tag) or None
+        for child in self._live():
+            if child.tag == tag:
+                return child
         return None
 
     def findall(self, tag):
         """Find all children elements of a given type (tag).
         :parm tag: the name of the type of elements to be returned.
         """
-        children = self.find(tag, _all=True)
-        if children:
-            return children
-        return []
+        return [child for child in self._live() if child.tag == tag]
 
     def remove(self, obj):
         """Remove element from a children list."""
-        typename = type(obj).__name__.lower()
-        assert(obj in self[typename])
-        index = self[typename].index(obj)
-        return self[typename].pop(index)
+        if self._shared:
+            raise Exception('Shared element <%s> is immutable, see unshare()' % self.tag)
+        children = self._children
+        index    = obj._pos
+        if obj._parent is not self or index >= len(children) \
+            or children[index] is not obj:
+            # Element shared between parents, search for it.
+            live  = self._live()
+            index = next((i for i, child in enumerate(live) if child is obj), None)
+            if index is None:
+                assert(obj in live)
+                index = live.index(obj)
+                obj   = live[index]
+            children = live
+
+        global _changes
+        _changes += 1
+        children[index] = None
+        self._holes    += 1
+        self._unindex(obj, obj.get('name', False))
+        if obj._parent is self:
+            obj._parent = None
+        if self._digest is not None:
+            self._invalidate()
+        if _trackers:
+            _mark(self)
+        if self._holes > len(children) // 2:
+            self._live()
+        return obj
 
     def keys(self):
-        """Return a list of attributes of the element."""
-        return [key for key in super(Element, self).keys() \
-            if key != self.attribute_token]
+        """Return a list of children elements."""
+        return list(self._live())
+
+    def replace(self, old, new):
+        """Put element 'new' in place of child 'old'.
+
+        :parm old: Child element to be replaced
+        :parm new: Element taking its position
+        :returns:  new
+        """
+        if self._shared:
+            raise Exception('Shared element <%s> is immutable, see unshare()' % self.tag)
+        live  = self._live()
+        index = old._pos
+        if old._parent is not self or index >= len(live) or live[index] is not old:
+            index = next(i for i, child in enumerate(live) if child is old)
+        global _changes
+        _changes += 1
+        live[index] = new
+        self._unindex(old, old.get('name', False))
+        self._index(new, new.get('name', False))
+        if old._parent is self:
+            old._parent = None
+        if not new._shared:
+            if new._parent is not None and new._parent is not self:
+                new._parent._alias()
+            new._parent = self
+            new._pos    = index
+        if self._digest is not None:
+            self._invalidate()
+        if _trackers:
+            _mark(self)
+        return new
+
+    def thaw(self):
+        """Return self, or a private copy of a shared element (see clone()).
+           Children of the copy are still shared.
+        """
+        if not self._shared:
+            return self
+        node = self.clone()
+        node._digest = self._digest
+        return node
+
+    def unshare(self, child):
+        """Return child ready for changes, replacing it with its 
+           private copy (see thaw()) if it's shared. The copy is equal
+           to the child, so digests and trackers aren't affected.
+        """
+        if not child._shared:
+            return child
+        if self._shared:
+            raise Exception('Shared element <%s> is immutable, see unshare()' % self.tag)
+        live  = self._live()
+        index = next(i for i, sibling in enumerate(live) if sibling is child)
+        name  = child.get('name', False)
+        copy  = child.thaw()
+        global _changes
+        _changes += 1
+        live[index] = copy
+        self._unindex(child, name)
+        self._index(copy, name)
+        copy._parent = self
+        copy._pos    = index
+        return copy
+
+    def _named(self, name):
+        """Return a list of children named 'name' (in document order)."""
+        names = self._names
+        try:
+            children = names.get(name) if names else None
+        except TypeError:
+            # Unhashable names are never indexed.
+            return []
+        if names and _ALIASED in names:
+            # Index of parent sharing children with others can't be trusted.
+            if name is None or name is False:
+                return []
+            return [child for child in self._live() if child.get('name', False) == name]
+        if children is None:
+            return []
+        if type(children) is list:
+            return list(children)
+        return [children]
+
+    @classmethod
+    def _xml_layout(cls, keys):
+        """Return open tag template with attributes 'keys' to be filled 
+           with attribute values. Templates are built once per class and
+           attributes layout.
+        """
+        layout = cls._xml_layouts.get(keys)
+        if layout is None:
+            layout = XMLTokens.start_tag + cls.tag
+            if keys:
+                layout += ' ' + ' '.join(['%s="%%s"' % str(key).replace('%', '%%') 
+                    for key in keys])
+            cls._xml_layouts[keys] = layout
+        return layout
+
+    def _live(self):
+        """Return children sequence with holes left by remove() compacted."""
+        if self._holes:
+            children = [child for child in self._children if child is not None]
+            for index, child in enumerate(children):
+                if child._parent is self:
+                    child._pos = index
+            self._children = children
+            self._holes    = 0
+        return self._children
+
+    def _invalidate(self):
+        """Drop cached digests of self and its ancestors. Parents are 
+           hashed after children, so the walk stops at first node 
+           without a digest.
+        """
+        node = self
+        while node is not None and node._digest is not None:
+            node._digest = None
+            node = node._parent
+
+    def _touch(self):
+        """Account for a change made without set(), append() or remove():
+           drop cached digests and mark element changed for trackers.
+        """
+        if self._digest is not None:
+            self._invalidate()
+        if _trackers:
+            _mark(self)
+
+    def _alias(self):
+        """Mark name index as not kept up to date with names of children,
+           which are renamed through their last parent only (see set()).
+           Digests aren't cached from now on either (see digest()).
+        """
+        if self._digest is not None:
+            self._invalidate()
+        if self._names is None:
+            self._names = {}
+        self._names[_ALIASED] = True
+
+    def _index(self, child, name):
+        if type(name) is not str and (name is None or name is False
+            or not isinstance(name, collections.Hashable)):
+            return
+        if self._names is None:
+            self._names = {}
+        entry = self._names.get(name)
+        if entry is None:
+            self._names[name] = child
+        elif type(entry) is list:
+            entry.append(child)
+        else:
+            self._names[name] = [entry, child]
+
+    def _unindex(self, child, name):
+        if not self._names or type(name) is not str and \
+            not isinstance(name, collections.Hashable) or name not in self._names:
+            return
+        entry = self._names[name]
+        if type(entry) is not list:
+            if entry is child:
+                del self._names[name]
+            return
+        entry[:] = [sibling for sibling in entry if sibling is not child]
+        if len(entry) == 1:
+            self._names[name] = entry[0]
 
     def set(self, key, value):
         """Sets a value of the attribute. """
-        if not self.attribute_token in self:
-            self[self.attribute_token] = {}
-        self[self.attribute_token][key] = value
-
-    def tojson(self, indent=2):
-        """Return json representation of current element."""
-        from json import dumps
-        # return dumps(self, indent=indent)
-        encoder = OrderedJsonEncoder()
-        return encoder.encode(self)
-
-    def toxml(self, fileio, pretty_print=True, indent=4, _level=0):
+        if self._shared:
+            raise Exception('Shared element <%s> is immutable, see unshare()' % self.tag)
+        if self._digest is not None:
+            self._invalidate()
+        if _trackers:
+            _mark(self)
+        if key == 'text':
+            self._text = value
+            return
+        if key == 'name':
+            global _changes
+            _changes += 1
+            if self._parent is not None:
+                self._parent._unindex(self, self.get('name', False))
+                self._parent._index(self, value)
+        self.attributes[key] = value
+
+    def tojson(self, indent=None):
+        """Return JSON representation of current element (see iterjson()).
+
+        :parm indent: Indent of nested elements, None for compact output
+        :returns:     JSON document string
+        """
+        return tojson(self, indent)
+
+    def toxml(self, fileio, pretty_print=True, indent=4, _level=0, processes=1):
         """Render element and its children into XML document.
 
         :parm fileio:       Writeable file-like object (file object, StringIO, sys.stdout etc)
+                            or a file descriptor.
         :parm pretty_print: print with new lines and tabs (default True)
         :parm indent:       Initial indent for pretty print (defualt 0)
+        :parm processes:    Number of processes rendering assemblies (default 1)
         :returns:           fileio object
         """
-        def whitespace(level, indent=4, whs=' ', pprint=True):
-            if pretty_print:
-                return whs * indent * level
-            return whs
+        return write(self, fileio, pretty_print, indent, _level, processes=processes)
 
-        def trim_lines(items, length=4, lines=[]):
-            lines += [' '.join(map(str, items[start:start+length])) 
-                for start in range(0, len(items), length)]
-            return lines
 
-        def _attributes_to_string():
-            attributes_map = ['{}="{}"'.format(k,v) for k,v in self.attributes.items()
-                if k != 'text'] 
-            return ' ' + ' '.join(attributes_map)
+def _mark(node):
+    for tracker in _trackers:
+        tracker._mark(node)
 
-        attributes = _attributes_to_string() if self.attributes else ''
-        new_line   = '' if not pretty_print else '\n'
-        pp = pretty_print
 
-    
-        if not list(self) and not self.text:
-            etag = XMLTokens.end_tag
-        else:
-            etag = XMLTokens.parent_end_tag
+class DirtyTracker(object):
+    """Record of elements changed by set(), append(), extend(), remove()
+       and replace() since last checkpoint. Changed elements and their
+       ancestors are dirty, so consumers (serializers, caches, IPR) 
+       descend only into dirty subtrees to find changes (see walk()).
+       Marking stops at the first dirty ancestor, so further changes of
+       a dirty subtree cost little. Tracker records changes of all trees
+       while started.
+
+    :example:
+              tracker = DirtyTracker().start()
+              ...
+              for element in tracker.walk(project):
+                  send(element)
+              tracker.checkpoint()
+    """
+    def __init__(self):
+        self._changed = {}   # id -> changed element
+        self._dirty   = {}   # id -> changed element or its ancestor
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        """Start recording changes."""
+        if self not in _trackers:
+            _trackers.append(self)
+        return self
+
+    def stop(self):
+        """Stop recording changes, recorded ones are kept."""
+        if self in _trackers:
+            _trackers.remove(self)
+        return self
+
+    @property
+    def changed(self):
+        """List of elements changed since last checkpoint."""
+        return self._changed.values()
+
+    def is_changed(self, element):
+        return id(element) in self._changed
+
+    def is_dirty(self, element):
+        """True if element or any of its descendants changed."""
+        return id(element) in self._dirty
+
+    def checkpoint(self):
+        """Forget recorded changes.
+
+        :returns: List of elements changed since previous checkpoint
+        """
+        changed = self.changed
+        self._changed = {}
+        self._dirty   = {}
+        return changed
+
+    def walk(self, root):
+        """Yield changed elements of root's subtree in document order,
+           visiting only dirty subtrees.
+        """
+        dirty = self._dirty
+        stack = [root] if id(root) in dirty else []
+        while stack:
+            node = stack.pop()
+            if id(node) in self._changed:
+                yield node
+            if node._deferred and node._pending:
+                continue
+            stack.extend([child for child in reversed(node._live())
+                if id(child) in dirty])
+
+    def _mark(self, node):
+        self._changed[id(node)] = node
+        dirty = self._dirty
+        while node is not None and id(node) not in dirty:
+            dirty[id(node)] = node
+            node = node._parent
+
+
+def _base_class(cls):
+    """Return 'cls' or the class it was generated from by freeze(), 
+       deferred() or lazy loading (see loader.py), which instances are
+       plain elements of the same tag.
+    """
+    while cls.__dict__.get('_generated'):
+        cls = cls.__bases__[0]
+    return cls
+
+
+def _hook_class(cls, prefix, pending, materialize, attrs):
+    """Return subclass of 'cls' which calls materialize(element) on first
+       access to children of its element (or to their names) while the
+       'pending' attribute of the element is set. Base of deferred() stubs
+       and lazily loaded elements (see loader.py).
 
-        text  = ''
-        if self.text:
-            text = '{}{}'.format(new_line, whitespace(_level+1, indent=indent, pprint=pp))
-            text = text.join(trim_lines(self.text, length=4))
-            text = XMLTokens.text_template.format(wh=whitespace(_level+1, indent=indent, pprint=pp), 
-                text=text, start=XMLTokens.parent_start_tag, wh2=whitespace(_level, indent=indent, pprint=pp),
-                tag=self.tag, end=XMLTokens.parent_end_tag, nl=new_line)
+    :parm cls:         Element class
+    :parm prefix:      Prefix of subclass name
+    :parm pending:     Name of attribute set while content isn't produced
+    :parm materialize: Function producing content of an element
+    :parm attrs:       Other attributes of subclass (like __slots__)
+    """
+    children = Element._children
+    names    = Element._names
+
+    def get_children(self):
+        if getattr(self, pending, None):
+            materialize(self)
+        return children.__get__(self)
+
+    def get_names(self):
+        if getattr(self, pending, None):
+            materialize(self)
+        return names.__get__(self)
+
+    attrs = dict(attrs)
+    attrs.update({
+        'tag':        cls.tag,
+        '_children':  property(get_children, children.__set__),
+        '_names':     property(get_names, names.__set__),
+        '_generated': True,
+        })
+    return type(prefix + cls.__name__, (cls,), attrs)
+
+
+def _deferred_class(cls):
+    """Return subclass of 'cls' which children are produced by a factory
+       on first access to them (see deferred()).
+    """
+    children = Element._children
+    names    = Element._names
 
-        xml_token = XMLTokens.element_template.format(wh=whitespace(_level, indent=indent, pprint=pp),
-            start=XMLTokens.start_tag, tag=self.tag, attrib=attributes, end=etag, 
-            text=text, nl=new_line)
+    def materialize(self):
+        if not getattr(self, '_pending', False):
+            return
+        global _changes
+        _changes += 1
+        self._pending = False
+        element = self._factory()
+        assert(isinstance(element, Element))
+        # Attributes of the stub (like its name) take precedence.
+        if element._attrib:
+            attrib = dict(element._attrib)
+            attrib.update(self._attrib or {})
+            self._attrib = attrib
+        self._text = element._text
+        live = element._live()
+        for index, child in enumerate(live):
+            if not child._shared:
+                child._parent = self
+                child._pos    = index
+        children.__set__(self, live)
+        names.__set__(self, element._names)
+        element._children = ()
+        element._names    = None
 
-        # Open tag
-        fileio.write(xml_token)
-        
-        for child in self:
-            # FIXME: Bug is here:
-            if isinstance(child, Element):
-                child.toxml(fileio, pretty_print=pp, indent=indent, _level=_level+1)
+    def release(self):
+        if not self._release or getattr(self, '_pending', True):
+            return
+        global _changes
+        _changes += 1
+        children.__set__(self, ())
+        names.__set__(self, None)
+        self._text    = None
+        self._holes   = 0
+        self._pending = True
 
-        if etag == XMLTokens.parent_end_tag and not self.text:
-            xml_token = XMLTokens.element_template.format(wh=whitespace(_level, indent=indent, pprint=pp),
-                start=XMLTokens.parent_start_tag, tag=self.tag, end=XMLTokens.parent_end_tag, attrib='',
-                text='', nl=new_line)
-            # Close tag
-            fileio.write(xml_token)
+    return _hook_class(cls, 'Deferred', '_pending', materialize, {
+        '__slots__':    ('_factory', '_release', '_pending'),
+        '_deferred':    True,
+        '_materialize': materialize,
+        '_release_children': release,
+        })
 
-        return fileio
 
+_deferred_classes = {}
 
 
+def deferred(cls, factory, name=None, release=False, **kwargs):
+    """Create a stub element of class 'cls' which content is made by 
+       factory only when needed: by serializers or on first access to 
+       its children. Stub has the tag and attributes of a real element,
+       so parents find it by name and tag without calling the factory.
 
+    :parm cls:      Element class of the stub (like haps.Assembly)
+    :parm factory:  Callable returning an element of the same kind. Its
+                    attributes, text and children are moved into the stub.
+    :parm name:     Name of the stub
+    :parm release:  Drop produced content once written by iterxml() or
+                    iterjson(), so the factory is called again when 
+                    needed (default False)
+    :parm kwargs:   Other attributes of the stub
+    :returns:       Stub element
+    """
+    if cls not in _deferred_classes:
+        _deferred_classes[cls] = _deferred_class(cls)
+    node = _deferred_classes[cls].__new__(_deferred_classes[cls])
+    Element.__init__(node, name, **kwargs)
+    node._factory = factory
+    node._release = release
+    node._pending = True
+    return node
+
+
+def _shared_class(cls):
+    """Return subclass of 'cls' of immutable shared elements."""
+    return type('Shared' + cls.__name__, (cls,), {
+        '__slots__':  (),
+        'tag':        cls.tag,
+        '_shared':    True,
+        '_private':   cls,
+        '_generated': True,
+        })
+
+
+def _unpickle(cls, shared, attrib, text, children):
+    """Rebuild pickled element (see Element.__reduce__())."""
+    if isinstance(cls, str):
+        from loader import element_class
+        cls = element_class(cls)
+    if shared:
+        if cls not in _shared_classes:
+            _shared_classes[cls] = _shared_class(cls)
+        cls = _shared_classes[cls]
+    node = cls.__new__(cls)
+    Element.__init__(node)
+    node._attrib = attrib
+    node._text   = text
+    for index, child in enumerate(children):
+        if child._shared:
+            pass
+        elif child._parent is None:
+            child._parent = node
+            child._pos    = index
+        elif child._parent is not node:
+            # Shallow copies (copy.copy()) share children with source.
+            node._alias()
+        node._index(child, child.get('name', False))
+    if children:
+        node._children = children
+    return node
+
+
+_shared_classes = {}
+
+
+def freeze(element):
+    """Return immutable copy of element subtree, which can be added to
+       many parents at once. Shared elements of the subtree are reused,
+       elements of the copy share text payloads of the source.
+
+    :parm element: Root of the subtree
+    :returns:      Shared root element
+    """
+    def shared(node):
+        if node._shared:
+            return node
+        if node._deferred:
+            node._materialize()
+        cls = _base_class(type(node))
+        if cls not in _shared_classes:
+            _shared_classes[cls] = _shared_class(cls)
+        duplicate = _shared_classes[cls].__new__(_shared_classes[cls])
+        Element.__init__(duplicate)
+        if node._attrib:
+            duplicate._attrib = dict(node._attrib)
+        duplicate._text = node._text
+        return duplicate
+
+    root  = shared(element)
+    stack = [(element, root)] if root is not element else []
+    while stack:
+        source, target = stack.pop()
+        children = []
+        for child in source._live():
+            duplicate = shared(child)
+            children.append(duplicate)
+            if duplicate is not child and child._children:
+                stack.append((child, duplicate))
+        # Shared elements can't be appended to.
+        for child in children:
+            target._index(child, child.get('name', False))
+        if children:
+            target._children = children
+    return root
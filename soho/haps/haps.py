@@ -1,24 +1,77 @@
 import collections, types
-import logging, sys, os
+import logging
 from collections import defaultdict
+from array import array
 
-if os.getenv("HAPS_USE_ELEMENTTREE", None):
-    from xml.etree.ElementTree import Element, tostring
-else:
-    from etree_impl import Element, tostring
+from etree_impl import Element
+from etree_impl import set_precision, format_number, format_numbers, write_json, deferred
+from etree_impl import freeze, DirtyTracker, set_sparse, sparse_report, NumberList
+# Serialization is done by a backend selected at runtime (see backends.py)
+from backends import tostring, write, get_backend, set_backend, register_backend
 
-
-logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 FORMAT_REVISION = 27
 
+class NumericPayload(array):
+    """Compact array of doubles holding numeric text of HapsVal 
+       objects (matrices, colors etc). Compares equal to any sequence
+       of the same numbers.
+    """
+    __hash__ = None
+
+    def __new__(cls, values):
+        return super(NumericPayload, cls).__new__(cls, 'd', values)
+
+    def __reduce__(self):
+        return NumericPayload, (self.tolist(),)
+
+    def __eq__(self, other):
+        if isinstance(other, (array, list, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+
 class HapsVal(Element):
     def __init__(self, values):
         super(HapsVal, self).__init__()
+        if isinstance(values, collections.Iterable) \
+            and not isinstance(values, types.StringTypes):
+            try:
+                values = NumericPayload(values)
+            except (TypeError, ValueError):
+                pass
         self.set('text', values)
 
 
+# Shared parameters of add_parms() by the list of parameters. Exporters
+# share constant lists, but lists with varying values would make a new
+# entry each, so the cache is dropped once it holds SHARED_PARMS_LIMIT
+# lists (and by reset()). Parameters already shared stay valid.
+SHARED_PARMS_LIMIT = 1024
+_shared_parms = {}
+
+# Parameter class of tags.py, which imports this module, hence resolved
+# by first add_parms() call.
+_Parameter = None
+
+
+def reset():
+    """Restore default precision (see set_precision()), turn sparse mode 
+       off and drop cached shared parameters. Modules outlive a render in 
+       Houdini session, so exporters call it before every render.
+    """
+    set_precision()
+    set_sparse(False)
+    _shared_parms.clear()
+
+
 class HapsObj(Element):
     """Element object which maps to all XML elements except elmenents
     consisting with only text (numeric). It uses etree compilant implementation
@@ -44,15 +97,42 @@ class HapsObj(Element):
     def tostring(self, pretty_print=True):
         return tostring(self, pretty_print)
 
-    def add_parms(self, parms):
+    def toxml(self, fileio, pretty_print=True, indent=4, _level=0, processes=1):
+        """Render element and its children into XML document with 
+           current serialization backend (see Element.toxml()).
+        """
+        return write(self, fileio, pretty_print, indent, _level, processes=processes)
+
+    def add_parms(self, parms, shared=False):
         """Constructs & appends a parameters objects 
            from provided list of tuples suitable for parm's initalization.
 
-           :parm parms: List of tuples [(str name, str value), (...,...)]
-           :returns:    self
+           :parm parms:  List of tuples [(str name, str value), (...,...)]
+           :parm shared: Append immutable parameters shared by all objects
+                         created with the same list (see etree_impl.freeze()),
+                         which are copied only when changed (default False)
+           :returns:     self
         """
-        from tags import Parameter
+        global _Parameter
+        if _Parameter is None:
+            from tags import Parameter as _Parameter
+        Parameter = _Parameter
         assert isinstance(parms, collections.Iterable)
+        if shared:
+            # Values are rendered as they are, so True, 1 and 1.0 differ.
+            parms = tuple(parms)
+            key   = (parms, tuple([tuple(map(type, parm)) for parm in parms]))
+            try:
+                block = _shared_parms.get(key)
+            except TypeError:
+                # Unhashable values, like lists, can't be looked up.
+                return self.add_parms(parms)
+            if block is None:
+                if len(_shared_parms) >= SHARED_PARMS_LIMIT:
+                    _shared_parms.clear()
+                block = _shared_parms[key] = [freeze(Parameter(parm[0], parm[1])) 
+                    for parm in parms if len(parm) == 2 and isinstance(parm[0], str)]
+            return self.extend(block)
         [self.append(Parameter(parm[0], parm[1])) for parm in parms\
              if len(parm) == 2 and isinstance(parm[0], str)]
         return self
@@ -62,19 +142,23 @@ class HapsObj(Element):
 
     def get_by_name(self, name, typename=None):
         """ Search for an item named 'name'.
-            Optional 'typename' scopes the search. 
+            Optional 'typename' scopes the search. Found item may be 
+            shared (see add_parms()) and so immutable, items to be 
+            changed are looked up with get_private().
         """
-        if typename:
-            children = self.findall(typename)
-            for child in children:
-                if child.get('name', False) == name:
-                    return child
-        else: 
-            for child in list(self):               
-                if child.get('name', False) == name:
-                    return child
-
+        for child in self._named(name):
+            if not typename or child.tag == typename:
+                return child
         return None
+
+    def get_private(self, name, typename=None):
+        """ Same as get_by_name(), but shared item is replaced with
+            its private copy (see unshare()), so it can be changed in place.
+        """
+        child = self.get_by_name(name, typename)
+        if child is None:
+            return None
+        return self.unshare(child)
  
 
 
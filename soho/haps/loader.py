@@ -0,0 +1,254 @@
+"""
+    Streaming loader of appleseed projects (or any XML written by haps)
+    back into haps objects. Tags are mapped to haps.tags classes, elements
+    of unknown tags get a generic HapsObj class of the same tag.
+    JSON documents written by Element.tojson() are loaded the same way.
+"""
+
+import types
+from xml.parsers import expat
+
+import tags
+from etree_impl import Element, _hook_class
+from haps import HapsObj, HapsVal, NumericPayload
+
+# Attribute values are kept XML escaped, as written by haps.
+_entities = {'"': '&quot;'}
+
+
+def escape(data, entities=_entities):
+    """Escape markup characters of data, as xml.sax.saxutils.escape()
+       does (its module imports urllib and half of the network stack).
+    """
+    data = data.replace('&', '&amp;').replace('>', '&gt;').replace('<', '&lt;')
+    for char, entity in entities.iteritems():
+        data = data.replace(char, entity)
+    return data
+_special  = frozenset('&<>"')
+
+
+def _collect_classes():
+    classes = {}
+    for cls in vars(tags).values():
+        if isinstance(cls, type) and issubclass(cls, Element):
+            classes.setdefault(cls.tag, cls)
+    return classes
+
+CLASSES = _collect_classes()
+
+
+def element_class(tag):
+    """Return haps class of elements of 'tag' creating one when needed."""
+    cls = CLASSES.get(tag)
+    if cls is None:
+        name = '_'.join(part.capitalize() for part in tag.split('_'))
+        cls  = CLASSES[tag] = type(name, (HapsObj,), {'tag': intern(tag)})
+    return cls
+
+
+def _lazy_class(cls):
+    """Return subclass of 'cls' which parses its children from source
+       on first access to them (see load(lazy=...)).
+    """
+    def materialize(self):
+        path, start, end = self._source
+        self._source = None
+        with open(path, 'rb') as source:
+            source.seek(start)
+            fragment = source.read(end - start)
+        _Builder(root=self).feed(fragment + '</%s>' % self.tag, final=True)
+
+    return _hook_class(cls, 'Lazy', '_source', materialize, {'__slots__': ('_source',)})
+
+
+class _Builder(object):
+    """Builds haps tree from expat events."""
+    def __init__(self, root=None, skip=(), lazy=(), path=None):
+        self.root   = root
+        self.skip   = frozenset(skip)
+        self.lazy   = frozenset(lazy)
+        self.path   = path
+        self.stack  = []
+        self.text   = None
+        self.depth  = 0  # of skipped or lazy subtree
+        self.lazy_node = None
+        self.parser = expat.ParserCreate()
+        self.parser.returns_unicode = False
+        self.parser.buffer_text     = True
+        self.parser.StartElementHandler  = self.start
+        self.parser.EndElementHandler    = self.end
+        self.parser.CharacterDataHandler = self.data
+
+    def feed(self, data, final=False):
+        self.parser.Parse(data, final)
+        return self.root
+
+    def parse_file(self, fileio):
+        self.parser.ParseFile(fileio)
+        return self.root
+
+    def start(self, tag, attrib):
+        if self.depth:
+            self.depth += 1
+            return
+        if tag in self.skip and self.stack:
+            self.depth = 1
+            return
+
+        if self.root is not None and not self.stack:
+            # Fragment of a lazy element, which is already there.
+            node = self.root
+        else:
+            cls = element_class(tag)
+            if tag in self.lazy and self.stack:
+                cls = _lazy_class_of(cls)
+                self.lazy_node = node = cls.__new__(cls)
+                node._source   = None
+                self.depth     = 1
+            else:
+                node = cls.__new__(cls)
+            Element.__init__(node)
+            if attrib:
+                node._attrib = dict((intern(key), escape(value, _entities)
+                    if not _special.isdisjoint(value) else value)
+                    for key, value in attrib.iteritems())
+            if self.stack:
+                self.stack[-1].append(node)
+            else:
+                self.root = node
+
+        if self.lazy_node is node:
+            self.lazy_node = (node, self.parser.CurrentByteIndex)
+            return
+        self.stack.append(node)
+        self.text = [] if isinstance(node, HapsVal) else None
+
+    def end(self, tag):
+        if self.depth:
+            self.depth -= 1
+            if not self.depth and self.lazy_node:
+                node, start = self.lazy_node
+                end = self.parser.CurrentByteIndex
+                # Self closing elements have no children to load.
+                if end > start:
+                    node._source = (self.path, start, end)
+                self.lazy_node = None
+            return
+
+        node = self.stack.pop()
+        text = self.text and ''.join(self.text).strip()
+        if text:
+            try:
+                node._text = NumericPayload(float(value) for value in text.split())
+            except ValueError:
+                node._text = text
+        self.text = None
+
+    def data(self, text):
+        if self.text is not None and not self.depth:
+            self.text.append(text)
+
+
+_lazy_classes = {}
+
+
+def _lazy_class_of(cls):
+    if cls not in _lazy_classes:
+        _lazy_classes[cls] = _lazy_class(cls)
+    return _lazy_classes[cls]
+
+
+def load(source, skip=(), lazy=()):
+    """Load XML document into haps objects.
+
+    :parm source: File name or file object with appleseed project
+    :parm skip:   Tags of elements (like 'assembly') left out of the tree
+    :parm lazy:   Tags of elements which children are parsed on first
+                  access to them. Requires source to be a file on disk.
+    :returns:     Root element of the document (usually haps.Project)
+    """
+    if isinstance(source, types.StringTypes):
+        with open(source, 'rb') as fileio:
+            return load(fileio, skip, lazy)
+
+    path = getattr(source, 'name', None)
+    if lazy and not isinstance(path, types.StringTypes):
+        raise Exception("Can't load elements lazily from %s" % source)
+    return _Builder(skip=skip, lazy=lazy, path=path).parse_file(source)
+
+
+def fromstring(text, skip=()):
+    """Load XML document from a string into haps objects.
+
+    :parm text: XML document
+    :parm skip: Tags of elements (like 'assembly') left out of the tree
+    :returns:   Root element of the document
+    """
+    return _Builder(skip=skip).feed(text, final=True)
+
+
+def _build_json(document):
+    # JSON strings come as unicode, while tree holds byte strings.
+    # Names and values repeat a lot, so conversions are cached.
+    strings = {}
+
+    def string(value):
+        if type(value) is not unicode:
+            return value
+        result = strings.get(value)
+        if result is None:
+            result = strings[value] = intern(value.encode('utf-8'))
+        return result
+
+    def node(item):
+        tag, attrib, text, _ = item
+        cls     = element_class(string(tag))
+        element = cls.__new__(cls)
+        Element.__init__(element)
+        if attrib:
+            element._attrib = dict([(string(key), string(value))
+                for key, value in attrib.iteritems()])
+        if type(text) is list:
+            try:
+                text = NumericPayload(text)
+            except TypeError:
+                text = map(string, text)
+        element._text = string(text)
+        return element
+
+    root  = node(document)
+    stack = [(root, iter(document[3]))]
+    while stack:
+        parent, children = stack[-1]
+        for child in children:
+            element = node(child)
+            parent.append(element)
+            if child[3]:
+                stack.append((element, iter(child[3])))
+                break
+        else:
+            stack.pop()
+    return root
+
+
+def load_json(source):
+    """Load JSON document written by Element.tojson() into haps objects.
+
+    :parm source: File name or file object with JSON document
+    :returns:     Root element of the document
+    """
+    if isinstance(source, types.StringTypes):
+        with open(source, 'rb') as fileio:
+            return load_json(fileio)
+    import json
+    return _build_json(json.load(source))
+
+
+def fromjson(text):
+    """Load JSON document from a string into haps objects.
+
+    :parm text: JSON document written by Element.tojson()
+    :returns:   Root element of the document
+    """
+    import json
+    return _build_json(json.loads(text))
@@ -0,0 +1,297 @@
+"""
+    Packed appleseed projects (.appleseedz): zip archives holding the
+    project XML together with meshes and textures it references.
+
+    Archive is written sequentially, entries are streamed into it as
+    they come and sizes are recorded after data (in data descriptors),
+    so it can be written to pipes and stdout as well as to files.
+    Each entry has its own compression level, 0 stores it as it is.
+"""
+
+import os, time, zlib, struct, types
+
+from etree_impl import BUFFER_SIZE, _write_fd
+from backends import write
+
+PROJECT_NAME  = 'project.appleseed'
+DEFAULT_LEVEL = 6
+# Archive directories of files referenced by elements of a tag
+FOLDERS       = {'object': 'geometry', 'texture': 'textures'}
+OTHER_FOLDER  = 'files'
+
+_LOCAL_HEADER   = struct.Struct('<4s5H3L2H')
+_DESCRIPTOR     = struct.Struct('<4s3L')
+_CENTRAL_HEADER = struct.Struct('<4s6H3L5H2L')
+_END_RECORD     = struct.Struct('<4s4H2LH')
+_DATA_DESCRIPTOR_FLAG = 0x08
+_ZIP_VERSION    = 20
+_UNIX_VERSION   = (3 << 8) | _ZIP_VERSION
+_MAX_SIZE       = 0xFFFFFFFF
+
+
+def _dos_time(timestamp):
+    t = time.localtime(timestamp)
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class _Entry(object):
+    """Writeable file-like object compressing data into an archive entry."""
+    def __init__(self, archive, name, level, timestamp=None):
+        self.archive    = archive
+        self.name       = name
+        self.offset     = archive.offset
+        self.method     = zlib.DEFLATED if level else 0
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, -15) if level else None
+        self.crc        = 0
+        self.size       = 0
+        self.compressed_size = 0
+        self.time, self.date = _dos_time(timestamp or time.time())
+        archive._emit(_LOCAL_HEADER.pack('PK\x03\x04', _ZIP_VERSION,
+            _DATA_DESCRIPTOR_FLAG, self.method, self.time, self.date,
+            0, 0, 0, len(name), 0) + name)
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self.crc   = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        if self.compressor:
+            data = self.compressor.compress(data)
+        self._emit(data)
+
+    def close(self):
+        if self.archive._entry is not self:
+            return
+        if self.compressor:
+            self._emit(self.compressor.flush())
+        if self.size > _MAX_SIZE or self.compressed_size > _MAX_SIZE:
+            raise Exception("Entry %s doesn't fit in an archive without zip64" % self.name)
+        self.crc &= 0xFFFFFFFF
+        self.archive._emit(_DESCRIPTOR.pack('PK\x07\x08', self.crc,
+            self.compressed_size, self.size))
+        self.archive._entries.append(self)
+        self.archive._entry = None
+
+    def _emit(self, data):
+        if data:
+            self.compressed_size += len(data)
+            self.archive._emit(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PackedProject(object):
+    """Writer of a packed project archive.
+
+    :example:
+              with PackedProject(open('scene.appleseedz', 'wb')) as packed:
+                  packed.add_file(mesh_filename, level=1)
+                  packed.write_project(project)
+    """
+    def __init__(self, fileio, level=DEFAULT_LEVEL):
+        """
+        :parm fileio: Writeable file-like object or file descriptor
+        :parm level:  Default compression level of entries, 0 to 9
+        """
+        if isinstance(fileio, int):
+            self._write = lambda data: _write_fd(fileio, data)
+        else:
+            self._write = fileio.write
+        self.fileio   = fileio
+        self.level    = level
+        self.offset   = 0
+        self._entry   = None
+        self._entries = []
+        self._files   = {}     # source path -> archive name
+        self._names   = set()  # archive names taken by entries and files
+        self._pending = []
+        self._restore = []     # undo log of write_project() rewrites
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def entry(self, name, level=None):
+        """Open new entry of the archive. Only one entry can be written
+           at a time. Entry is complete when closed.
+
+        :parm name:  Path of the entry inside the archive
+        :parm level: Compression level (default archive's one)
+        :returns:    Writeable file-like entry object
+        """
+        if self._entry is not None:
+            raise Exception("Can't open %s while %s is being written" % (
+                name, self._entry.name))
+        if name in self._names:
+            raise Exception('Entry %s already present in archive' % name)
+        self._names.add(name)
+        return self._open(name, level)
+
+    def add_file(self, path, arcname=None, level=None):
+        """Copy file into the archive in chunks. Files added before
+           write_project() are referenced by the project as they are.
+
+        :parm path:    Path of the file on disk
+        :parm arcname: Path inside the archive (default 'files/basename')
+        :parm level:   Compression level (default archive's one)
+        :returns:      Path of the file inside the archive
+        """
+        source = self._source(path)
+        if source in self._files:
+            return self._files[source]
+        if arcname in self._names:
+            raise Exception('Entry %s already present in archive' % arcname)
+        arcname = self._reserve(source, arcname or self._arcname(OTHER_FOLDER, source))
+        self._copy(source, arcname, level)
+        return arcname
+
+    def write_project(self, project, name=PROJECT_NAME, preamble=None,
+        pretty_print=True, processes=1, level=None):
+        """Stream project XML into the archive followed by files it
+           references. 'filename' parameters of project elements pointing
+           to existing files are rewritten to archive paths while the
+           project is written, and restored afterwards. Content of deferred
+           elements is rewritten when produced, which has to happen in this
+           process, so projects with deferred elements are rendered without
+           worker processes.
+
+        :parm project:      Root element of the project
+        :parm name:         Path of project XML inside the archive
+        :parm preamble:     Optional text written before the document
+        :parm pretty_print: print with new lines and tabs (default True)
+        :parm processes:    Number of processes rendering assemblies (default 1)
+        :parm level:        Compression level (default archive's one)
+        :returns:           Path of the project inside the archive
+        """
+        try:
+            if self._rewrite(project):
+                processes = 1
+            with self.entry(name, level) as entry:
+                if preamble:
+                    entry.write(preamble + '\n')
+                write(project, entry, pretty_print, processes=processes)
+        finally:
+            while self._restore:
+                restore = self._restore.pop()
+                restore[0](*restore[1:])
+
+        while self._pending:
+            self._copy(*self._pending.pop(0))
+        return name
+
+    def close(self):
+        """Write central directory. Underlying file is left open."""
+        if self._entry is not None:
+            self._entry.close()
+        if self._entries is None:
+            return
+        start = self.offset
+        for entry in self._entries:
+            self._emit(_CENTRAL_HEADER.pack('PK\x01\x02', _UNIX_VERSION,
+                _ZIP_VERSION, _DATA_DESCRIPTOR_FLAG, entry.method, entry.time,
+                entry.date, entry.crc, entry.compressed_size, entry.size,
+                len(entry.name), 0, 0, 0, 0, 0644 << 16, entry.offset)
+                + entry.name)
+        count = len(self._entries)
+        if count > 0xFFFF or self.offset > _MAX_SIZE:
+            raise Exception("Archive doesn't fit in zip format without zip64")
+        self._emit(_END_RECORD.pack('PK\x05\x06', 0, 0, count, count,
+            self.offset - start, start, 0))
+        self._entries = None
+
+    def _emit(self, data):
+        self.offset += len(data)
+        self._write(data)
+
+    def _open(self, name, level=None, timestamp=None):
+        self._entry = _Entry(self, name, self.level if level is None else level, 
+            timestamp)
+        return self._entry
+
+    def _copy(self, source, arcname, level=None):
+        with open(source, 'rb') as fileio:
+            with self._open(arcname, level, os.path.getmtime(source)) as entry:
+                for chunk in iter(lambda: fileio.read(BUFFER_SIZE), ''):
+                    entry.write(chunk)
+
+    def _source(self, path):
+        return os.path.abspath(os.path.expandvars(path))
+
+    def _reserve(self, source, arcname):
+        self._files[source] = arcname
+        self._names.add(arcname)
+        return arcname
+
+    def _arcname(self, folder, source):
+        base, ext = os.path.splitext(os.path.basename(source))
+        arcname   = '%s/%s%s' % (folder, base, ext)
+        counter   = 1
+        while arcname in self._names:
+            arcname  = '%s/%s.%i%s' % (folder, base, counter, ext)
+            counter += 1
+        return arcname
+
+    def _reference(self, path, tag):
+        """Return archive path of referenced file, scheduling its copy."""
+        if not isinstance(path, types.StringTypes) or path in self._names:
+            return path
+        source = self._source(path)
+        if source in self._files:
+            return self._files[source]
+        if not os.path.isfile(source):
+            return path
+        folder  = FOLDERS.get(tag, OTHER_FOLDER)
+        arcname = self._reserve(source, self._arcname(folder, source))
+        self._pending.append((source, arcname))
+        return arcname
+
+    def _rewrite(self, element):
+        """Rewrite file references of element subtree. Deferred elements
+           aren't materialized, their factories rewrite what they produce.
+           Changes are recorded to be undone by write_project().
+           Returns number of deferred elements found.
+        """
+        def writable(entry):
+            # Shared elements on the way to a changed one are unshared.
+            node, parent = entry
+            if node._shared:
+                owner    = writable(parent)
+                entry[0] = owner.unshare(node)
+                self._restore.append((owner.replace, entry[0], node))
+            return entry[0]
+
+        deferred = 0
+        stack    = [[element, None]]
+        while stack:
+            entry = stack.pop()
+            node  = entry[0]
+            if getattr(node, '_pending', False):
+                self._restore.append((setattr, node, '_factory', node._factory))
+                node._factory = self._rewriting(node._factory)
+                deferred += 1
+                continue
+            if node.tag == 'parameter' and node._attrib \
+                and node._attrib.get('name') == 'filename':
+                parent = entry[1][0].tag if entry[1] else None
+                value  = node._attrib.get('value')
+                path   = self._reference(value, parent)
+                if path != value:
+                    target = writable(entry)
+                    self._restore.append((target.set, 'value', value))
+                    target.set('value', path)
+            stack.extend([[child, entry] for child in reversed(node._live())])
+        return deferred
+
+    def _rewriting(self, factory):
+        def rewritten():
+            element = factory()
+            self._rewrite(element)
+            return element
+        return rewritten
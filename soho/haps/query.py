@@ -0,0 +1,339 @@
+"""
+    Selectors over haps trees. A selector is a path of steps separated
+    by '/' (children) or '//' (descendants), relative to the root:
+
+        //light                         every light of the project
+        scene/assembly[@name=car*]      assemblies of scene named car...
+        //object_instance[assign_material/@material=red]
+                                        instances using material 'red'
+        //parameter[@name=importance_multiplier]
+
+    A step is a tag or '*', followed by predicates in brackets:
+
+        [@key]              element has attribute 'key'
+        [@key=glob]         attribute matches a glob (as written, so
+        [@key!=glob]        27 matches '27'), or doesn't
+        [tag]               element has a child 'tag'
+        [tag/@key=glob]     ...with attribute 'key' matching glob
+
+    Values can be quoted with ' or " to hold brackets or slashes.
+
+    TreeIndex walks a tree once, when first queried, numbering elements
+    in document order. Per-tag and per-name lists of those numbers are
+    built on first use, so steps jump to candidates instead of walking
+    subtrees. Index notices structural changes of trees (children added,
+    removed or renamed) and is rebuilt on next query. Content of
+    deferred elements which weren't produced yet isn't indexed.
+"""
+
+import re, fnmatch
+from bisect import bisect_left, bisect_right
+
+import etree_impl
+
+_STEP      = re.compile(r'^(\*|[\w.:-]+)((?:\[.*\])*)$')
+_PREDICATE = re.compile(r'^(?:([\w.:-]+)/)?@([\w.:-]+)(?:\s*(!?=)\s*(.*))?$|^([\w.:-]+)$')
+_GLOB      = re.compile(r'[*?[]')
+
+_selectors = {}
+
+
+def _scan(text):
+    """Yield (index, char, depth) of characters of text outside of
+       quotes, depth being the number of brackets opened before.
+    """
+    depth, quote = 0, None
+    for index, char in enumerate(text):
+        if quote:
+            quote = None if char == quote else quote
+        elif char in '\'"':
+            quote = char
+        elif char == '[':
+            yield index, char, depth
+            depth += 1
+        elif char == ']':
+            depth -= 1
+            yield index, char, depth
+        else:
+            yield index, char, depth
+    if quote or depth:
+        raise Exception('Unbalanced quotes or brackets in selector %s' % text)
+
+
+def _split(path):
+    """Split path on slashes outside of predicates."""
+    parts, start = [], 0
+    for index, char, depth in _scan(path):
+        if char == '/' and not depth:
+            parts.append(path[start:index])
+            start = index + 1
+    parts.append(path[start:])
+    return parts
+
+
+def _predicates(text):
+    """Return contents of top level brackets of text."""
+    predicates, start = [], 0
+    for index, char, depth in _scan(text):
+        if char == '[' and not depth:
+            start = index + 1
+        elif char == ']' and not depth:
+            predicates.append(text[start:index])
+    return predicates
+
+
+def _children(node):
+    # Deferred elements aren't produced by queries.
+    if getattr(node, '_pending', False):
+        return ()
+    return node._live()
+
+
+def _unquote(value):
+    if len(value) > 1 and value[0] == value[-1] and value[0] in '\'"':
+        return value[1:-1]
+    return value
+
+
+class _Match(object):
+    """Test of attribute values against a literal or a glob."""
+    __slots__ = ('literal', 'pattern')
+
+    def __init__(self, value):
+        self.literal = value
+        self.pattern = re.compile(fnmatch.translate(value)).match \
+            if _GLOB.search(value) else None
+
+    def __call__(self, value):
+        if self.pattern:
+            return self.pattern('%s' % (value,)) is not None
+        return value == self.literal or '%s' % (value,) == self.literal
+
+
+class _Step(object):
+    """Step of a selector: axis, tag and predicates on elements."""
+    def __init__(self, text, descendants):
+        match = _STEP.match(text.strip())
+        if not match:
+            raise Exception('Invalid selector step %s' % text)
+        self.descendants = descendants
+        self.tag         = None if match.group(1) == '*' else match.group(1)
+        self.name        = None   # exact name usable with name index
+        self.tests       = []
+        for predicate in _predicates(match.group(2)):
+            self.tests.append(self._compile(predicate.strip()))
+
+    def _compile(self, predicate):
+        match = _PREDICATE.match(predicate)
+        if not match:
+            raise Exception('Invalid selector predicate [%s]' % predicate)
+        child, key, operator, value, tag = match.groups()
+        if tag:
+            return lambda node: any([sub.tag == tag for sub in _children(node)])
+        if operator is None:
+            test = lambda node: node._attrib is not None and key in node._attrib
+        else:
+            value = _unquote(value.strip())
+            matches = _Match(value)
+            if key == 'name' and operator == '=' and not child \
+                and not matches.pattern and self.name is None:
+                self.name = value
+            def test(node):
+                if not node._attrib or key not in node._attrib:
+                    return False
+                return matches(node._attrib[key]) == (operator == '=')
+        if child:
+            return lambda node: any([sub.tag == child and test(sub)
+                for sub in _children(node)])
+        return test
+
+    def accepts(self, node):
+        if self.tag is not None and node.tag != self.tag:
+            return False
+        for test in self.tests:
+            if not test(node):
+                return False
+        return True
+
+
+def _compile(selector):
+    """Return list of steps of a selector, compiled once."""
+    steps = _selectors.get(selector)
+    if steps is None:
+        path = selector.strip()
+        if path.startswith('./'):
+            path = path[1:]
+        descendants, steps = False, []
+        if path.startswith('//'):
+            descendants, path = True, path[2:]
+        elif path.startswith('/'):
+            path = path[1:]
+        for part in _split(path):
+            if not part:
+                # Empty step between slashes: '//'
+                descendants = True
+                continue
+            steps.append(_Step(part, descendants))
+            descendants = False
+        if not steps or descendants:
+            raise Exception('Invalid selector %s' % selector)
+        _selectors[selector] = steps
+    return steps
+
+
+class TreeIndex(object):
+    """Index of elements of a tree answering selectors (see select()).
+
+    :example:
+              index = TreeIndex(project)
+              for light in index.select('//light'):
+                  ...
+              index.set('//parameter[@name=importance_multiplier]', 'value', 2)
+    """
+    def __init__(self, root):
+        """
+        :parm root: Root element of the tree, selectors are relative to it
+        """
+        self.root     = root
+        self._changes = None
+        self._nodes   = None   # elements in document order
+        self._parents = None   # position of parent of each element
+        self._ends    = None   # position of last descendant of each element
+        self._tags    = None   # tag -> positions
+        self._names   = None   # name -> positions
+
+    def select(self, selector, where=None):
+        """Return elements matching selector in document order.
+
+        :parm selector: Selector string (see module documentation)
+        :parm where:    Optional callable taking an element, which
+                        returns True for elements to be selected
+        :returns:       List of elements
+        """
+        return [self._nodes[position] for position in self._select(selector, where)]
+
+    def set(self, selector, key, value, where=None):
+        """Set attribute of every element matching selector. Matching
+           shared elements (see freeze()) are replaced by private copies
+           along with shared elements on the way to them.
+
+        :parm selector: Selector string
+        :parm key:      Name of the attribute
+        :parm value:    New value of the attribute
+        :parm where:    Optional callable filtering matched elements
+        :returns:       Number of changed elements
+        """
+        positions = self._select(selector, where)
+        for position in positions:
+            self._writable(position).set(key, value)
+        if key == 'name':
+            self._names = None
+        # Changes made above are reflected in the index.
+        self._changes = etree_impl._changes
+        return len(positions)
+
+    def _writable(self, position):
+        node = self._nodes[position]
+        if node._shared and position:
+            parent = self._writable(self._parents[position])
+            node   = self._nodes[position] = parent.unshare(node)
+        return node
+
+    def _build(self):
+        nodes, parents = [], []
+        stack, owners  = [self.root], [-1]
+        while stack:
+            node     = stack.pop()
+            position = len(nodes)
+            nodes.append(node)
+            parents.append(owners.pop())
+            if not node._deferred or not node._pending:
+                children = node._children and node._live()
+                if children:
+                    stack.extend(children[::-1])
+                    owners.extend([position] * len(children))
+        # Subtree of an element ends where subtree of its last child does,
+        # which is the first one met going backwards.
+        ends = range(len(nodes))
+        for position in xrange(len(nodes) - 1, 0, -1):
+            parent = parents[position]
+            if ends[parent] == parent:
+                ends[parent] = ends[position]
+        self._nodes, self._parents, self._ends = nodes, parents, ends
+        self._tags = self._names = None
+        self._changes = etree_impl._changes
+
+    def _positions(self, step):
+        """Return sorted positions of elements which can match a step."""
+        if step.name is not None:
+            if self._names is None:
+                self._names = {}
+                for position, node in enumerate(self._nodes):
+                    name = node._attrib.get('name') if node._attrib else None
+                    if name is not None and name is not False:
+                        # Names are matched as written, like attributes.
+                        name = name if isinstance(name, basestring) else '%s' % name
+                        self._names.setdefault(name, []).append(position)
+            return self._names.get(step.name, [])
+        if step.tag is not None:
+            if self._tags is None:
+                self._tags = {}
+                for position, node in enumerate(self._nodes):
+                    self._tags.setdefault(node.tag, []).append(position)
+            return self._tags.get(step.tag, [])
+        return None
+
+    def _child_positions(self, context):
+        # Children follow each other after the last descendant of previous one.
+        ends, position = self._ends, context + 1
+        while position <= ends[context]:
+            yield position
+            position = ends[position] + 1
+
+    def _select(self, selector, where=None):
+        steps = _compile(selector)
+        if self._changes != etree_impl._changes:
+            self._build()
+        nodes, parents, ends = self._nodes, self._parents, self._ends
+        contexts = [0]
+        for step in steps:
+            candidates = self._positions(step)
+            found      = []
+            last       = -1
+            for context in contexts:
+                start, end = context + 1, ends[context]
+                if step.descendants:
+                    # Nested contexts were covered by their ancestor.
+                    start = max(start, last + 1)
+                    last  = max(last, end)
+                if start > end:
+                    continue
+                if candidates is None:
+                    positions = xrange(start, end + 1) if step.descendants \
+                        else self._child_positions(context)
+                else:
+                    positions = candidates[bisect_left(candidates, start):
+                        bisect_right(candidates, end)]
+                for position in positions:
+                    if not step.descendants and parents[position] != context:
+                        continue
+                    if step.accepts(nodes[position]):
+                        found.append(position)
+            if not step.descendants:
+                found.sort()
+            contexts = found
+        if where is not None:
+            contexts = [position for position in contexts if where(nodes[position])]
+        return contexts
+
+
+def select(element, selector, where=None):
+    """Return elements of element's subtree matching selector. Builds
+       a throwaway TreeIndex, use one for repeated queries.
+
+    :parm element:  Root element
+    :parm selector: Selector string (see module documentation)
+    :parm where:    Optional callable filtering matched elements
+    :returns:       List of elements in document order
+    """
+    return TreeIndex(element).select(selector, where)
@@ -54,7 +54,6 @@ class Alpha(HapsVal):
         super(Alpha, self).__init__(values)
         assert(isinstance(values, collections.Iterable))
         assert(len(values) == 1)
-        self.set('text', values)
     
 
 
@@ -143,13 +142,12 @@ class Look_At(HapsObj):
 class Values(HapsVal):
     def __init__(self, values):
         super(Values, self).__init__(values)
-        self.set('text', values)
     
 
 
 class Matrix(HapsVal):
     identity = (1,0,0,0, 0,1,0,0, 0,0,1,0, 0,0,0,1)
     def __init__(self, m=None):
-        if not m: m = self.identity
+        if m is None or not len(m): m = self.identity
         assert(len(m) == 16)
         super(Matrix, self).__init__(m)
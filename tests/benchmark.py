@@ -0,0 +1,208 @@
+"""
+    Benchmarks of haps/APSobj scene building and XML serialization on
+    synthetic scenes. Doesn't need Houdini. Run from the repository root:
+
+        python tests/benchmark.py --assemblies 10 100 --instances 10 \\
+            --lights 4 --samples 1 3 --materials 2 --output results.json
+
+    Every combination of scene parameters is built and serialized in a
+    fresh process, so peak RSS belongs to a single scene. Results are
+    written as a JSON list of records, one per scene and serialization
+    backend (--backends), with speedups against the first backend.
+"""
+import sys, os, time, json, random, argparse, resource
+import multiprocessing
+sys.path.append('soho')
+import haps
+import APSobj
+
+MODES = (('pretty', True), ('compact', False))
+
+
+def random_matrix(rnd):
+    """Affine matrix with random rotation-like block and translation."""
+    m = [rnd.uniform(-1, 1) for _ in range(12)] + [0.0, 0.0, 0.0, 1.0]
+    m[3], m[7], m[11] = [rnd.uniform(-100, 100) for _ in range(3)]
+    return m
+
+
+def motion_blur(rnd, samples):
+    xforms = [random_matrix(rnd) for _ in range(samples)]
+    times  = [float(step) / samples for step in range(samples)]
+    return xforms, times
+
+
+def build_scene(assemblies=10, instances=10, lights=4, samples=1, materials=2, seed=0):
+    """Build synthetic project through APSobj.Appleseed like APS.py does.
+
+    :parm assemblies: Number of assemblies with a mesh object each
+    :parm instances:  Number of mesh instances per assembly
+    :parm lights:     Number of point lights in default assembly
+    :parm samples:    Number of transform (motion blur) samples of instances
+    :parm materials:  Number of materials per assembly
+    :parm seed:       Seed of random transforms
+    :returns:         APSobj.Appleseed object
+    """
+    rnd = random.Random(seed)
+    aps = APSobj.Appleseed()
+    aps.Config().insert('FinalConfiguration', 'final')
+    aps.Config().insert('InteractiveConfiguration', 'interactive')
+    aps.Scene().emplace(APSobj.PinholeCamera('camera',
+        xforms=[random_matrix(rnd)], times=[0.0]))
+
+    for light in range(lights):
+        xforms, times = motion_blur(rnd, samples)
+        aps.Assembly().emplace(APSobj.TransformBlur(
+            APSobj.PointLight('light%i' % light, intensity=rnd.uniform(0, 10)),
+            xforms, times))
+
+    for index in range(assemblies):
+        name  = 'assembly%i' % index
+        names = ['material%i' % material for material in range(materials)]
+        for material in names:
+            aps.Assembly(name).emplace(APSobj.DefaultLambertMaterial(material,
+                color=[rnd.random() for _ in range(3)]))
+        mesh = APSobj.MeshObject(name + '_mesh', '/tmp/%s.binarymesh' % name,
+            materials=names, slots=names)[0]
+        aps.Assembly(name).emplace(mesh)
+        for instance in range(instances):
+            xforms, times = motion_blur(rnd, samples)
+            aps.Assembly(name).emplace(APSobj.MeshInstance(
+                '%s_inst%i' % (name, instance), object=mesh.get('name') + '.default',
+                materials=names, slots=names, xforms=xforms, times=times))
+
+    aps.Output().insert('Frame', 'beauty', resolution=(1920, 1080), camera='camera')
+    return aps
+
+
+def count_nodes(element):
+    count, stack = 0, [element]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node)
+    return count
+
+
+def peak_rss():
+    """Peak resident set size of this process in kilobytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+class _Sink(object):
+    """File-like object counting written characters."""
+    size = 0
+
+    def write(self, data):
+        self.size += len(data)
+
+
+def measure(scene, repeat=3, processes=1, backend='etree_impl'):
+    """Build scene and serialize it in pretty and compact mode, taking
+       the best time of 'repeat' runs.
+
+    :parm scene:     Keyword arguments of build_scene()
+    :parm repeat:    Number of runs of every measurement
+    :parm processes: Processes passed to toxml()
+    :parm backend:   Name of serialization backend (see haps.set_backend())
+    :returns:        Dictionary of results
+    """
+    result = dict(scene=scene, repeat=repeat, processes=processes,
+        backend=backend, rss_start_kb=peak_rss())
+    build  = []
+    for _ in range(repeat):
+        start   = time.time()
+        project = build_scene(**scene).project
+        build.append(time.time() - start)
+    result.update(build_seconds=min(build), nodes=count_nodes(project),
+        rss_build_kb=peak_rss())
+
+    previous = haps.get_backend()
+    haps.set_backend(backend)
+    try:
+        for mode, pretty_print in MODES:
+            times = []
+            for _ in range(repeat):
+                sink  = _Sink()
+                start = time.time()
+                project.toxml(sink, pretty_print=pretty_print, processes=processes)
+                times.append(time.time() - start)
+            result[mode] = dict(seconds=min(times), bytes=sink.size,
+                mb_per_second=sink.size / max(min(times), 1e-9) / 2**20,
+                rss_kb=peak_rss())
+    finally:
+        haps.set_backend(previous.name)
+    return result
+
+
+def measure_isolated(scene, repeat=3, processes=1, backend='etree_impl'):
+    """Run measure() in a fresh process, if possible."""
+    if not hasattr(os, 'fork'):
+        return measure(scene, repeat, processes, backend)
+    pool = multiprocessing.Pool(1)
+    try:
+        return pool.apply(measure, (scene, repeat, processes, backend))
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def scenes(args):
+    """Yield keyword arguments of build_scene() for every combination."""
+    for assemblies in args.assemblies:
+        for instances in args.instances:
+            for lights in args.lights:
+                for samples in args.samples:
+                    for materials in args.materials:
+                        yield dict(assemblies=assemblies, instances=instances,
+                            lights=lights, samples=samples, materials=materials,
+                            seed=args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--assemblies', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--instances',  type=int, nargs='+', default=[10])
+    parser.add_argument('--lights',     type=int, nargs='+', default=[4])
+    parser.add_argument('--samples',    type=int, nargs='+', default=[1, 3],
+        help='Motion blur transform samples')
+    parser.add_argument('--materials',  type=int, nargs='+', default=[2])
+    parser.add_argument('--seed',       type=int, default=0)
+    parser.add_argument('--repeat',     type=int, default=3)
+    parser.add_argument('--processes',  type=int, default=1,
+        help='Processes serializing assemblies (0 = cpu count)')
+    parser.add_argument('--backends',   nargs='+', default=['etree_impl'],
+        choices=list(haps.backends.BACKENDS), help='Serialization backends')
+    parser.add_argument('--output', help='JSON file with results (default stdout)')
+    args = parser.parse_args(argv)
+
+    results = []
+    for scene in scenes(args):
+        reference = None
+        for backend in args.backends:
+            result = measure_isolated(scene, args.repeat, args.processes or None, backend)
+            reference = reference or result
+            result['speedup'] = dict([(mode, reference[mode]['seconds'] / 
+                max(result[mode]['seconds'], 1e-9)) for mode, _ in MODES])
+            sys.stderr.write('%(assemblies)s assemblies x %(instances)s instances, '
+                '%(lights)s lights, %(samples)s samples, %(materials)s materials: ' % scene)
+            sys.stderr.write('%s build %.3fs, pretty %.3fs (%.1f MB/s, %.2fx), '
+                'compact %.3fs (%.2fx), %i nodes, peak RSS %i kB\n' % (backend,
+                result['build_seconds'], result['pretty']['seconds'], 
+                result['pretty']['mb_per_second'], result['speedup']['pretty'],
+                result['compact']['seconds'], result['speedup']['compact'],
+                result['nodes'], result['compact']['rss_kb']))
+            results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as fileio:
+            json.dump(results, fileio, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    return results
+
+
+if __name__ == '__main__':
+    main()
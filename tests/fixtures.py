@@ -0,0 +1,40 @@
+"""
+    Small project shared by tests of loaders, diffs, binary encoding,
+    queries and serialization backends.
+"""
+import sys
+sys.path.append('soho')
+from haps.tags import *
+import APSobj
+
+
+def build_project(value=1, matrix=None, filename='box.binarymesh', parameters=()):
+    """Build project with an assembly holding a color, a mesh object with
+       two instances, a light and two materials, instance of the assembly,
+       a light in the scene and search paths.
+
+    :parm value:      Intensity of the light in the assembly
+    :parm matrix:     Transform of the assembly instance (default identity)
+    :parm filename:   Filename of the mesh object
+    :parm parameters: Optional (name, value) parameters added to the assembly
+    :returns:         Project element
+    """
+    assembly = Assembly('assembly').add([
+        Color('color').add([Values([0.5, 0.25, 1e-7]), Alpha([1])]),
+        Object('box', model='mesh_object').add_parms([('filename', filename)]),
+        Object_Instance('box_inst1', object='box.default').add(
+            Assign_Material(slot='default', side='front', material='red')),
+        Object_Instance('box_inst2', object='box.default').add(
+            Assign_Material(slot='default', side='front', material='blue')),
+        Light('light1', model='point_light').add_parms([('intensity', value),
+            ('importance_multiplier', 1.0)]),
+        ])
+    assembly.add_parms(parameters)
+    assembly.add(list(APSobj.DefaultLambertMaterial('red', color=[1, 0, 0])))
+    assembly.add(list(APSobj.DefaultLambertMaterial('blue', color=[0, 0, 1])))
+    scene = Scene().add([assembly,
+        Assembly_Instance('assembly_inst', assembly='assembly').add(
+            Transform(time=0.5).add(Matrix(matrix))),
+        Light('light2', model='point_light').add_parms([('importance_multiplier', 2)]),
+        ])
+    return Project().add([scene, Search_Paths().add(Search_Path('/tmp'))])
@@ -0,0 +1,136 @@
+"""
+    Cold start import times of the modules APS.py loads, measured under
+    stub soho, sohog and hou modules, so Houdini isn't needed. Run from
+    the repository root:
+
+        python tests/importtime.py --repeat 5 --output results.json
+
+    Every run imports the modules into a fresh interpreter and times each
+    first import, like 'python -X importtime' of Python 3 does: time of
+    the module with its own imports (cumulative) and without them (self).
+    Best times of runs are reported per module. Modules are loaded from
+    cached bytecode written by a warm-up run, as after the first render,
+    into a temporary copy of soho directory, so the tree is left as it is.
+"""
+import sys, os, json, argparse, subprocess, tempfile, shutil
+
+ROOT    = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ('haps', 'APSsettings', 'APSmisc', 'APSobj', 'APSframe')
+
+# Run in a fresh interpreter: argv[1:] are modules to import, prints
+# JSON list of [depth, module, cumulative, self] of imports loading new
+# modules, in order of imports.
+_SCRIPT = r'''
+import sys, time, types, json, __builtin__
+
+class Stub(object):
+    def __init__(self, *args, **kwargs):
+        pass
+
+for name, names in (('soho', ('SohoParm',)), ('sohog', ('SohoGeometry',)), ('hou', ())):
+    stub = sys.modules[name] = types.ModuleType(name)
+    for attribute in names:
+        setattr(stub, attribute, Stub)
+
+_import  = __builtin__.__import__
+records  = []
+children = [0.0]
+
+def timed_import(name, *args, **kwargs):
+    known  = len(sys.modules)
+    record = [len(children) - 1, None, 0.0, 0.0]
+    records.append(record)
+    children.append(0.0)
+    start = time.time()
+    try:
+        module = _import(name, *args, **kwargs)
+    finally:
+        elapsed = time.time() - start
+        nested  = children.pop()
+        children[-1] += elapsed
+        record[2:] = [elapsed, elapsed - nested]
+    if len(sys.modules) > known:
+        record[1] = module.__name__
+    return module
+
+__builtin__.__import__ = timed_import
+for name in sys.argv[1:]:
+    __import__(name)
+__builtin__.__import__ = _import
+print json.dumps([record for record in records if record[1]])
+'''
+
+
+def run(modules=MODULES, path=None, bytecode=False):
+    """Import modules in a fresh interpreter.
+
+    :parm modules:  Names of modules to import (default modules of APS.py)
+    :parm path:     Directory of the modules (default soho of the tree)
+    :parm bytecode: Write bytecode of imported modules (default False)
+    :returns:       List of (depth, module, cumulative, self) records with
+                    times in seconds, in order of imports
+    """
+    env = dict(os.environ, PYTHONPATH=path or os.path.join(ROOT, 'soho'))
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    if not bytecode:
+        env['PYTHONDONTWRITEBYTECODE'] = '1'
+    command = [sys.executable, '-c', _SCRIPT] + list(modules)
+    output  = subprocess.check_output(command, cwd=ROOT, env=env)
+    return [tuple(record) for record in json.loads(output)]
+
+
+def measure(modules=MODULES, repeat=5):
+    """Return best import times of modules over 'repeat' runs.
+
+    :returns: Dictionary with total time and list of records of
+              imported modules {'module', 'depth', 'cumulative', 'self'}
+              in order of imports, times in milliseconds
+    """
+    directory = tempfile.mkdtemp(prefix='importtime')
+    try:
+        path = os.path.join(directory, 'soho')
+        shutil.copytree(os.path.join(ROOT, 'soho'), path, 
+            ignore=shutil.ignore_patterns('*.py[co]', '__pycache__'))
+        # Writes bytecode of modules.
+        run(modules, path, bytecode=True)
+        best, order = {}, []
+        for _ in range(repeat):
+            for depth, module, cumulative, own in run(modules, path):
+                times = best.get(module)
+                if times is None:
+                    order.append(module)
+                if times is None or cumulative < times[1]:
+                    best[module] = (depth, cumulative, own)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    records = [{'module': module, 'depth': best[module][0],
+        'cumulative': best[module][1] * 1000, 'self': best[module][2] * 1000}
+        for module in order]
+    total = sum([record['cumulative'] for record in records if record['depth'] == 0])
+    return {'modules': list(modules), 'total': total, 'imports': records}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--modules', nargs='+', default=list(MODULES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--threshold', type=float, default=0.5,
+        help='Hide imports faster than this many milliseconds')
+    parser.add_argument('--output', help='JSON file with results')
+    args = parser.parse_args(argv)
+
+    result = measure(args.modules, args.repeat)
+    sys.stdout.write('%10s %10s  module\n' % ('cumul ms', 'self ms'))
+    for record in result['imports']:
+        if record['cumulative'] >= args.threshold:
+            sys.stdout.write('%10.2f %10.2f  %s%s\n' % (record['cumulative'],
+                record['self'], '  ' * record['depth'], record['module']))
+    sys.stdout.write('%10.2f %10s  total\n' % (result['total'], ''))
+    if args.output:
+        with open(args.output, 'w') as fileio:
+            json.dump(result, fileio, indent=2)
+    return result
+
+
+if __name__ == '__main__':
+    main()
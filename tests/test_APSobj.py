@@ -85,6 +85,81 @@ class APSobjTestCase(unittest.TestCase):
         apple.Assembly('new_assembly').insert('MeshObject', 'moving_box', filename='box.obj', xforms=xforms)
         self.assertEqual(len(apple.scene.get_by_name('new_assembly').get_by_name('moving_box_inst').findall('transform')), 5)
 
+    def test_type_registry(self):
+        from haps import Light
+        apple = APSobj.Appleseed()
+        self.assertIs(APSobj.TYPES['PointLight'][0], APSobj.PointLight)
+        self.assertIs(APSobj.TYPES['Light'][0], Light)
+        lights = apple.Assembly().create('Light', 'sun', model='point_light')
+        self.assertEqual([light.get('name') for light in lights], ['sun'])
+        self.assertEqual(len(apple.Assembly().create('DefaultLambertMaterial', 'red')), 4)
+        self.assertRaises(Exception, apple.Assembly().create, 'NoSuchType', 'name')
+
+        def Lamp(name, **kwargs):
+            return APSobj.PointLight(name, intensity=kwargs.get('power', 1.0))
+        try:
+            APSobj.register_type('Lamp', Lamp)
+            apple.Assembly().insert('Lamp', 'lamp', power=2.0)
+            apple.Assembly().insert('Lamp', 'lamp', power=3.0)
+        finally:
+            del APSobj.TYPES['Lamp']
+        lamps = apple.assembly.findall('light')
+        self.assertEqual(len(lamps), 1)
+        self.assertEqual(lamps[0].get_by_name('intensity').get('value'), 3.0)
+        # Single objects replace their namesakes too.
+        apple.Assembly().emplace(APSobj.PointLight('lamp'))
+        self.assertEqual(apple.assembly.get_by_name('lamp').get_by_name('intensity')
+            .get('value'), 1.0)
+        self.assertEqual(len(apple.assembly.findall('light')), 1)
+
+    def test_deferred_assembly_object(self):
+        calls = []
+        def material():
+            calls.append(1)
+            return APSobj.DefaultLambertMaterial('red')
+
+        apple = APSobj.Appleseed()
+        apple.Scene().insert('DeferredAssemblyObject', 'box', filenames=['box.obj'],
+            list_of_kwargs=[{}], materials=[material, lambda: None, None,
+            list(APSobj.DisneyMaterial('disney'))])
+        stub = apple.scene.get_by_name('box')
+        self.assertTrue(stub._pending)
+        self.assertEqual(apple.scene.get_by_name('box_inst').get('assembly'), 'box')
+        document = apple.project.tostring()
+        self.assertEqual(calls, [1])
+        self.assertTrue(stub._pending)
+        self.assertIn('<parameter name="filename" value="box.obj"/>', document)
+        self.assertIn('<parameter name="surface_shader" value="red_shader"/>', document)
+        # Ready materials are reused when the assembly is made again.
+        self.assertEqual(apple.project.tostring(), document)
+        self.assertEqual(calls, [1, 1])
+        # Same content as the assembly built right away.
+        assembly, _ = APSobj.AssemblyObject('box', ['box.obj'], [{}])
+        assembly.add(APSobj.DefaultLambertMaterial('red'))
+        assembly.add(APSobj.DisneyMaterial('disney'))
+        self.assertEqual(stub, assembly)
+
+    def test_emplace_all(self):
+        from haps import Light
+        apple    = APSobj.Appleseed()
+        assembly = apple.Assembly()
+        self.assertEqual(assembly.emplace_all([Light('light%i' % index) for index in range(5)]), [])
+        old = apple.assembly.get_by_name('light3')
+        replaced = assembly.emplace_all([Light('light3', model='spot_light'), 
+            APSobj.DefaultLambertMaterial('red'), None, Light('light9'),
+            Light('light9', model='point_light')])
+        self.assertEqual([obj.get('name') for obj in replaced], ['light9', 'light3'])
+        self.assertIs(replaced[1], old)
+        self.assertEqual([obj.get('name') for obj in apple.assembly], ['light0', 'light1', 
+            'light2', 'light4', 'light3', 'red_color', 'red_bsdf', 'red_shader', 'red', 'light9'])
+        self.assertEqual(apple.assembly.get_by_name('light3').get('model'), 'spot_light')
+        self.assertEqual(apple.assembly.get_by_name('light9').get('model'), 'point_light')
+        for child in apple.assembly:
+            self.assertIs(child._parent, apple.assembly)
+        # Without replacement namesakes are kept.
+        assembly.emplace_all([Light('light0')], replace=False)
+        self.assertEqual(len(apple.assembly.findall('light')), 7)
+
     def test_find_instances(self):
         from haps import Matrix
         apple = APSobj.Appleseed()
@@ -139,26 +214,114 @@ class APSobjTestCase(unittest.TestCase):
         self.assertEqual(apple.assembly.get_by_name('some_disney_material')\
             .find('parameters').get_by_name('base_color').get('value'), "1 0 0") # BUG
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    def test_update_parameters_precision(self):
+        camera = APSobj.PinholeCamera('camera', film_dimensions=(1/3.0, 1.0), 
+            xforms=[[1/3.0] * 16], times=[1/3.0])
+        # Values are kept as they are, precision is applied when written.
+        self.assertEqual(camera.get_by_name('film_dimensions').get('value'), (1/3.0, 1.0))
+        self.assertEqual(camera.find('transform').get('time'), 1/3.0)
+        self.assertIn('value="0.333333333333 1.0"', camera.tostring())
+        try:
+            haps.set_precision(3)
+            document = camera.tostring()
+            self.assertEqual(camera.get_by_name('film_dimensions').get('value'), '0.333 1')
+            self.assertIn('"value":"0.333 1"', camera.tojson())
+        finally:
+            haps.set_precision()
+        self.assertIn('name="film_dimensions" value="0.333 1"', document)
+        self.assertIn('<transform time="0.333">', document)
+        self.assertIn('value="0.333333333333 1.0"', camera.tostring())
+
+    def test_scalar_parameters_precision(self):
+        camera = APSobj.PinholeCamera('camera', horizontal_fov=1/3.0, near_z=-1/3.0)
+        self.assertIn('name="horizontal_fov" value="0.333333333333"', camera.tostring())
+        self.assertIn('name="near_z" value="-1.0"', 
+            APSobj.PinholeCamera('camera', near_z=-1.0).tostring())
+        previous = haps.get_backend()
+        try:
+            haps.set_precision(3)
+            for backend in ('etree_impl', 'elementtree'):
+                haps.set_backend(backend)
+                document = camera.tostring()
+                self.assertIn('name="horizontal_fov" value="0.333"', document)
+                self.assertIn('name="near_z" value="-0.333"', document)
+        finally:
+            haps.set_precision()
+            haps.set_backend(previous.name)
+        self.assertIn('name="horizontal_fov" value="0.333333333333"', camera.tostring())
+
+    def test_shared_default_parameters(self):
+        light1 = APSobj.PointLight('light1')
+        light2 = APSobj.PointLight('light2', intensity=2.0)
+        self.assertIs(light1._named('exposure')[0], light2._named('exposure')[0])
+        self.assertIsNot(light1._named('intensity')[0], light2._named('intensity')[0])
+        self.assertEqual(light1.get_by_name('intensity').get('value'), 1.0)
+        self.assertEqual(light2.get_by_name('intensity').get('value'), 2.0)
+        self.assertEqual(APSobj.PointLight('light3').get_by_name('intensity').get('value'), 1.0)
+
+    def test_set_looked_up_default_parameter(self):
+        light1 = APSobj.PointLight('light1')
+        light2 = APSobj.PointLight('light2')
+        # Lookups leave shared parameters as they are.
+        self.assertIs(light1.get_by_name('intensity'), light2.get_by_name('intensity'))
+        self.assertRaises(Exception, light1.get_by_name('intensity').set, 'value', 5)
+        light1.get_private('intensity').set('value', 5)
+        self.assertEqual(light1.get_by_name('intensity').get('value'), 5)
+        self.assertEqual(light2.get_by_name('intensity').get('value'), 1.0)
+        self.assertIn('name="intensity" value="5"', light1.tostring())
+        self.assertIn('name="intensity" value="1.0"', APSobj.PointLight('light3').tostring())
+        # Looked up parameters of nested groups too.
+        config = APSobj.FinalConfiguration('final')
+        config.get_private('pt').get_private('max_bounces').set('value', 4)
+        self.assertEqual(config.get_by_name('pt').get_by_name('max_bounces').get('value'), 4)
+        self.assertEqual(APSobj.FinalConfiguration('final').get_by_name('pt')
+            .get_by_name('max_bounces').get('value'), '-1')
+
+    def test_shared_nested_parameters(self):
+        config1 = APSobj.FinalConfiguration('final')
+        config2 = APSobj.FinalConfiguration('final')
+        self.assertIs(config1._named('pt')[0]._named('max_bounces')[0], 
+            config2._named('pt')[0]._named('max_bounces')[0])
+        APSobj.update_parameters(config1, **{'pt/max_bounces': 8})
+        self.assertEqual(config1.get_by_name('pt').get_by_name('max_bounces').get('value'), 8)
+        self.assertEqual(config2.get_by_name('pt').get_by_name('max_bounces').get('value'), '-1')
+        self.assertIs(config1._named('pt')[0]._named('enable_dl')[0], 
+            config2._named('pt')[0]._named('enable_dl')[0])
+
+    def test_default_lambert_material_clone(self):
+        red  = APSobj.DefaultLambertMaterial('red', color=[1, 0, 0])
+        blue = APSobj.DefaultLambertMaterial('blue', color=[0, 0, 1])
+        self.assertEqual([entity.get('name') for entity in blue], 
+            ['blue_color', 'blue_bsdf', 'blue_shader', 'blue'])
+        self.assertEqual(red[1].get_by_name('reflectance').get('value'), 'red_color')
+        self.assertEqual(red[3].get_by_name('surface_shader').get('value'), 'red_shader')
+        self.assertIn('1 0 0', red[0].tostring())
+        self.assertIn('0 0 1', blue[0].tostring())
+        self.assertIs(red[0]._named('multiplier')[0], blue[0]._named('multiplier')[0])
+
+    def test_parameter_schema(self):
+        schema = APSobj.FINAL_CONFIGURATION
+        self.assertEqual(schema.find('pt/max_bounces').kind, 'int')
+        self.assertIsNone(schema.find('pt/no_such_parm'))
+        self.assertIsNone(schema.find('pt'))
+        self.assertRaises(Exception, APSobj.PointLight, 'light', intensity_multiplier='bright')
+        self.assertRaises(Exception, APSobj.FinalConfiguration, **{'pt/max_bounces': 1.5})
+        self.assertRaises(Exception, APSobj.POINT_LIGHT.build, 'light', strict=True, 
+            intesity=2.0)
+        # Unknown parameters are only reported by default.
+        light = APSobj.PointLight('light', intesity=2.0, cast_indirect_light='false')
+        self.assertEqual(light.get_by_name('intensity').get('value'), 1.0)
+        self.assertEqual(light.get_by_name('cast_indirect_light').get('value'), 'false')
+        config = APSobj.FinalConfiguration(**{'pt/max_bounces': 2, 'passes': '4'})
+        APSobj.FINAL_CONFIGURATION.update(config, **{'pt/rr_min_path_length': ''})
+        self.assertEqual(config.get_by_name('pt').get_by_name('max_bounces').get('value'), 2)
+        self.assertIs(config._named('sppm')[0], APSobj.FinalConfiguration()._named('sppm')[0])
+
+    def test_disney_material_layer_parameters(self):
+        shader, material = APSobj.DisneyMaterial('disney', layers=2, roughness='rough_tex',
+            bump_amplitude=2.0)
+        self.assertEqual(material.get_by_name('bump_amplitude').get('value'), 2.0)
+        for number in (1, 2):
+            layer = material.get_by_name('layer%i' % number)
+            self.assertEqual(layer.get_by_name('roughness').get('value'), 'rough_tex')
+            self.assertEqual(layer.get_by_name('layer_number').get('value'), number)
@@ -0,0 +1,140 @@
+import unittest
+import sys
+from StringIO import StringIO
+sys.path.append('soho')
+import haps
+from haps.tags import *
+import APSobj
+import benchmark
+from fixtures import build_project
+
+
+def deep_project(depth=50):
+    root = node = Project()
+    for level in range(depth):
+        child = Parameters('level%i' % level).add(Values(range(level % 7)))
+        node.add(child)
+        node = child
+    return root
+
+
+WORKLOADS = [
+    ('project',    build_project),
+    ('deep',       deep_project),
+    ('materials',  lambda: Assembly('assembly').add(
+        list(APSobj.DefaultLambertMaterial('lambert')) + list(APSobj.DisneyMaterial('disney', layers=3)))),
+    ('scene',      lambda: benchmark.build_scene(assemblies=20, instances=5, samples=2).project),
+]
+
+
+class BackendsTestCase(unittest.TestCase):
+    def test_backends_produce_equivalent_projects(self):
+        # Speed of backends is compared by benchmark.py.
+        for workload, build in WORKLOADS:
+            project = build()
+            for pretty_print in (True, False):
+                expected = haps.fromstring(haps.get_backend('etree_impl').tostring(project, pretty_print))
+                self.assertEqual(expected, haps.fromstring(project.tostring(pretty_print)))
+                for backend in haps.backends.BACKENDS:
+                    document = haps.get_backend(backend).tostring(project, pretty_print)
+                    self.assertEqual(haps.fromstring(document), expected,
+                        '%s differs in %s' % (backend, workload))
+
+    def test_deferred_elements(self):
+        calls = []
+
+        def light():
+            calls.append('light')
+            return APSobj.PointLight('light', exposure=1.0)
+
+        def box():
+            calls.append('box')
+            return Object('box', model='mesh_object').add_parms([('filename', 'box.binarymesh')])
+
+        def build():
+            return Assembly('assembly').add([haps.deferred(Light, light, 'light', release=True),
+                haps.deferred(Object, box, 'box', release=True)])
+
+        expected = haps.fromstring(haps.get_backend('etree_impl').tostring(build()))
+        self.assertEqual(expected.get_by_name('box').get('model'), 'mesh_object')
+        for backend in haps.backends.BACKENDS:
+            # Attributes made by factories of fresh stubs are written too.
+            assembly = build()
+            del calls[:]
+            self.assertEqual(haps.fromstring(haps.get_backend(backend).tostring(assembly)),
+                expected, '%s differs' % backend)
+            self.assertEqual(sorted(calls), ['box', 'light'])
+            # Produced content is dropped once written.
+            self.assertTrue(assembly.get_by_name('box')._pending)
+        try:
+            haps.set_sparse()
+            for backend in haps.backends.BACKENDS:
+                sparse = haps.fromstring(haps.get_backend(backend).tostring(build()))
+                self.assertEqual([parm.get('name') for parm in sparse.get_by_name('light')],
+                    ['exposure', 'intensity'])
+        finally:
+            haps.set_sparse(False)
+
+    def test_pretty_print_layout(self):
+        project = build_project()
+        for backend in haps.backends.BACKENDS:
+            lines = haps.get_backend(backend).tostring(project).splitlines()
+            self.assertEqual(lines[0], '<project format_revision="27">')
+            self.assertIn('        <assembly name="assembly">', lines)
+            self.assertIn('                    0.5 0.25 1e-07', lines)
+            self.assertEqual(lines[-1], '</project>')
+
+    def test_set_backend(self):
+        fileio = StringIO()
+        project = build_project()
+        try:
+            haps.set_backend('elementtree')
+            self.assertEqual(project.tostring(False),
+                haps.get_backend('elementtree').tostring(project, False))
+            project.toxml(fileio, pretty_print=False)
+        finally:
+            haps.set_backend('etree_impl')
+        self.assertEqual(fileio.getvalue(), haps.get_backend('elementtree').tostring(project, False))
+        self.assertEqual(project.tostring(False), haps.get_backend('etree_impl').tostring(project, False))
+        self.assertRaises(Exception, haps.set_backend, 'lxml')
+
+    def test_elementtree_escapes_markup(self):
+        element = Parameter('filename', 'a&b.binarymesh')
+        self.assertEqual(haps.get_backend('elementtree').tostring(element, False),
+            '<parameter name="filename" value="a&amp;b.binarymesh" />')
+
+    def test_sparse_projects(self):
+        light = APSobj.PointLight('light', exposure=1.0, importance_multiplier='1')
+        shader, material = APSobj.DisneyMaterial('disney', layers=2)
+        project = Project().add([Scene().add(Assembly('assembly').add([light, material])),
+            Configurations().add([APSobj.FinalConfiguration(), APSobj.InteractiveConfiguration()])])
+        full = project.tostring()
+        try:
+            haps.set_sparse()
+            for backend in haps.backends.BACKENDS:
+                sparse = haps.fromstring(haps.get_backend(backend).tostring(project))
+                light  = sparse.find('scene').find('assembly').get_by_name('light')
+                self.assertEqual([parm.get('name') for parm in light],
+                    ['exposure', 'intensity'])
+                layer = sparse.find('scene').find('assembly').get_by_name('disney') \
+                    .get_by_name('layer2')
+                self.assertIsNotNone(layer.get_by_name('metallic'))
+                self.assertIsNone(layer.get_by_name('clearcoat'))
+                final, interactive = sparse.find('configurations')
+                self.assertIsNone(final.get_by_name('pt').get_by_name('enable_dl'))
+                self.assertIsNotNone(interactive.get_by_name('pt').get_by_name('enable_dl'))
+            omitted, saved = haps.sparse_report()
+            document = project.tostring()
+            self.assertEqual(haps.sparse_report(), (omitted * 3 // 2, saved * 3 // 2))
+            self.assertLess(len(document), len(full) - saved // 2)
+            # Trees keep all of their parameters.
+            self.assertEqual(project.find('scene').find('assembly').get_by_name('light')
+                .get_by_name('cast_indirect_light').get('value'), True)
+        finally:
+            haps.set_sparse(False)
+        self.assertEqual(project.tostring(), full)
+        self.assertEqual(haps.sparse_report(), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
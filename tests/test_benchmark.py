@@ -0,0 +1,31 @@
+import unittest
+import sys
+sys.path.append('soho')
+import haps
+import benchmark
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_build_scene(self):
+        scene = benchmark.build_scene(assemblies=3, instances=2, lights=2, samples=3, materials=2)
+        assemblies = scene.scene.findall('assembly')
+        self.assertEqual(len(assemblies), 4)
+        self.assertEqual(len(scene.scene.findall('assembly_instance')), 4)
+        assembly = scene.scene.get_by_name('assembly1')
+        self.assertEqual(len(assembly.findall('object_instance')), 2)
+        self.assertEqual(len(assembly.findall('material')), 2)
+        self.assertEqual(len(assembly.find('object_instance').findall('transform')), 3)
+        self.assertEqual(len(scene.assembly.findall('light')), 2)
+        document = scene.project.tostring(False)
+        self.assertEqual(haps.fromstring(document).tostring(False), document)
+
+    def test_measure(self):
+        result = benchmark.measure(dict(assemblies=2, instances=2), repeat=1)
+        self.assertEqual(result['nodes'], benchmark.count_nodes(
+            benchmark.build_scene(assemblies=2, instances=2).project))
+        self.assertGreater(result['pretty']['bytes'], result['compact']['bytes'])
+        self.assertGreater(result['compact']['rss_kb'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
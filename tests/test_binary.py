@@ -0,0 +1,66 @@
+import unittest
+import sys
+from array import array
+from StringIO import StringIO
+sys.path.append('soho')
+import haps
+from haps.tags import *
+import fixtures
+
+
+def build_project():
+    # Values of types the encoding keeps apart.
+    return fixtures.build_project(matrix=[1.0/3] * 16, parameters=[
+        ('flags', [1, 2, 3]),
+        ('enabled', True),
+        ('weight', 2 ** 40),
+        ('title', u'\u0142\xf3d\u017a'),
+        ])
+
+
+class BinaryTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        project  = build_project()
+        document = haps.tobinary(project)
+        self.assertTrue(document.startswith('HAPB'))
+        loaded = haps.frombinary(document)
+        self.assertEqual(loaded, project)
+        self.assertEqual(loaded.tostring(), project.tostring())
+        self.assertIs(type(loaded.find('scene')), Scene)
+
+        assembly = loaded.find('scene').get_by_name('assembly')
+        self.assertIs(assembly._parent, loaded.find('scene'))
+        self.assertEqual(assembly.get_by_name('weight').get('value'), 2 ** 40)
+        self.assertIs(assembly.get_by_name('enabled').get('value'), True)
+        matrix = loaded.find('scene').find('assembly_instance').find('transform').find('matrix')
+        self.assertIsInstance(matrix.text, haps.haps.NumericPayload)
+        self.assertEqual(list(matrix.text), [1.0/3] * 16)
+        self.assertEqual(len(haps.tobinary(project)), len(document))
+
+    def test_unsupported_values_as_written(self):
+        parameter = Parameter('samples', array('i', [1, 2]))
+        loaded    = haps.frombinary(haps.tobinary(parameter))
+        self.assertEqual(loaded.get('value'), "array('i', [1, 2])")
+        self.assertEqual(loaded.tostring(), parameter.tostring())
+
+    def test_files(self):
+        fileio = StringIO()
+        haps.write_binary(build_project(), fileio)
+        fileio.seek(0)
+        self.assertEqual(haps.load_binary(fileio), build_project())
+
+    def test_deferred(self):
+        project = Project().add(haps.deferred(Scene, lambda: Scene().add(Assembly('lazy')),
+            release=True))
+        loaded = haps.frombinary(haps.tobinary(project))
+        self.assertEqual(loaded.find('scene').find('assembly').get('name'), 'lazy')
+        self.assertTrue(project.find('scene')._pending)
+
+    def test_invalid_documents(self):
+        document = haps.tobinary(build_project())
+        self.assertRaises(Exception, haps.frombinary, '<project/>')
+        self.assertRaises(Exception, haps.frombinary, document[:len(document) // 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
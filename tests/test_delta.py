@@ -0,0 +1,53 @@
+import unittest
+import sys
+sys.path.append('soho')
+import haps
+from haps.tags import *
+from fixtures import build_project
+
+
+class DeltaTestCase(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def test_diff_equal_trees(self):
+        self.assertEqual(haps.diff(build_project(), build_project()), [])
+
+    def test_diff_changed_parameter(self):
+        script = haps.diff(build_project(1), build_project(2))
+        self.assertEqual(len(script), 1)
+        self.assertEqual(script[0].op, 'attrib')
+        self.assertEqual(script[0].path[-1], ('parameter', 'intensity', 0))
+        self.assertEqual(script[0].value, {'value': 2})
+
+    def test_diff_changed_transform(self):
+        script = haps.diff(build_project(), build_project(matrix=range(16)))
+        self.assertEqual([edit.op for edit in script], ['text'])
+        self.assertEqual(script[0].path[-2:], (('transform', None, 0), ('matrix', None, 0)))
+
+    def test_patch(self):
+        old = build_project()
+        new = build_project(2, range(16))
+        assembly = new.find('scene').find('assembly')
+        assembly.remove(assembly.get_by_name('box'))
+        new.find('scene').add(Assembly('other'))
+        haps.patch(old, haps.diff(old, new))
+        self.assertEqual(old, new)
+        self.assertEqual(haps.diff(old, new), [])
+        # Added elements are copies
+        self.assertIsNot(old.find('scene').get_by_name('other'), new.find('scene').get_by_name('other'))
+
+    def test_patch_deferred(self):
+        factory = lambda: Assembly().add(Light('lamp', model='point_light'))
+        new = Project().add(Scene().add(haps.deferred(Assembly, factory, 'lazy', release=True)))
+        old = haps.patch(Project().add(Scene()), haps.diff(Project().add(Scene()), new))
+        self.assertEqual(old.tostring(), new.tostring())
+        self.assertIs(type(old.find('scene').find('assembly')), Assembly)
+
+    def test_patch_bad_path(self):
+        script = haps.diff(build_project(1), build_project(2))
+        self.assertRaises(KeyError, haps.patch, Project(), script)
+
+
+if __name__ == "__main__":
+    unittest.main()
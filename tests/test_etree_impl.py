@@ -134,6 +134,38 @@ class EtreeImplTestCase(unittest.TestCase):
         self.assertEqual(element1[typename], elements[1:])
         self.assertEqual(id(removed), id(elements[0]))
 
+    def test_children_keep_insertion_order(self):
+        element1 = TestElement()
+        element2 = et.Element()
+        element3 = TestElement('third')
+        element1.extend([element2, element3])
+        self.assertEqual(list(element1), [element2, element3])
+        self.assertEqual(len(element1), 2)
+
+    def test_childless_element_is_true(self):
+        self.assertTrue(TestElement())
+
+    def test_compact_element(self):
+        element1 = TestElement('test_name')
+        self.assertFalse(hasattr(element1, '__dict__'))
+        self.assertTrue(TestElement().tag is element1.tag)
+
+    def test_text_is_not_an_attribute(self):
+        element1 = TestElement()
+        element1.set('text', [1, 2])
+        self.assertEqual(element1.get('text'), [1, 2])
+        self.assertEqual(element1.attributes, {})
+
+    def test_remove_keeps_order(self):
+        element1 = TestElement()
+        elements = [TestElement(str(index)) for index in range(5)]
+        element1.extend(elements)
+        element1.remove(elements[1])
+        element1.remove(elements[3])
+        element1.append(elements[1])
+        self.assertEqual(list(element1), [elements[0], elements[2], elements[4], elements[1]])
+        self.assertEqual(len(element1), 4)
+
     def test_keys(self):
         # keys() hides xml attributes and returns only children by typename
         element1 = TestElement('test_name', some_attribite='some_value')
@@ -143,12 +175,23 @@ class EtreeImplTestCase(unittest.TestCase):
         self.assertEqual(element1.keys(), [element2])
 
     def test_tojson(self):
+        import json
         element1 = TestElement('test_name', some_attribite='some_value')
         element2 = TestElement()
         element1.append(element2)
-        print "This case should not pass. FIXME"
-
-        # self.assertIsNotNone(element1.tojson(indent=0))
+        self.assertEqual(element1.tojson(), 
+            '["testelement",{"name":"test_name","some_attribite":"some_value"},null,[["testelement",{},null,[]]]]')
+        self.assertEqual(json.loads(element1.tojson(indent=0)), json.loads(element1.tojson()))
+
+    def test_tojson_payload(self):
+        import json
+        from array import array
+        element1 = TestElement('test_name')
+        element1.append(et.Element(text=array('d', [0.1, 1e-20])))
+        element1.append(et.Element(text='some text'))
+        document = json.loads(et.tojson(element1, indent=2))
+        self.assertEqual(document[3][0][2], [0.1, 1e-20])
+        self.assertEqual(document[3][1][2], 'some text')
 
     def test_toxml(self):
         # note the bug (extra spaces and new line with pretty_print=False)
@@ -165,17 +208,269 @@ class EtreeImplTestCase(unittest.TestCase):
         self.assertEqual(xml.getvalue(), test_xml)
         print "This case should not pass. FIXME"
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    def test_write_matches_tostring(self):
+        from StringIO import StringIO
+        element1 = TestElement('test_name', some_attribite='some_value')
+        for index in range(100):
+            element1.append(TestElement(str(index)).append(et.Element(text=range(6))))
+        for pretty_print in (True, False):
+            fileio = et.write(element1, StringIO(), pretty_print, buffer_size=64)
+            self.assertEqual(fileio.getvalue(), et.tostring(element1, pretty_print))
+
+    def test_write_to_file_descriptor(self):
+        import os
+        element1 = TestElement('test_name', some_attribite='some_value')
+        element1.append(et.Element())
+        read, write = os.pipe()
+        et.write(element1, write, pretty_print=False)
+        os.close(write)
+        self.assertEqual(os.read(read, 1024), et.tostring(element1, pretty_print=False))
+        os.close(read)
+
+    def test_toxml_deep_tree(self):
+        element1 = parent = TestElement()
+        for level in range(sys.getrecursionlimit() * 2):
+            child = TestElement()
+            parent.append(child)
+            parent = child
+        xml = et.tostring(element1, pretty_print=False)
+        self.assertEqual(xml.count('<testelement/>'), 1)
+
+    def test_toxml_templates_per_class(self):
+        element1 = TestElement('100%', some_attribite=(1, 2))
+        element2 = et.Element('100%', some_attribite=(1, 2))
+        self.assertEqual(et.tostring(element1, pretty_print=False), 
+            ' <testelement name="100%" some_attribite="(1, 2)"/>')
+        self.assertEqual(et.tostring(element2, pretty_print=False), 
+            ' <element name="100%" some_attribite="(1, 2)"/>')
+        self.assertIsNot(TestElement._xml_layouts, et.Element._xml_layouts)
+
+    def test_set_precision(self):
+        try:
+            et.set_precision(4)
+            self.assertEqual(et.format_number(1/3.0), '0.3333')
+            self.assertEqual(et.format_numbers([1/3.0, 2, 'a', 0.5]), '0.3333 2 a 0.5')
+            et.set_precision(4, trim_zeros=False)
+            self.assertEqual(et.format_numbers([0.5, 2]), '0.5000 2')
+        finally:
+            et.set_precision()
+        self.assertEqual(et.format_number(1/3.0), str(1/3.0))
+
+    def test_iterxml_parallel(self):
+        import os
+        if not hasattr(os, 'fork'):
+            self.skipTest("Parallel rendering requires fork().")
+        element1 = et.Element('root')
+        for index in range(4):
+            element2 = et.Element('group%i' % index)
+            element2.append(TestElement(str(index), text=range(index)).append(et.Element()))
+            element2.append(TestElement().append(TestElement(str(index))))
+            element1.append(element2)
+        for pretty_print in (True, False):
+            parallel = et.iterxml_parallel(element1, pretty_print, processes=2, tags=('testelement',))
+            self.assertEqual(''.join(parallel), et.tostring(element1, pretty_print))
+
+    def test_digest(self):
+        element1 = TestElement('test_name', first='1', second='2')
+        element2 = TestElement('test_name', second='2')
+        element2.set('first', '1')
+        self.assertEqual(element1.digest, element2.digest)
+        element1.append(TestElement('child', text=range(4)))
+        self.assertNotEqual(element1.digest, element2.digest)
+        element2.append(TestElement('child', text=range(4)))
+        self.assertEqual(element1.digest, element2.digest)
+
+    def test_digest_invalidation(self):
+        root = TestElement('root')
+        for index in range(3):
+            root.append(TestElement(str(index)).append(TestElement('leaf', value=index)))
+        digest = root.digest
+        leaf = root.keys()[1].keys()[0]
+        leaf.set('value', 10)
+        self.assertIsNone(root._digest)
+        self.assertIsNotNone(root.keys()[0]._digest)
+        self.assertNotEqual(root.digest, digest)
+        leaf.set('value', 1)
+        self.assertEqual(root.digest, digest)
+        root.remove(root.keys()[2])
+        self.assertNotEqual(root.digest, digest)
+
+    def test_deferred(self):
+        calls = []
+        def factory():
+            calls.append(1)
+            return TestElement('stale', kind='mesh').append(
+                TestElement('child', text=range(4)))
+
+        expected = TestElement('root').append(TestElement('part', kind='mesh').append(
+            TestElement('child', text=range(4))))
+        root = TestElement('root').append(et.deferred(TestElement, factory, 'part'))
+        self.assertEqual(root._named('part')[0].tag, 'testelement')
+        self.assertEqual(calls, [])
+        for pretty_print in (True, False):
+            self.assertEqual(et.tostring(root, pretty_print), et.tostring(expected, pretty_print))
+        self.assertEqual(calls, [1])
+        self.assertEqual(root, expected)
+
+    def test_deferred_release(self):
+        calls = []
+        def factory():
+            calls.append(1)
+            return TestElement().append(TestElement('child', text=range(4)))
+
+        root = TestElement('root').append(
+            et.deferred(TestElement, factory, 'part', release=True))
+        stub = root.keys()[0]
+        document = et.tostring(root)
+        self.assertEqual(calls, [1])
+        self.assertTrue(stub._pending)
+        self.assertEqual(et.tostring(root), document)
+        self.assertEqual(et.tojson(root), et.tojson(root))
+        self.assertEqual(len(calls), 4)
+        self.assertTrue(stub._pending)
+        self.assertEqual(stub.keys()[0].get('name'), 'child')
+        self.assertFalse(stub._pending)
+
+    def test_freeze(self):
+        element = TestElement('parent').append(TestElement('child', value=1))
+        shared  = et.freeze(element)
+        self.assertEqual(shared, element)
+        self.assertIs(et.freeze(shared), shared)
+        self.assertRaises(Exception, shared.set, 'value', 2)
+        self.assertRaises(Exception, shared.keys()[0].set, 'value', 2)
+        self.assertRaises(Exception, shared.append, TestElement())
+        element.keys()[0].set('value', 2)
+        self.assertEqual(shared.keys()[0].get('value'), 1)
+
+        first  = TestElement('first').append(shared)
+        second = TestElement('second').append(shared)
+        self.assertIs(first._named('parent')[0], second._named('parent')[0])
+        digest = second.digest
+        private = first.unshare(shared)
+        self.assertIsNot(private, shared)
+        self.assertIs(type(private), TestElement)
+        self.assertIs(first._named('parent')[0], private)
+        self.assertIs(private.keys()[0], shared.keys()[0])
+        private.unshare(private.keys()[0]).set('value', 3)
+        self.assertEqual(shared.keys()[0].get('value'), 1)
+        self.assertEqual(second.digest, digest)
+        self.assertIn('value="3"', et.tostring(first, False))
+        self.assertIn('value="1"', et.tostring(second, False))
+        self.assertIs(first.unshare(private), private)
+
+    def test_shared_children_bookkeeping(self):
+        shared = et.freeze(TestElement('shared').append(TestElement('child')))
+        self.assertIsNone(shared.keys()[0]._parent)
+        first  = TestElement('first').append(TestElement('sibling')).append(shared)
+        second = TestElement('second').extend([shared, TestElement('sibling')])
+        self.assertIsNone(shared._parent)
+        self.assertEqual(shared._pos, 0)
+        self.assertIs(second.keys()[1]._parent, second)
+        self.assertIs(first.remove(shared), shared)
+        self.assertEqual([child.get('name') for child in first], ['sibling'])
+        self.assertEqual([child.get('name') for child in second], ['shared', 'sibling'])
+        second.remove(second.keys()[1])
+        self.assertIs(second._named('shared')[0], shared)
+
+    def test_clone(self):
+        shared  = et.freeze(TestElement('shared', ref='other'))
+        element = TestElement('parent').extend([
+            TestElement('child', ref='parent', value=[1, 2]), shared])
+        TestElement('root').append(element)
+        copy = element.clone()
+        self.assertEqual(copy, element)
+        self.assertIsNone(copy._parent)
+        self.assertIs(copy._named('shared')[0], shared)
+        copy._named('child')[0].set('value', 3)
+        self.assertEqual(element._named('child')[0].get('value'), [1, 2])
+
+        copy = element.clone('copy', {'other': 'another'})
+        self.assertEqual(copy.get('name'), 'copy')
+        self.assertEqual(copy._named('child')[0].get('ref'), 'copy')
+        self.assertEqual(copy._named('shared')[0].get('ref'), 'another')
+        self.assertIsNot(copy._named('shared')[0], shared)
+        self.assertEqual(shared.get('ref'), 'other')
+        self.assertEqual(element._named('child')[0].get('ref'), 'parent')
+        self.assertEqual(element.clone('copy').keys()[0].get('ref'), 'parent')
+
+    def test_deepcopy(self):
+        import copy
+        element = TestElement('parent').append(TestElement('child', value=[1, 2]))
+        root    = TestElement('root').append(element)
+        duplicate = copy.deepcopy(element)
+        self.assertEqual(duplicate, element)
+        self.assertIsNone(duplicate._parent)
+        self.assertIs(duplicate._named('child')[0]._parent, duplicate)
+        self.assertEqual(copy.deepcopy([element])[0], element)
+        self.assertEqual(len(root), 1)
+
+    def test_copies_of_deferred(self):
+        import copy
+        calls = []
+        def factory():
+            calls.append(1)
+            return TestElement(model='mesh').append(TestElement('child'))
+        stub = et.deferred(TestElement, factory, 'stub', release=True)
+        root = TestElement('root').append(stub)
+        document = et.tostring(root)
+        for duplicate in (root.clone(), copy.deepcopy(root)):
+            self.assertIs(type(duplicate.keys()[0]), TestElement)
+            self.assertEqual(et.tostring(duplicate), document)
+        self.assertIn('model="mesh"', document)
+        frozen = et.freeze(root)
+        self.assertIs(type(frozen.keys()[0]).__bases__[0], TestElement)
+        self.assertEqual(et.tostring(frozen), document)
+
+    def test_rename_child_of_two_parents(self):
+        child  = TestElement('child')
+        first  = TestElement('first').append(child)
+        second = TestElement('second').extend([TestElement('other'), child])
+        child.set('name', 'renamed')
+        for parent in (first, second):
+            self.assertEqual(parent._named('child'), [])
+            self.assertEqual(parent._named('renamed'), [child])
+        self.assertEqual(second._named('other')[0].get('name'), 'other')
+        self.assertEqual(first._named(False), [])
+
+    def test_digest_of_child_of_two_parents(self):
+        child  = TestElement('child')
+        first  = TestElement('first').append(child)
+        root   = TestElement('root').append(first)
+        digest = root.digest, first.digest
+        second = TestElement('second').append(child)
+        self.assertEqual((root.digest, first.digest), digest)
+        # Changes reach digests of both parents and their ancestors.
+        child.set('value', 1)
+        self.assertNotEqual(first.digest, digest[1])
+        self.assertNotEqual(root.digest, digest[0])
+        self.assertEqual(first.digest, TestElement('first').append(
+            TestElement('child', value=1)).digest)
+        self.assertEqual(second.digest, TestElement('second').append(
+            TestElement('child', value=1)).digest)
+        child.set('value', 2)
+        self.assertEqual(first.digest, TestElement('first').append(
+            TestElement('child', value=2)).digest)
+
+    def test_dirty_tracker(self):
+        leaf   = TestElement('leaf')
+        branch = TestElement('branch').append(leaf)
+        other  = TestElement('other').append(TestElement('unchanged'))
+        root   = TestElement('root').extend([branch, other])
+        tracker = et.DirtyTracker()
+        leaf.set('value', 1)
+        self.assertEqual(tracker.changed, [])
+
+        with tracker:
+            leaf.set('value', 2)
+            other.remove(other.keys()[0])
+            branch.append(TestElement('new'))
+        leaf.set('value', 3)
+        self.assertTrue(tracker.is_dirty(root))
+        self.assertTrue(tracker.is_dirty(branch))
+        self.assertFalse(tracker.is_changed(root))
+        self.assertEqual(list(tracker.walk(root)), [branch, leaf, other])
+        self.assertEqual(list(tracker.walk(leaf)), [leaf])
+        self.assertEqual(sorted([node.get('name') for node in tracker.checkpoint()]),
+            ['branch', 'leaf', 'other'])
+        self.assertEqual(list(tracker.walk(root)), [])
+        self.assertFalse(tracker.is_dirty(root))
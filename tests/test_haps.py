@@ -73,6 +73,24 @@ class HapsObjTestCase(unittest.TestCase):
         self.assertEqual(obj1.get_by_name('test_object3'), obj3)
         self.assertNotEqual(obj1.get_by_name('test_object2'), obj1.get_by_name('test_object3'))
 
+    def test_get_by_name_after_remove(self):
+        obj1 = TestObject1('test_object1')
+        obj2 = TestObject1('test_object2')
+        obj3 = TestObject2('test_object2') # same name, different type
+        obj1.add([obj2, obj3])
+        obj1.remove(obj2)
+        self.assertEqual(obj1.get_by_name('test_object2'), obj3)
+        obj1.remove(obj3)
+        self.assertIsNone(obj1.get_by_name('test_object2'))
+
+    def test_get_by_name_after_rename(self):
+        obj1 = TestObject1('test_object1')
+        obj2 = TestObject1('test_object2')
+        obj1.add(obj2)
+        obj2.set('name', 'renamed_object2')
+        self.assertIsNone(obj1.get_by_name('test_object2'))
+        self.assertEqual(obj1.get_by_name('renamed_object2'), obj2)
+
     def test_get_by_name_and_type(self):
         obj1 = TestObject1('test_object1')
         obj2 = TestObject1('test_object2')
@@ -107,3 +125,48 @@ class HapsObjTestCase(unittest.TestCase):
 
 
 
+
+    def test_pickle(self):
+        import pickle
+        import haps
+        from haps.tags import Project, Scene, Assembly, Light, Matrix
+        parms = [('intensity', 1.0), ('exposure', 0.0)]
+        lazy  = haps.deferred(Assembly, lambda: Assembly().add(Light('lamp')), 'lazy')
+        project = Project().add(Scene().add([
+            Assembly('assembly').add([Light('light1').add_parms(parms, shared=True),
+                Light('light2').add_parms(parms, shared=True), Matrix()]),
+            lazy]))
+        for protocol in (0, 2):
+            loaded = pickle.loads(pickle.dumps(project, protocol))
+            self.assertEqual(loaded, project)
+            self.assertEqual(loaded.tostring(), project.tostring())
+            light1, light2 = loaded.find('scene').find('assembly').findall('light')
+            self.assertTrue(light1._named('exposure')[0]._shared)
+            self.assertIs(light1._named('exposure')[0], light2._named('exposure')[0])
+            self.assertIs(type(loaded.find('scene').get_by_name('lazy')), Assembly)
+            self.assertIs(light1._parent, loaded.find('scene').find('assembly'))
+        # Subtrees are pickled without their ancestors.
+        self.assertIsNone(pickle.loads(pickle.dumps(light1, 2))._parent)
+
+    def test_reset(self):
+        import haps
+        from haps.tags import Light
+        haps.set_precision(3)
+        haps.set_sparse()
+        Light('light').add_parms([('intensity', 1.0)], shared=True)
+        haps.reset()
+        self.assertEqual(haps.format_number(1/3.0), '0.333333333333')
+        self.assertIsNone(haps.etree_impl._sparse)
+        self.assertEqual(haps.haps._shared_parms, {})
+
+    def test_shared_parms_limit(self):
+        import haps
+        from haps.tags import Light
+        haps.reset()
+        lights = [Light('light').add_parms([('intensity', value + 1.0)], shared=True)
+            for value in range(haps.haps.SHARED_PARMS_LIMIT + 10)]
+        self.assertEqual(len(haps.haps._shared_parms), 10)
+        self.assertEqual(lights[0].get_by_name('intensity').get('value'), 1.0)
+        self.assertIs(Light('light').add_parms([('intensity', 1034.0)], shared=True)
+            .get_by_name('intensity'), lights[-1].get_by_name('intensity'))
+        haps.reset()
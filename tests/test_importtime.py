@@ -0,0 +1,31 @@
+import unittest
+import sys, os
+sys.path.append('soho')
+import importtime
+
+
+def listing():
+    return sorted([os.path.join(path, name) for path, _, names in
+        os.walk(os.path.join(importtime.ROOT, 'soho')) for name in names])
+
+
+class ImportTimeTestCase(unittest.TestCase):
+    def test_measure(self):
+        files   = listing()
+        result  = importtime.measure(repeat=1)
+        # Bytecode is written into a copy of the tree.
+        self.assertEqual(listing(), files)
+        modules = [record['module'] for record in result['imports']]
+        for module in importtime.MODULES:
+            self.assertIn(module, modules)
+        for record in result['imports']:
+            self.assertGreaterEqual(record['cumulative'], record['self'])
+        self.assertGreater(result['total'], 0)
+        # Imported on first use only
+        for module in ('json', 'inspect', 'xml.sax.saxutils', 'xml.etree.cElementTree',
+            'haps.loader', 'haps.delta', 'haps.query', 'haps.binary', 'haps.packed'):
+            self.assertNotIn(module, modules)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import sys, os, tempfile
+sys.path.append('soho')
+import haps
+from haps.tags import *
+from fixtures import build_project
+
+
+class LoaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.project = build_project(filename='a&amp;b.binarymesh')
+        handle, self.filename = tempfile.mkstemp(suffix='.appleseed')
+        with os.fdopen(handle, 'w') as fileio:
+            self.project.toxml(fileio)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_load_roundtrip(self):
+        project = haps.load(self.filename)
+        self.assertIsInstance(project, Project)
+        self.assertIsInstance(project.find('scene').find('assembly'), Assembly)
+        self.assertEqual(str(project), str(self.project))
+
+    def test_load_numeric_text(self):
+        project = haps.load(self.filename)
+        matrix = project.find('scene').find('assembly_instance').find('transform').find('matrix')
+        self.assertEqual(matrix.text, Matrix.identity)
+        self.assertEqual(project.find('search_paths').find('search_path').text, '/tmp')
+
+    def test_fromstring_unknown_tag(self):
+        obj = haps.fromstring('<project><foo_bar name="x"/></project>').find('foo_bar')
+        self.assertEqual(type(obj).__name__, 'Foo_Bar')
+        self.assertEqual(obj.get('name'), 'x')
+
+    def test_load_skip(self):
+        project = haps.load(self.filename, skip=['assembly'])
+        self.assertIsNone(project.find('scene').find('assembly'))
+        self.assertIsNotNone(project.find('scene').find('assembly_instance'))
+
+    def test_load_lazy(self):
+        project = haps.load(self.filename, lazy=['assembly'])
+        assembly = project.find('scene').find('assembly')
+        self.assertIsNotNone(assembly._source)
+        self.assertEqual(assembly.get_by_name('color').find('values').text, [0.5, 0.25, 1e-7])
+        self.assertIsNone(assembly._source)
+        self.assertEqual(str(project), str(self.project))
+
+    def test_json_roundtrip(self):
+        project = haps.fromjson(self.project.tojson())
+        self.assertEqual(project, self.project)
+        self.assertIsInstance(project.find('scene').find('assembly'), Assembly)
+        self.assertEqual(str(project), str(self.project))
+
+    def test_load_json(self):
+        with open(self.filename, 'w') as fileio:
+            haps.write_json(self.project, fileio, indent=2)
+        self.assertEqual(haps.load_json(self.filename), self.project)
+
+
+if __name__ == "__main__":
+    unittest.main()
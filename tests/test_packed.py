@@ -0,0 +1,114 @@
+import unittest
+import sys, os, shutil, tempfile, zipfile
+from StringIO import StringIO
+sys.path.append('soho')
+import haps
+from haps.tags import *
+
+
+class PackedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.mesh      = self.create('box.binarymesh', 'mesh' * 1000)
+        self.texture   = self.create('wood.png', 'texture')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create(self, name, data):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'wb') as fileio:
+            fileio.write(data)
+        return filename
+
+    def build_project(self):
+        assembly = Assembly('assembly').add([
+            Object('box', model='mesh_object').add_parms([('filename', self.mesh)]),
+            Texture('wood', model='disk_texture_2d').add_parms([('filename', self.texture)]),
+            Object('missing', model='mesh_object').add_parms([('filename', 'missing.obj')]),
+            ])
+        return Project().add(Scene().add(assembly))
+
+    def test_write_project(self):
+        project  = self.build_project()
+        original = project.tostring()
+        fileio   = StringIO()
+        with haps.PackedProject(fileio) as packed:
+            packed.write_project(project, preamble='<!-- preamble -->')
+
+        archive = zipfile.ZipFile(StringIO(fileio.getvalue()))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.namelist(), ['project.appleseed',
+            'geometry/box.binarymesh', 'textures/wood.png'])
+        self.assertEqual(archive.read('geometry/box.binarymesh'), 'mesh' * 1000)
+        document = archive.read('project.appleseed')
+        self.assertTrue(document.startswith('<!-- preamble -->\n<project'))
+        self.assertEqual(document.split('\n', 1)[1], original
+            .replace(self.mesh, 'geometry/box.binarymesh')
+            .replace(self.texture, 'textures/wood.png'))
+        # Project itself is left unchanged.
+        self.assertEqual(project.tostring(), original)
+        filenames = [parm.get('value') for parm in project.find('scene').find('assembly')
+            .findall('object') + project.find('scene').find('assembly').findall('texture')
+            for parm in parm.findall('parameter')]
+        self.assertEqual(filenames, [self.mesh, 'missing.obj', self.texture])
+
+    def test_shared_references_restored(self):
+        parms   = [('filename', self.mesh)]
+        project = Project().add(Scene().add(Assembly('assembly').add([
+            Object('box', model='mesh_object').add_parms(parms, shared=True),
+            Object('copy', model='mesh_object').add_parms(parms, shared=True)])))
+        shared  = project.find('scene').find('assembly').find('object')._named('filename')[0]
+        fileio  = StringIO()
+        with haps.PackedProject(fileio) as packed:
+            packed.write_project(project)
+
+        document = zipfile.ZipFile(StringIO(fileio.getvalue())).read('project.appleseed')
+        self.assertEqual(document.count('value="geometry/box.binarymesh"'), 2)
+        for obj in project.find('scene').find('assembly'):
+            self.assertIs(obj._named('filename')[0], shared)
+        self.assertEqual(shared.get('value'), self.mesh)
+
+    def test_compression_levels(self):
+        fileio = StringIO()
+        with haps.PackedProject(fileio, level=0) as packed:
+            self.assertEqual(packed.add_file(self.mesh, level=9), 'files/box.binarymesh')
+            self.assertEqual(packed.add_file(self.mesh), 'files/box.binarymesh')
+            self.assertEqual(packed.add_file(self.texture), 'files/wood.png')
+            packed.write_project(self.build_project())
+
+        archive = zipfile.ZipFile(StringIO(fileio.getvalue()))
+        self.assertEqual(archive.getinfo('files/box.binarymesh').compress_type, zipfile.ZIP_DEFLATED)
+        self.assertEqual(archive.getinfo('files/wood.png').compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(archive.namelist(), ['files/box.binarymesh', 'files/wood.png',
+            'project.appleseed'])
+        self.assertIn('value="files/box.binarymesh"', archive.read('project.appleseed'))
+
+    def test_deferred_references(self):
+        mesh = self.mesh
+        def factory():
+            return Assembly().add(Object('box', model='mesh_object').add_parms(
+                [('filename', mesh)]))
+
+        project = Project().add(Scene().add(
+            haps.deferred(Assembly, factory, 'assembly', release=True)))
+        fileio  = StringIO()
+        with haps.PackedProject(fileio) as packed:
+            packed.write_project(project, processes=2)
+
+        archive = zipfile.ZipFile(StringIO(fileio.getvalue()))
+        self.assertEqual(archive.namelist(), ['project.appleseed', 'geometry/box.binarymesh'])
+        self.assertIn('value="geometry/box.binarymesh"', archive.read('project.appleseed'))
+
+    def test_file_descriptor(self):
+        handle, filename = tempfile.mkstemp(suffix='.appleseedz', dir=self.directory)
+        with haps.PackedProject(handle, level=1) as packed:
+            with packed.entry('notes.txt') as entry:
+                entry.write(u'notes')
+            self.assertRaises(Exception, packed.entry, 'notes.txt')
+        os.close(handle)
+        self.assertEqual(zipfile.ZipFile(filename).read('notes.txt'), 'notes')
+
+
+if __name__ == '__main__':
+    unittest.main()
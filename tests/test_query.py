@@ -0,0 +1,72 @@
+import unittest
+import sys
+sys.path.append('soho')
+import haps
+from haps.tags import *
+import APSobj
+from fixtures import build_project
+
+
+def names(elements):
+    return [element.get('name') for element in elements]
+
+
+class QueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.project = build_project()
+        self.index   = haps.TreeIndex(self.project)
+
+    def test_select(self):
+        select = self.index.select
+        self.assertEqual(names(select('//light')), ['light1', 'light2'])
+        self.assertEqual(names(select('scene/light')), ['light2'])
+        self.assertEqual(names(select('scene/*[@name=box*]')), [])
+        self.assertEqual(names(select('//*[@name=box*]')), ['box', 'box_inst1', 'box_inst2'])
+        self.assertEqual(names(select('//object_instance[assign_material/@material=red]')),
+            ['box_inst1'])
+        self.assertEqual(names(select('//object_instance[@name!=*1]')), ['box_inst2'])
+        self.assertEqual(len(select('//parameter[@name=importance_multiplier]')), 2)
+        self.assertEqual(names(select('//light[parameter/@value=2]')), ['light2'])
+        self.assertEqual(names(select('//assembly//material[@name="red"]')), ['red'])
+        self.assertEqual(names(select('.//color[alpha]')), ['color', 'red_color', 'blue_color'])
+        self.assertEqual(names(haps.select(self.project, '//bsdf',
+            where=lambda bsdf: 'blue' in bsdf.get('name'))), ['blue_bsdf'])
+        for selector in ('', '//', 'scene/', 'scene[', '//light[@name=a b]x]'):
+            self.assertRaises(Exception, select, selector)
+
+    def test_stale_index(self):
+        self.assertEqual(len(self.index.select('//light')), 2)
+        assembly = self.index.select('//assembly')[0]
+        assembly.remove(assembly.get_by_name('light1'))
+        self.assertEqual(names(self.index.select('//light')), ['light2'])
+        self.project.find('scene').get_by_name('light2').set('name', 'sun')
+        self.assertEqual(names(self.index.select('//*[@name=sun]')), ['sun'])
+
+    def test_set(self):
+        other = APSobj.DefaultLambertMaterial('green')[0]
+        count = self.index.set('//color/parameter[@name=multiplier]', 'value', 2.0)
+        self.assertEqual(count, 2)
+        self.assertEqual([parm.get('value') for parm in
+            self.index.select('//color/parameter[@name=multiplier]')], [2.0, 2.0])
+        self.assertEqual(other.get_by_name('multiplier').get('value'), 1.0)
+        self.assertIn('name="multiplier" value="2.0"', self.project.tostring())
+
+        self.assertEqual(self.index.set('//light[@name=light1]', 'name', 'sun'), 1)
+        self.assertEqual(names(self.index.select('//light[@name=sun]')), ['sun'])
+        self.assertIsNotNone(self.index.select('//assembly')[0].get_by_name('sun'))
+
+    def test_deferred_isnt_produced(self):
+        produced = []
+        def factory():
+            produced.append(True)
+            return Assembly().add(Light('lamp'))
+        self.project.find('scene').add(haps.deferred(Assembly, factory, 'lazy'))
+        self.assertEqual(names(self.index.select('scene/assembly')), ['assembly', 'lazy'])
+        self.assertEqual(names(self.index.select('scene/assembly[light]')), ['assembly'])
+        self.assertFalse(produced)
+        self.project.tostring()
+        self.assertEqual(names(self.index.select('scene/assembly/light')), ['light1', 'lamp'])
+
+
+if __name__ == '__main__':
+    unittest.main()
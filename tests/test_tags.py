@@ -66,3 +66,23 @@ class HapsTagsTestCase(unittest.TestCase):
 
 
 
+
+    def test_Matrix_numeric_payload(self):
+        from array import array
+        mat = Matrix([float(v) for v in range(16)])
+        self.assertTrue(isinstance(mat.text, array))
+        self.assertEqual(mat.text, range(16))
+
+    def test_Matrix_toxml(self):
+        mat = Matrix([v / 4.0 for v in range(16)])
+        self.assertEqual(str(Transform().add(mat)).split('\n')[2:6], [
+            '        0 0.25 0.5 0.75',
+            '        1 1.25 1.5 1.75',
+            '        2 2.25 2.5 2.75',
+            '        3 3.25 3.5 3.75'])
+
+    def test_Search_Path_toxml(self):
+        path = Search_Path('/tmp')
+        self.assertEqual(path.text, '/tmp')
+        self.assertEqual(Search_Paths().add(path).tostring(pretty_print=False), 
+            ' <search_paths> <search_path > /tmp </search_path> </search_paths>')